@@ -34,6 +34,20 @@ const Dashboard: React.FC = () => {
     setFlaskServerUrl(baseUrl);
   }, []);
 
+  // Normalise a stats object from the Flask backend
+  const applyVideoStats = (stats: any) => {
+    if (!stats || typeof stats !== 'object') {
+      return;
+    }
+    setVideoStats({
+      people_count: stats.people_count || 0,
+      avg_dwell_time: stats.avg_dwell_time || 0,
+      highest_dwell_time: stats.highest_dwell_time || 0,
+      location: stats.location || 'Unknown Location',
+      timestamp: stats.timestamp || new Date().toISOString()
+    });
+  };
+
   // Fetch video stats from Flask backend
   const fetchVideoStats = async () => {
     try {
@@ -54,30 +68,49 @@ const Dashboard: React.FC = () => {
       
       // Ensure we have a valid stats object with required fields
       if (data && typeof data === 'object' && data.stats) {
-        const validatedStats: VideoStats = {
-          people_count: data.stats.people_count || 0,
-          avg_dwell_time: data.stats.avg_dwell_time || 0,
-          highest_dwell_time: data.stats.highest_dwell_time || 0,
-          location: data.stats.location || 'Unknown Location',
-          timestamp: data.stats.timestamp || new Date().toISOString()
-        };
-        
-        setVideoStats(validatedStats);
+        applyVideoStats(data.stats);
       }
     } catch (err) {
       console.error('Error fetching video analysis stats:', err);
     }
   };
 
-  // Fetch video stats on component mount and every 5 seconds
+  // Subscribe to pushed stats; fall back to polling every 5 seconds if the stream is unavailable
   useEffect(() => {
-    fetchVideoStats();
-    
-    const interval = setInterval(() => {
-      fetchVideoStats();
-    }, 5000);
-    
-    return () => clearInterval(interval);
+    let interval: ReturnType<typeof setInterval> | null = null;
+    const startPolling = () => {
+      if (interval === null) {
+        fetchVideoStats();
+        interval = setInterval(fetchVideoStats, 5000);
+      }
+    };
+
+    if (typeof EventSource === 'undefined') {
+      startPolling();
+      return () => {
+        if (interval !== null) clearInterval(interval);
+      };
+    }
+
+    const source = new EventSource(`${flaskServerUrl}/api/stats/stream`);
+    source.addEventListener('stats', (event) => {
+      try {
+        applyVideoStats(JSON.parse((event as MessageEvent).data));
+      } catch (err) {
+        console.error('Error parsing pushed video stats:', err);
+      }
+    });
+    source.onerror = () => {
+      // EventSource retries on its own; only a closed stream needs the polling fallback
+      if (source.readyState === EventSource.CLOSED) {
+        startPolling();
+      }
+    };
+
+    return () => {
+      source.close();
+      if (interval !== null) clearInterval(interval);
+    };
   }, [flaskServerUrl]);
 
   if (isDashboardLoading || !videoStats) {
@@ -0,0 +1,103 @@
+import math
+import threading
+import time
+
+
+class AdaptiveStrideController:
+    """Chooses how many decoded frames to skip between detections.
+
+    Inference time, encode time and capture-to-result latency are smoothed
+    with an EWMA. Once per ``adjust_interval`` the stride is raised when the
+    detector would exceed its CPU budget or the end-to-end latency target,
+    and lowered again when there is headroom. If the stride is already at
+    ``max_stride``, the controller steps down through ``imgsz_steps`` before
+    giving up more frames, and restores the resolution first on recovery.
+    """
+
+    def __init__(self, target_latency=0.5, cpu_budget=0.8, max_stride=30,
+                 imgsz_steps=(640,), smoothing=0.2, adjust_interval=1.0):
+        self.target_latency = target_latency
+        self.cpu_budget = cpu_budget
+        self.max_stride = max(1, max_stride)
+        self.imgsz_steps = tuple(sorted(imgsz_steps, reverse=True))
+        self.smoothing = smoothing
+        self.adjust_interval = adjust_interval
+        self._lock = threading.Lock()
+        self.reset(30)
+
+    def reset(self, source_fps, initial_stride=1):
+        with self._lock:
+            self.source_fps = source_fps or 30
+            self.stride = min(self.max_stride, max(1, initial_stride))
+            self._imgsz_index = 0
+            self.inference_time = None
+            self.encode_time = None
+            self.latency = None
+            self.detection_rate = 0.0
+            self._last_adjust = time.time()
+            self._window_start = time.time()
+            self._window_detections = 0
+
+    @property
+    def imgsz(self):
+        return self.imgsz_steps[self._imgsz_index]
+
+    def _smooth(self, current, sample):
+        if current is None:
+            return sample
+        return current + self.smoothing * (sample - current)
+
+    def observe_encode(self, encode_time):
+        with self._lock:
+            self.encode_time = self._smooth(self.encode_time, encode_time)
+
+    def observe_detection(self, inference_time, latency):
+        """Record one finished detection and adjust the stride if it is time to"""
+        with self._lock:
+            self.inference_time = self._smooth(self.inference_time, inference_time)
+            self.latency = self._smooth(self.latency, latency)
+
+            now = time.time()
+            self._window_detections += 1
+            span = now - self._window_start
+            if span >= self.adjust_interval:
+                self.detection_rate = self._window_detections / span
+                self._window_start = now
+                self._window_detections = 0
+
+            if now - self._last_adjust >= self.adjust_interval:
+                self._last_adjust = now
+                self._adjust()
+
+    def _budget_stride(self):
+        # Smallest stride at which detection fits in what the encoder leaves of the CPU budget
+        encode_share = self.source_fps * (self.encode_time or 0)
+        available = max(0.1, self.cpu_budget - encode_share)
+        return max(1, math.ceil(self.source_fps * self.inference_time / available))
+
+    def _adjust(self):
+        budget_stride = self._budget_stride()
+        overloaded = self.latency > self.target_latency or budget_stride > self.stride
+
+        if overloaded:
+            if self.stride < self.max_stride:
+                self.stride = min(self.max_stride, max(self.stride + 1, budget_stride))
+            elif self._imgsz_index < len(self.imgsz_steps) - 1:
+                self._imgsz_index += 1
+        elif self.latency < 0.5 * self.target_latency and budget_stride < self.stride:
+            if self._imgsz_index > 0:
+                self._imgsz_index -= 1
+            else:
+                self.stride -= 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "stride": self.stride,
+                "imgsz": self.imgsz,
+                "detection_rate": round(self.detection_rate, 2),
+                "target_latency_ms": round(self.target_latency * 1000, 1),
+                "latency_ms": round(self.latency * 1000, 1) if self.latency is not None else None,
+                "inference_ms": round(self.inference_time * 1000, 1) if self.inference_time is not None else None,
+                "encode_ms": round(self.encode_time * 1000, 1) if self.encode_time is not None else None
+            }
@@ -0,0 +1,186 @@
+import logging
+import threading
+import time
+from datetime import datetime
+
+from traffic_analysis import TrafficAnalyzer
+from stats_stream import StatsFeed
+from stream_socket import MetadataFeed
+from video_pipeline import FramePipeline, stream_variant
+
+logger = logging.getLogger(__name__)
+
+
+class AnalysisSession:
+    """One background analysis run per video source, shared by every viewer.
+
+    The session owns the detector, the tracker/dwell state and the stats
+    exporter for its source. Viewers only subscribe to the encoded frames,
+    so opening more tabs costs one JPEG hand-off each, not another detector.
+    """
+
+    def __init__(self, source, detector_factory, render, exporter=None,
+                 face_recognition=None, on_stats=None, source_id=None,
+                 title=None, location=None, region_margin=0.2, controller_factory=None,
+                 motion_gate_factory=None, zones=None, lines=None, ring_factory=None,
+                 stats_interval=0.5, on_failed=None):
+        self.source = source
+        self.source_id = source_id
+        self.title = title
+        self.location = location
+        self.region_margin = region_margin
+        self.zones = zones
+        self.lines = lines
+        self.started_at = None
+        self.detector_factory = detector_factory
+        self.render = render
+        self.exporter = exporter
+        self.face_recognition = face_recognition
+        self.on_stats = on_stats
+        # Called with this session when its capture cannot be opened
+        self.on_failed = on_failed
+        self.controller_factory = controller_factory
+        self.motion_gate_factory = motion_gate_factory
+        self.ring_factory = ring_factory
+        self.detector = None
+        self.analyzer = None
+        self.pipeline = None
+        # Detection metadata for WebSocket clients that draw the overlay themselves
+        self.metadata = MetadataFeed()
+        self.stats = {
+            "people_count": 0,
+            "avg_dwell_time": 0,
+            "highest_dwell_time": 0,
+            "location": location or "",
+            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        }
+        self._lock = threading.Lock()
+        # Pushed to /api/stats/stream subscribers when the stats change
+        self.stats_feed = StatsFeed(stats_interval)
+        self.stats_feed.publish(self.stats)
+
+    def start(self):
+        self.detector = self.detector_factory()
+        motion_gate = self.motion_gate_factory() if self.motion_gate_factory else None
+        self.analyzer = TrafficAnalyzer(self.detector, region_margin=self.region_margin,
+                                        face_recognition=self.face_recognition,
+                                        motion_gate=motion_gate, zones=self.zones,
+                                        lines=self.lines)
+        controller = self.controller_factory() if self.controller_factory else None
+        self.pipeline = FramePipeline(self.source, analyze=self._analyze, render=self.render,
+                                      on_open=self._on_open, controller=controller,
+                                      ring_factory=self.ring_factory, on_error=self._on_error)
+        self.pipeline.start()
+        self.started_at = time.time()
+        logger.info(f"Analysis session started for {self.source}")
+
+    def stop(self):
+        if self.pipeline is not None:
+            self.pipeline.stop()
+        self.metadata.close()
+        self.stats_feed.close()
+        logger.info(f"Analysis session stopped for {self.source}")
+
+    def is_running(self):
+        return self.pipeline is not None and self.pipeline.is_running()
+
+    @property
+    def error(self):
+        return self.pipeline.error if self.pipeline is not None else None
+
+    def _on_error(self, error):
+        if self.on_failed:
+            self.on_failed(self)
+
+    def _on_open(self, frame_width, frame_height, fps):
+        # Tracks and dwell sessions restart whenever the capture is reopened.
+        # ByteTrack's buffer is counted in processed frames, i.e. at the detection rate.
+        self.detector.reset(max(1, round(fps / self.pipeline.frame_skip)))
+        self.analyzer.reset()
+
+    def _analyze(self, frame):
+        self.detector.imgsz = self.pipeline.controller.imgsz
+        annotations = self.analyzer.analyze(frame)
+        people_count = annotations.people_count
+        update = {
+            "people_count": people_count,
+            "avg_dwell_time": 0 if people_count == 0 else round(annotations.avg_dwell_time, 2),
+            "highest_dwell_time": round(annotations.highest_dwell_time, 2),
+            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        }
+        if annotations.zones:
+            update["zones"] = annotations.zones
+        entries = exits = None
+        if annotations.lines:
+            entries, exits = self.analyzer.line_counter.totals()
+            update.update({"lines": annotations.lines, "entries": entries, "exits": exits})
+        with self._lock:
+            self.stats.update(update)
+            snapshot = dict(self.stats)
+        self.stats_feed.publish(snapshot)
+        self.metadata.publish(annotations)
+        if self.on_stats:
+            self.on_stats(update)
+
+        # Export stats if needed, once per source rather than once per viewer
+        if self.exporter and self.exporter.should_export(annotations.timestamp):
+            self.exporter.export_stats(people_count, annotations.avg_dwell_time,
+                                       annotations.highest_dwell_time, entries, exits)
+        return annotations
+
+    def frames(self, width=None, quality=None, fps=None):
+        """Yield multipart MJPEG chunks of the newest frame for one viewer
+
+        ``width`` and ``quality`` select the encoding (viewers asking for the
+        same one share it) and ``fps`` caps how often this viewer is sent a frame.
+        """
+        broadcaster = self.pipeline.broadcaster
+        variant = stream_variant(width, quality)
+        interval = 1.0 / fps if fps else 0
+        broadcaster.add_viewer(variant)
+        seq = 0
+        next_send = 0
+        try:
+            while not broadcaster.closed:
+                if interval:
+                    delay = next_send - time.time()
+                    if delay > 0:
+                        time.sleep(delay)
+                seq, frame_bytes = broadcaster.wait_for_frame(seq, timeout=1.0, variant=variant)
+                if frame_bytes is None:
+                    continue
+                next_send = time.time() + interval
+                yield (b'--frame\r\n'
+                       b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
+        finally:
+            broadcaster.remove_viewer(variant)
+
+    def get_stats(self):
+        with self._lock:
+            return dict(self.stats)
+
+    def pipeline_stats(self):
+        return self.pipeline.stats() if self.pipeline is not None else {}
+
+    def detection_stats(self):
+        """Current detection stride, input size, achieved detection rate, motion gating and dwell tracking"""
+        if self.pipeline is None:
+            return {}
+        stats = self.pipeline.controller.stats()
+        if self.analyzer.motion_gate is not None:
+            stats["motion_gate"] = self.analyzer.motion_gate.stats()
+        stats["dwell"] = self.analyzer.dwell.stats()
+        stats["face_identities"] = self.analyzer.identities.stats()
+        return stats
+
+    def describe(self):
+        """Summary used by the /api/sources listing"""
+        return {
+            "id": self.source_id,
+            "title": self.title,
+            "location": self.location,
+            "running": self.is_running(),
+            "error": self.error,
+            "startedAt": datetime.fromtimestamp(self.started_at).strftime("%Y-%m-%d %H:%M:%S") if self.started_at else None,
+            "stats": self.get_stats()
+        }
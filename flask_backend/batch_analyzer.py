@@ -0,0 +1,231 @@
+import argparse
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import cv2
+
+from inference_scheduler import BatchInferenceScheduler, SourceDetector
+from line_counter import load_lines
+from model_registry import ModelRegistry
+from traffic_analysis import TrafficAnalyzer
+from zones import load_zones
+
+logger = logging.getLogger(__name__)
+
+
+def read_frames(path, stride=1, buffer_size=16):
+    """Yield (frame_index, fps, frame) for every ``stride``-th frame, decoded on a separate thread"""
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        raise ValueError(f"Could not open video file: {path}")
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30
+    frames = queue.Queue(maxsize=buffer_size)
+    stop = threading.Event()
+
+    def decode():
+        index = 0
+        try:
+            while not stop.is_set():
+                if index % stride:
+                    # grab() skips colour conversion and the copy for frames nobody analyses
+                    if not cap.grab():
+                        break
+                else:
+                    ret, frame = cap.read()
+                    if not ret:
+                        break
+                    frames.put((index, frame))
+                index += 1
+        finally:
+            cap.release()
+            frames.put(None)
+
+    thread = threading.Thread(target=decode, name=f"decode-{os.path.basename(path)}", daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = frames.get()
+            if item is None:
+                break
+            yield item[0], fps, item[1]
+    finally:
+        stop.set()
+        # Unblock the decoder if it is waiting on a full queue
+        while thread.is_alive():
+            try:
+                frames.get_nowait()
+            except queue.Empty:
+                thread.join(0.1)
+
+
+class IntervalAggregator:
+    """Folds per-detection results into one record per ``interval`` seconds of video"""
+
+    def __init__(self, interval, source, location=None, start_time=None):
+        self.interval = interval
+        self.source = source
+        self.location = location
+        self.start_time = start_time
+        self.records = []
+        self._bucket = None
+        self._last_entries = 0
+        self._last_exits = 0
+
+    def add(self, video_time, annotations, entries=None, exits=None):
+        bucket = int(video_time // self.interval)
+        if self._bucket is not None and bucket != self._bucket:
+            self._flush()
+        if self._bucket != bucket:
+            self._bucket = bucket
+            self._samples = 0
+            self._people_sum = 0
+            self._people_max = 0
+            self._zone_sums = {}
+        self._samples += 1
+        self._people_sum += annotations.people_count
+        self._people_max = max(self._people_max, annotations.people_count)
+        for name, zone in annotations.zones.items():
+            self._zone_sums[name] = self._zone_sums.get(name, 0) + zone["people_count"]
+        self._last = annotations
+        self._entries, self._exits = entries, exits
+
+    def _flush(self):
+        start = self._bucket * self.interval
+        last = self._last
+        record = {
+            "source": self.source,
+            "location": self.location,
+            "interval_start": start,
+            "interval_end": start + self.interval,
+            "samples": self._samples,
+            "people_count": round(self._people_sum / self._samples, 2),
+            "people_count_max": self._people_max,
+            "avg_dwell_time": 0 if last.people_count == 0 else round(last.avg_dwell_time, 2),
+            "highest_dwell_time": round(last.highest_dwell_time, 2)
+        }
+        if self.start_time is not None:
+            record["timestamp"] = (self.start_time + timedelta(seconds=start)).isoformat()
+        if self._entries is not None:
+            record["entries"] = self._entries - self._last_entries
+            record["exits"] = self._exits - self._last_exits
+            self._last_entries, self._last_exits = self._entries, self._exits
+        # Flat zone columns keep the output columnar
+        for name, zone in last.zones.items():
+            record[f"zone_{name}_people_count"] = round(self._zone_sums.get(name, 0) / self._samples, 2)
+            record[f"zone_{name}_avg_dwell_time"] = zone["avg_dwell_time"]
+            record[f"zone_{name}_highest_dwell_time"] = zone["highest_dwell_time"]
+        self.records.append(record)
+
+    def finish(self):
+        if self._bucket is not None:
+            self._flush()
+            self._bucket = None
+        return self.records
+
+
+def analyze_video(path, scheduler, interval=60, stride=1, zones=None, lines=None,
+                  region_margin=0.2, location=None, start_time=None):
+    """Run detection, tracking, region, zone and line logic over a file as fast as possible"""
+    detector = SourceDetector(scheduler)
+    analyzer = TrafficAnalyzer(detector, region_margin=region_margin, zones=zones, lines=lines,
+                               annotate=False)
+    aggregator = IntervalAggregator(interval, os.path.basename(path), location, start_time)
+    started = time.perf_counter()
+    frames = 0
+    for index, fps, frame in read_frames(path, stride):
+        if frames == 0:
+            detector.reset(max(1, round(fps / stride)))
+        # Dwell times follow the video clock, not how fast we get through it
+        video_time = index / fps
+        annotations = analyzer.analyze(frame, now=video_time)
+        entries = exits = None
+        if analyzer.line_counter is not None:
+            entries, exits = analyzer.line_counter.totals()
+        aggregator.add(video_time, annotations, entries, exits)
+        frames += 1
+
+    records = aggregator.finish()
+    elapsed = time.perf_counter() - started
+    logger.info(f"{path}: {frames} frames analysed in {elapsed:.1f}s "
+                f"({frames / elapsed if elapsed else 0:.1f} fps), {len(records)} intervals")
+    return records
+
+
+def check_output(output_path):
+    """Raise ImportError now, not after the whole run, if the output format cannot be written"""
+    extension = os.path.splitext(output_path)[1].lower()
+    if extension in (".parquet", ".csv"):
+        import pandas as pd
+        if extension == ".parquet":
+            # Needs pyarrow or fastparquet
+            pd.io.parquet.get_engine("auto")
+
+
+def write_records(records, output_path):
+    """Write interval records as Parquet, CSV or JSON depending on the file extension"""
+    extension = os.path.splitext(output_path)[1].lower()
+    if extension in (".parquet", ".csv"):
+        import pandas as pd
+        frame = pd.DataFrame(records)
+        if extension == ".parquet":
+            frame.to_parquet(output_path, index=False)
+        else:
+            frame.to_csv(output_path, index=False)
+    else:
+        with open(output_path, "w") as f:
+            json.dump(records, f, indent=2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless foot traffic analysis of recorded video")
+    parser.add_argument("videos", nargs="+", help="Video files to analyse")
+    parser.add_argument("--output", default="foot_traffic.parquet",
+                        help="Output file (.parquet, .csv or .json)")
+    parser.add_argument("--interval", type=float, default=60, help="Seconds of video per record")
+    parser.add_argument("--stride", type=int, default=1, help="Analyse every Nth frame")
+    parser.add_argument("--zones", help="JSON file with polygon zones")
+    parser.add_argument("--lines", help="JSON file with counting lines")
+    parser.add_argument("--region-margin", type=float, default=0.2)
+    parser.add_argument("--location", help="Location name stored with each record")
+    parser.add_argument("--start-time", help="Wall-clock start of the recordings (ISO 8601)")
+    parser.add_argument("--jobs", type=int, default=1,
+                        help="Videos analysed concurrently; their frames share YOLO batches")
+    parser.add_argument("--weights", default=os.environ.get("YOLO_WEIGHTS", "model.pt"))
+    parser.add_argument("--batch-size", type=int, default=8)
+    args = parser.parse_args()
+    try:
+        check_output(args.output)
+    except ImportError as e:
+        parser.error(f"Cannot write {args.output}: {e}")
+
+    logging.basicConfig(level=logging.INFO)
+    registry = ModelRegistry(weights=args.weights)
+    registry.load()
+    # Offline there is no latency target, so wait a little longer to fill batches
+    scheduler = BatchInferenceScheduler(registry, max_batch_size=args.batch_size, max_wait=0.05)
+    start_time = datetime.fromisoformat(args.start_time) if args.start_time else None
+
+    def run(path):
+        return analyze_video(path, scheduler, interval=args.interval, stride=args.stride,
+                             zones=load_zones(args.zones), lines=load_lines(args.lines),
+                             region_margin=args.region_margin, location=args.location,
+                             start_time=start_time)
+
+    records = []
+    with ThreadPoolExecutor(max_workers=max(1, args.jobs)) as executor:
+        for video_records in executor.map(run, args.videos):
+            records.extend(video_records)
+    scheduler.stop()
+
+    write_records(records, args.output)
+    print(f"Wrote {len(records)} records to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
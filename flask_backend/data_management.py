@@ -1,28 +1,615 @@
 from flask import jsonify
-from datetime import datetime
-from typing import Dict, List, Optional, Any
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Iterator, List, Optional, Any
 import firebase_admin
 from firebase_admin import credentials, firestore
+import atexit
+import collections
+import json
 import os
+import threading
+import time
+import uuid
 
-# Initialize Firebase Admin with your service account
-if not firebase_admin._apps:
-    cred = credentials.Certificate(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'serviceAccountKey.json'))
-    firebase_admin.initialize_app(cred)
+from rollups import (COMPACTION_INTERVAL, RAW_RETENTION_DAYS, RESOLUTIONS, ROLLUP_RETENTION_DAYS,
+                     BUCKET_FORMAT, RollupAggregator, bucket_start, choose_resolution, rollup_id)
 
-class DataStorage:
-    def __init__(self):
-        self.db = firestore.client()
+def _initialize_firebase():
+    """Initialize Firebase Admin with your service account"""
+    if not firebase_admin._apps:
+        cred = credentials.Certificate(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'serviceAccountKey.json'))
+        firebase_admin.initialize_app(cred)
+
+SUMMARY_RECONCILE_INTERVAL = float(os.environ.get('SUMMARY_RECONCILE_SECONDS', '300'))
+
+JOURNAL_PATH = os.environ.get(
+    'FOOT_TRAFFIC_JOURNAL',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'foot_traffic_journal.jsonl'))
+
+def _encode_record(value):
+    if isinstance(value, datetime):
+        return {'__datetime__': value.isoformat()}
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+def _decode_record(value: Dict) -> Any:
+    if '__datetime__' in value:
+        return datetime.fromisoformat(value['__datetime__'])
+    return value
+
+class WriteBehindQueue:
+    """Asynchronous, batched writer for records produced on the frame loop.
+
+    Records are queued in memory and flushed by a background thread in
+    groups of up to ``batch_size`` (or every ``flush_interval`` seconds).
+    A failed flush is retried with exponential backoff; once retries are
+    exhausted the batch is appended to an on-disk JSON-lines journal and
+    the writer goes offline, journaling new batches until a replay of the
+    journal succeeds. ``write_batch`` is any callable taking a list of
+    ``(doc_id, data)`` pairs, so it can be pointed at the Firestore
+    emulator or an in-memory fake.
+    """
+
+    def __init__(self, write_batch: Callable[[List], None], journal_path: str = JOURNAL_PATH,
+                 batch_size: int = 100, flush_interval: float = 2.0, max_queue: int = 10000,
+                 max_retries: int = 3, base_backoff: float = 1.0, max_backoff: float = 60.0):
+        self.write_batch = write_batch
+        self.journal_path = journal_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        self.max_retries = max_retries
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+
+        self._queue = collections.deque()
+        self._cond = threading.Condition()
+        self._journal_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+        self._backoff = base_backoff
+        self._next_retry = 0.0
+        # Start offline if a previous run left records behind, so they are replayed first
+        self.online = not self._journal_size()
+
+        self.written = 0
+        self.journaled = 0
+        self.overflowed = 0
+        self.failed_flushes = 0
+        self.flushes = 0
+        self.last_flush_ms = 0.0
+        self.total_flush_ms = 0.0
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name='write-behind', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10.0):
+        """Flush what is queued (to the backend or the journal) and stop the worker"""
+        self._stop_event.set()
+        with self._cond:
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def enqueue(self, doc_id: str, data: Dict):
+        with self._cond:
+            if len(self._queue) >= self.max_queue:
+                # Never block the caller; overflow goes straight to disk. Switching to journaling
+                # gets it replayed, ahead of the newer records still queued.
+                self._append_journal([self._queue.popleft()])
+                self.overflowed += 1
+                if self.online:
+                    self.online = False
+                    self._next_retry = 0.0
+            self._queue.append((doc_id, data))
+            if len(self._queue) >= self.batch_size:
+                self._cond.notify()
+
+    def _take_batch(self) -> List:
+        with self._cond:
+            deadline = time.time() + self.flush_interval
+            while len(self._queue) < self.batch_size and not self._stop_event.is_set():
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            count = min(self.batch_size, len(self._queue))
+            return [self._queue.popleft() for _ in range(count)]
+
+    def _run(self):
+        while True:
+            stopping = self._stop_event.is_set()
+            batch = self._take_batch()
+            if not self.online:
+                if batch:
+                    self._append_journal(batch)
+                if not stopping and time.time() >= self._next_retry:
+                    self._replay_journal()
+            elif batch:
+                self._flush(batch, retries=0 if stopping else self.max_retries)
+            if stopping and not self._queue:
+                break
+
+    def _write(self, batch: List) -> bool:
+        started = time.time()
+        try:
+            self.write_batch(batch)
+        except Exception as e:
+            self.failed_flushes += 1
+            print(f"Error writing batch of {len(batch)} records: {e}")
+            return False
+        elapsed = (time.time() - started) * 1000
+        self.flushes += 1
+        self.written += len(batch)
+        self.last_flush_ms = elapsed
+        self.total_flush_ms += elapsed
+        return True
+
+    def _flush(self, batch: List, retries: int):
+        for attempt in range(retries + 1):
+            if self._write(batch):
+                self._backoff = self.base_backoff
+                return
+            if attempt < retries and not self._stop_event.is_set():
+                self._stop_event.wait(min(self.max_backoff, self.base_backoff * 2 ** attempt))
+        self._go_offline(batch)
+
+    def _go_offline(self, batch: List):
+        self._append_journal(batch)
+        self.online = False
+        self._next_retry = time.time() + self._backoff
+        print(f"Storage backend unreachable, journaling records to {self.journal_path}")
+
+    def _replay_journal(self):
+        with self._journal_lock:
+            # A batch that fails while the queue overflows is journaled after newer records;
+            # replay in sample sequence order (records without one keep their journal order)
+            records = sorted(self._read_journal(), key=lambda record: record[1].get('seq') or 0)
+            for i in range(0, len(records), self.batch_size):
+                if not self._write(records[i:i + self.batch_size]):
+                    # Records already written carry their IDs, so a later replay just overwrites them
+                    self._backoff = min(self.max_backoff, self._backoff * 2)
+                    self._next_retry = time.time() + self._backoff
+                    return
+            open(self.journal_path, 'w').close()
+        self.online = True
+        self._backoff = self.base_backoff
+        print(f"Storage backend reachable again, replayed {len(records)} journaled records")
+
+    def _append_journal(self, batch: List):
+        with self._journal_lock:
+            with open(self.journal_path, 'a') as journal:
+                for doc_id, data in batch:
+                    journal.write(json.dumps({'id': doc_id, 'data': data}, default=_encode_record) + '\n')
+        self.journaled += len(batch)
+
+    def _read_journal(self) -> List:
+        if not os.path.exists(self.journal_path):
+            return []
+        records = []
+        with open(self.journal_path) as journal:
+            for line in journal:
+                if line.strip():
+                    entry = json.loads(line, object_hook=_decode_record)
+                    records.append((entry['id'], entry['data']))
+        return records
+
+    def _journal_size(self) -> int:
+        try:
+            return os.path.getsize(self.journal_path)
+        except OSError:
+            return 0
+
+    def stats(self) -> Dict:
+        return {
+            'online': self.online,
+            'queue_depth': len(self._queue),
+            'journal_bytes': self._journal_size(),
+            'written': self.written,
+            'journaled': self.journaled,
+            'overflowed': self.overflowed,
+            'failed_flushes': self.failed_flushes,
+            'last_flush_ms': round(self.last_flush_ms, 1),
+            'avg_flush_ms': round(self.total_flush_ms / self.flushes, 1) if self.flushes else 0
+        }
+
+class FootTrafficSummary:
+    """Dashboard aggregates over the most recent foot traffic samples.
+
+    Keeps the same window as the original query (the newest ``window``
+    records) but maintains visitor totals, the dwell sum and the per-hour and
+    per-location counters incrementally: adding a record applies its
+    contribution and subtracts the one of the record it pushes out, so
+    serving the summary never touches the store. ``replace`` rebuilds the
+    window from a fresh read to correct any drift.
+    """
+
+    def __init__(self, window: int = 100):
+        self.window = window
+        self._lock = threading.Lock()
+        self._clear()
+
+    def _clear(self):
+        self._records = collections.deque()
+        self._ids = set()
+        self.total_visitors = 0
+        self.dwell_sum = 0.0
+        self.hour_counts = collections.Counter()
+        self.location_counts = collections.Counter()
+        self._hour_members = collections.Counter()
+        self._location_members = collections.Counter()
+
+    @staticmethod
+    def _entry(record: Dict) -> tuple:
+        timestamp = record.get('timestamp')
+        if isinstance(timestamp, datetime) and timestamp.tzinfo is not None:
+            # Firestore returns aware UTC timestamps; samples queued locally are naive local time
+            timestamp = timestamp.astimezone().replace(tzinfo=None)
+        # The stored local 'time' string is parsed once here rather than on every request
+        hour = int(record.get('time', '00:00:00')[:2])
+        return (record.get('id'), timestamp, record.get('people_count', 0),
+                record.get('avg_dwell_time', 0), hour, record.get('location', 'Unknown'))
+
+    def _apply(self, entry: tuple, sign: int):
+        _, _, people_count, dwell, hour, location = entry
+        self.total_visitors += sign * people_count
+        self.dwell_sum += sign * dwell
+        for counts, members, key in ((self.hour_counts, self._hour_members, hour),
+                                     (self.location_counts, self._location_members, location)):
+            counts[key] += sign * people_count
+            members[key] += sign
+            # Drop keys only when no record in the window refers to them any more
+            if not members[key]:
+                del counts[key]
+                del members[key]
+
+    def _push(self, entry: tuple):
+        if entry[0] is not None:
+            if entry[0] in self._ids:
+                return
+            self._ids.add(entry[0])
+        self._records.append(entry)
+        self._apply(entry, 1)
+        while len(self._records) > self.window:
+            evicted = self._records.popleft()
+            self._ids.discard(evicted[0])
+            self._apply(evicted, -1)
+
+    def add(self, record: Dict):
+        with self._lock:
+            self._push(self._entry(record))
+
+    def replace(self, records: List[Dict]) -> int:
+        """Rebuild from store records, keeping samples still waiting to be written; returns the window size"""
+        entries = {}
+        for position, record in enumerate(records):
+            entry = self._entry(record)
+            # Records are matched by ID; one without an ID must not stand in for every other
+            entries[entry[0] if entry[0] is not None else ('position', position)] = entry
+        with self._lock:
+            for entry in self._records:
+                entries.setdefault(entry[0], entry)
+            ordered = sorted(entries.values(), key=lambda e: e[1] or datetime.min)
+            self._clear()
+            for entry in ordered[-self.window:]:
+                self._push(entry)
+            return len(self._records)
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            if not self._records:
+                return {
+                    "totalVisitors": 0,
+                    "averageDuration": 0,
+                    "peakHours": [],
+                    "popularLocations": []
+                }
+            peak_hours = sorted(self.hour_counts.items(), key=lambda x: x[1], reverse=True)[:2]
+            popular_locations = sorted(self.location_counts.items(), key=lambda x: x[1], reverse=True)[:3]
+            return {
+                "totalVisitors": self.total_visitors,
+                "averageDuration": round(self.dwell_sum / len(self._records), 1),
+                "peakHours": [f"{hour:02d}:00" for hour, _ in peak_hours],
+                "popularLocations": [loc for loc, _ in popular_locations]
+            }
+
+class StorageBackend:
+    """Interface shared by every storage implementation.
+
+    Subclasses provide the raw reads and writes; queueing of foot traffic
+    samples and the dashboard summary are implemented here once.
+    """
+
+    foot_traffic_writer: WriteBehindQueue
+
+    def _start_writer(self, journal_path: str = JOURNAL_PATH):
+        # Foot traffic samples are written behind the frame loop in batches, together with their rollups
+        self.rollups = RollupAggregator(self._load_rollups)
+        # Sample sequence numbers keep growing across restarts, even if the clock was stepped back
+        self._seq_lock = threading.Lock()
+        self._last_seq = max(time.time_ns(), (self._max_rollup_seq() or 0) + 1)
+        # The writer and the compaction's backfill both fold samples into buckets; a plan, its write
+        # and its commit must not interleave with another
+        self._rollup_write_lock = threading.Lock()
+        self.foot_traffic_writer = WriteBehindQueue(self._write_foot_traffic, journal_path=journal_path)
+        self.foot_traffic_writer.start()
+        atexit.register(self.foot_traffic_writer.stop)
+        # Compaction scans and deletes in bulk, so it runs on its own thread instead of delaying flushes
+        self.compaction_interval = COMPACTION_INTERVAL
+        self._compaction_stop = threading.Event()
+        threading.Thread(target=self._compaction_loop, name='foot-traffic-compaction', daemon=True).start()
+        atexit.register(self._compaction_stop.set)
+
+    def _start_summary(self):
+        # The dashboard summary is served from memory and reconciled against the store periodically
+        self.summary = FootTrafficSummary()
+        self.summary_reconcile_interval = SUMMARY_RECONCILE_INTERVAL
+        self._summary_reconciled_at = 0.0
+        self._reconcile_lock = threading.Lock()
+
+    def _new_foot_traffic_id(self) -> str:
+        return uuid.uuid4().hex
+
+    def _write_foot_traffic_batch(self, records: List, rollups: List = ()) -> None:
+        """Persist (doc_id, data) pairs and (rollup_id, bucket) pairs in one commit; idempotent per ID"""
+        raise NotImplementedError
+
+    def _recent_foot_traffic(self, limit: int) -> List[Dict]:
+        """Return the newest foot traffic records, newest first"""
+        raise NotImplementedError
+
+    def _load_rollups(self, rollup_ids: List[str]) -> Dict[str, Dict]:
+        """Return the stored buckets among rollup_ids, by ID"""
+        raise NotImplementedError
+
+    def _query_rollups(self, resolution: str, start: str, end: str, location: Optional[str]) -> List[Dict]:
+        """Buckets of a resolution with start <= bucket_start < end, oldest first"""
+        raise NotImplementedError
+
+    def _max_rollup_seq(self) -> Optional[int]:
+        """Highest sample sequence number folded into any stored bucket"""
+        raise NotImplementedError
+
+    def _oldest_foot_traffic_timestamp(self) -> Optional[datetime]:
+        raise NotImplementedError
+
+    def _unrolled_foot_traffic(self, limit: int) -> Iterator[List[Dict]]:
+        """Yield lists of up to limit stored samples never folded into buckets (no seq)"""
+        raise NotImplementedError
+
+    def _delete_foot_traffic_before(self, cutoff: datetime) -> int:
+        raise NotImplementedError
+
+    def _delete_rollups_before(self, resolution: str, start: str) -> int:
+        raise NotImplementedError
+
+    def _write_foot_traffic(self, records: List) -> None:
+        """Write a batch of samples with the minute, hour and day buckets they update"""
+        for _, data in records:
+            # Journaled before samples had sequence numbers; seq 0 still marks them as rolled up
+            data.setdefault('seq', 0)
+        with self._rollup_write_lock:
+            planned = self.rollups.plan(records)
+            self._write_foot_traffic_batch(
+                records, [(rollup_id, bucket.to_dict()) for rollup_id, (bucket, _) in planned.items()])
+            # Only count the samples in once the commit carrying the buckets succeeded
+            self.rollups.commit(planned)
+
+    def _compaction_loop(self):
+        """Compact at startup and then every compaction_interval seconds"""
+        while True:
+            try:
+                self.compact_foot_traffic()
+            except Exception as e:
+                print(f"Error compacting foot traffic: {e}")
+            if self._compaction_stop.wait(self.compaction_interval):
+                break
+
+    def add_foot_traffic_data(self, data: Dict) -> Dict:
+        """Queue foot traffic data for a batched write"""
+        try:
+            now = datetime.now()
+            foot_traffic_data = {
+                'people_count': data.get('people_count', 0),
+                'avg_dwell_time': data.get('avg_dwell_time', 0),
+                'highest_dwell_time': data.get('highest_dwell_time', 0),
+                'location': data.get('location', 'Unknown'),
+                'timestamp': now,
+                'date': now.strftime('%m/%d/%Y'),
+                'day': now.strftime('%A'),
+                'time': now.strftime('%H:%M:%S')
+            }
+            # Entry/exit counts since the previous sample, for sources with counting lines
+            for key in ('entries', 'exits'):
+                if key in data:
+                    foot_traffic_data[key] = data[key]
+            
+            # Document IDs are generated client-side, so journal replays are idempotent
+            doc_id = self._new_foot_traffic_id()
+            # Sequence numbers follow queue order, which the writer and journal preserve
+            with self._seq_lock:
+                self._last_seq = max(self._last_seq + 1, time.time_ns())
+                foot_traffic_data['seq'] = self._last_seq
+                self.foot_traffic_writer.enqueue(doc_id, foot_traffic_data)
+            record = {**foot_traffic_data, 'id': doc_id}
+            self.summary.add(record)
+            return record
+        except Exception as e:
+            print(f"Error adding foot traffic data: {e}")
+            raise
+
+    # Raw samples are newest first; older, compacted history follows as one record per hour or day bucket
+    def get_foot_traffic_by_location(self, location: str) -> List[Dict]:
+        raise NotImplementedError
+
+    def get_all_foot_traffic(self) -> List[Dict]:
+        raise NotImplementedError
+
+    def get_foot_traffic_by_date_range(self, start_date: datetime, end_date: datetime) -> List[Dict]:
+        raise NotImplementedError
+
+    @staticmethod
+    def _bucket_record(bucket: Dict) -> Dict:
+        """A foot traffic record standing in for the samples of one bucket"""
+        start = datetime.strptime(bucket['bucket_start'], BUCKET_FORMAT)
+        record = {
+            'id': rollup_id(bucket['resolution'], bucket['location'], start),
+            'people_count': bucket['people_mean'],
+            'avg_dwell_time': bucket['dwell_mean'],
+            'highest_dwell_time': bucket['highest_dwell_max'],
+            'location': bucket['location'],
+            'timestamp': start,
+            'date': start.strftime('%m/%d/%Y'),
+            'day': start.strftime('%A'),
+            'time': start.strftime('%H:%M:%S'),
+            'resolution': bucket['resolution'],
+            'samples': bucket['count']
+        }
+        if bucket['entries'] or bucket['exits']:
+            record['entries'] = bucket['entries']
+            record['exits'] = bucket['exits']
+        return record
+
+    def _compacted_foot_traffic(self, start_date: Optional[datetime] = None, end_date: Optional[datetime] = None,
+                                location: Optional[str] = None) -> List[Dict]:
+        """Records for the part of a range whose raw samples were compacted, one per bucket, newest first"""
+        # Compaction cuts on hour boundaries, so every hour from the oldest raw sample on is still raw
+        oldest = self._oldest_foot_traffic_timestamp()
+        boundary = bucket_start(oldest, 'hour') if oldest is not None else datetime.now()
+        end = min(end_date, boundary) if end_date is not None else boundary
+        if start_date is not None and start_date >= end:
+            return []
+        # Hour buckets where they are still retained, day buckets before that
+        split = start_date
+        hour_days = ROLLUP_RETENTION_DAYS['hour']
+        if hour_days is not None:
+            hours_from = bucket_start(datetime.now() - timedelta(days=hour_days), 'day') + timedelta(days=1)
+            if start_date is None or start_date < hours_from:
+                split = min(hours_from, end)
+        start_key = start_date.strftime(BUCKET_FORMAT) if start_date is not None else ''
+        buckets = []
+        if split is not None and split.strftime(BUCKET_FORMAT) > start_key:
+            buckets += self._query_rollups('day', start_key, split.strftime(BUCKET_FORMAT), location)
+        hours_key = split.strftime(BUCKET_FORMAT) if split is not None else start_key
+        buckets += self._query_rollups('hour', hours_key, end.strftime(BUCKET_FORMAT), location)
+        return [self._bucket_record(bucket) for bucket in reversed(buckets)]
+
+    def get_foot_traffic_rollups(self, start_date: datetime, end_date: datetime, location: Optional[str] = None,
+                                 resolution: Optional[str] = None) -> Dict:
+        """Aggregated foot traffic buckets for charts, from the coarsest resolution that fits the range"""
+        try:
+            resolution = resolution or choose_resolution(start_date, end_date)
+            if resolution not in RESOLUTIONS:
+                raise ValueError(f"Unknown resolution: {resolution}")
+            buckets = self._query_rollups(resolution, start_date.strftime(BUCKET_FORMAT),
+                                          end_date.strftime(BUCKET_FORMAT), location)
+            return {'resolution': resolution, 'buckets': buckets}
+        except Exception as e:
+            print(f"Error getting foot traffic rollups: {e}")
+            raise
+
+    def backfill_rollups(self, chunk_size: int = 100) -> int:
+        """Fold stored samples from before rollups existed into their buckets and mark them rolled up"""
+        backfilled = 0
+        for records in self._unrolled_foot_traffic(chunk_size):
+            # Rewriting the samples with seq 0 marks them in the same commit as their buckets
+            batch = [(record['id'], {**{k: v for k, v in record.items() if k != 'id'}, 'seq': 0})
+                     for record in records]
+            # The lock is held per chunk, so queued samples are flushed in between
+            with self._rollup_write_lock:
+                planned = self.rollups.plan(batch)
+                self._write_foot_traffic_batch(
+                    batch, [(rollup_id, bucket.to_dict()) for rollup_id, (bucket, _) in planned.items()])
+                self.rollups.commit(planned)
+            backfilled += len(batch)
+        if backfilled:
+            print(f"Backfilled rollups from {backfilled} foot traffic records")
+        return backfilled
+
+    def compact_foot_traffic(self, now: Optional[datetime] = None) -> Dict:
+        """Apply the retention policy: drop raw samples and fine buckets past their retention"""
+        now = now or datetime.now()
+        # Samples are folded into buckets as they are written; older history is rolled up before
+        # anything is dropped, and a failed backfill aborts the compaction
+        self.backfill_rollups()
+        # Raw samples go on hour boundaries, so reads can stand in hour buckets for what is gone
+        deleted = {'raw': self._delete_foot_traffic_before(
+            bucket_start(now - timedelta(days=RAW_RETENTION_DAYS), 'hour'))}
+        for resolution in RESOLUTIONS:
+            days = ROLLUP_RETENTION_DAYS[resolution]
+            if days is not None:
+                start = (now - timedelta(days=days)).strftime(BUCKET_FORMAT)
+                deleted[resolution] = self._delete_rollups_before(resolution, start)
+        if any(deleted.values()):
+            print(f"Compacted foot traffic: {deleted}")
+        return deleted
+
+    def reconcile_summary(self) -> None:
+        """Rebuild the in-memory summary from the newest stored records"""
+        if not self._reconcile_lock.acquire(blocking=False):
+            return
+        try:
+            records = self._recent_foot_traffic(self.summary.window)
+            kept = self.summary.replace(records)
+            if kept < min(self.summary.window, len(records)):
+                # Records sharing an ID collapse into one, which skews every total
+                print(f"Foot traffic summary kept {kept} of {len(records)} stored records; check their IDs")
+            self._summary_reconciled_at = time.time()
+        finally:
+            self._reconcile_lock.release()
+
+    def get_foot_traffic_summary(self) -> Dict:
+        """Get summary of foot traffic data"""
+        try:
+            if time.time() - self._summary_reconciled_at >= self.summary_reconcile_interval:
+                self.reconcile_summary()
+            return self.summary.snapshot()
+        except Exception as e:
+            print(f"Error getting foot traffic summary: {e}")
+            raise
+
+    def add_calendar_event(self, event_data: Dict) -> Dict:
+        raise NotImplementedError
+
+    def get_calendar_events(self) -> List[Dict]:
+        raise NotImplementedError
+
+    def delete_calendar_event(self, event_id: str) -> None:
+        raise NotImplementedError
+
+    def authenticate_user(self, email: str, password: str) -> Optional[Dict]:
+        raise NotImplementedError
+
+    def create_user(self, user_data: Dict) -> Dict:
+        raise NotImplementedError
+
+class FirestoreStorage(StorageBackend):
+    # Firestore rejects batched writes with more than 500 operations
+    MAX_BATCH_WRITES = 500
+
+    def __init__(self, db=None):
+        # FIRESTORE_EMULATOR_HOST is honoured by firestore.client() for local testing
+        if db is None:
+            _initialize_firebase()
+        self.db = db or firestore.client()
         self.foot_traffic_ref = self.db.collection('footTraffic')
+        self.rollups_ref = self.db.collection('footTrafficRollups')
+        self._backfilled = False
         self.calendar_ref = self.db.collection('calendar')
         self.users_ref = self.db.collection('users')
         
         # Ensure collections exist
         self._ensure_collections()
+        self._start_summary()
+        self._start_writer()
     
     def _ensure_collections(self):
         """Ensure all required collections exist"""
-        collections = ['footTraffic', 'calendar', 'users']
+        collections = ['footTraffic', 'footTrafficRollups', 'calendar', 'users']
         for collection in collections:
             if not self._collection_exists(collection):
                 # Create a dummy document and immediately delete it to ensure collection exists
@@ -40,33 +627,90 @@ class DataStorage:
         except Exception:
             return False
     
-    def add_foot_traffic_data(self, data: Dict) -> Dict:
-        """Add foot traffic data to Firestore"""
-        try:
-            now = datetime.now()
-            foot_traffic_data = {
-                'people_count': data.get('people_count', 0),
-                'avg_dwell_time': data.get('avg_dwell_time', 0),
-                'highest_dwell_time': data.get('highest_dwell_time', 0),
-                'location': data.get('location', 'Unknown'),
-                'timestamp': now,
-                'date': now.strftime('%m/%d/%Y'),
-                'day': now.strftime('%A'),
-                'time': now.strftime('%H:%M:%S')
-            }
-            
-            doc_ref = self.foot_traffic_ref.document()
-            doc_ref.set(foot_traffic_data)
-            return {**foot_traffic_data, 'id': doc_ref.id}
-        except Exception as e:
-            print(f"Error adding foot traffic data: {e}")
-            raise
-    
+    def _write_foot_traffic_batch(self, records: List, rollups: List = ()) -> None:
+        """Write samples and rollup buckets to Firestore in as few batched commits as possible"""
+        # Larger writes span several commits; a retry after a partial commit is still exact, since
+        # samples are set by ID and buckets skip samples at or below their last_seq
+        writes = ([(self.foot_traffic_ref.document(doc_id), data) for doc_id, data in records]
+                  + [(self.rollups_ref.document(rollup_id), data) for rollup_id, data in rollups])
+        for i in range(0, len(writes), self.MAX_BATCH_WRITES):
+            batch = self.db.batch()
+            for doc_ref, data in writes[i:i + self.MAX_BATCH_WRITES]:
+                batch.set(doc_ref, data)
+            batch.commit()
+
+    def _load_rollups(self, rollup_ids: List[str]) -> Dict[str, Dict]:
+        docs = self.db.get_all([self.rollups_ref.document(rollup_id) for rollup_id in rollup_ids])
+        return {doc.id: doc.to_dict() for doc in docs if doc.exists}
+
+    def _query_rollups(self, resolution: str, start: str, end: str, location: Optional[str]) -> List[Dict]:
+        query = self.rollups_ref.where('resolution', '==', resolution)
+        if location is not None:
+            query = query.where('location', '==', location)
+        docs = query.where('bucket_start', '>=', start).where('bucket_start', '<', end).order_by('bucket_start').stream()
+        return [doc.to_dict() for doc in docs]
+
+    def _max_rollup_seq(self) -> Optional[int]:
+        docs = self.rollups_ref.order_by('last_seq', direction=firestore.Query.DESCENDING).limit(1).stream()
+        doc = next(docs, None)
+        return doc.to_dict().get('last_seq') if doc is not None else None
+
+    def _unrolled_foot_traffic(self, limit: int) -> Iterator[List[Dict]]:
+        # Firestore cannot query for a missing field, so samples are scanned once and the scan recorded
+        if self._backfilled:
+            return
+        state_ref = self.rollups_ref.document('_backfill')
+        if state_ref.get().exists:
+            self._backfilled = True
+            return
+        query = self.foot_traffic_ref.order_by('timestamp').limit(self.MAX_BATCH_WRITES)
+        last_doc = None
+        chunk = []
+        while True:
+            page = list((query.start_after(last_doc) if last_doc is not None else query).stream())
+            if not page:
+                break
+            last_doc = page[-1]
+            for doc in page:
+                data = doc.to_dict()
+                if 'seq' not in data:
+                    chunk.append({'id': doc.id, **data})
+                    if len(chunk) >= limit:
+                        yield chunk
+                        chunk = []
+        if chunk:
+            yield chunk
+        state_ref.set({'completed_at': datetime.now()})
+        self._backfilled = True
+
+    def _delete_where(self, query) -> int:
+        deleted = 0
+        while True:
+            docs = list(query.limit(self.MAX_BATCH_WRITES).stream())
+            if not docs:
+                return deleted
+            batch = self.db.batch()
+            for doc in docs:
+                batch.delete(doc.reference)
+            batch.commit()
+            deleted += len(docs)
+
+    def _delete_foot_traffic_before(self, cutoff: datetime) -> int:
+        return self._delete_where(self.foot_traffic_ref.where('timestamp', '<', cutoff))
+
+    def _delete_rollups_before(self, resolution: str, start: str) -> int:
+        return self._delete_where(self.rollups_ref.where('resolution', '==', resolution)
+                                  .where('bucket_start', '<', start))
+
+    def _new_foot_traffic_id(self) -> str:
+        return self.foot_traffic_ref.document().id
+
     def get_foot_traffic_by_location(self, location: str) -> List[Dict]:
         """Get foot traffic data for a specific location"""
         try:
             docs = self.foot_traffic_ref.where('location', '==', location).order_by('timestamp', direction=firestore.Query.DESCENDING).stream()
-            return [{'id': doc.id, **doc.to_dict()} for doc in docs]
+            return ([{'id': doc.id, **doc.to_dict()} for doc in docs]
+                    + self._compacted_foot_traffic(location=location))
         except Exception as e:
             print(f"Error getting location foot traffic: {e}")
             raise
@@ -75,7 +719,7 @@ class DataStorage:
         """Get all foot traffic data"""
         try:
             docs = self.foot_traffic_ref.order_by('timestamp', direction=firestore.Query.DESCENDING).stream()
-            return [{'id': doc.id, **doc.to_dict()} for doc in docs]
+            return [{'id': doc.id, **doc.to_dict()} for doc in docs] + self._compacted_foot_traffic()
         except Exception as e:
             print(f"Error getting all foot traffic: {e}")
             raise
@@ -88,57 +732,19 @@ class DataStorage:
                    .where('timestamp', '<=', end_date)
                    .order_by('timestamp', direction=firestore.Query.DESCENDING)
                    .stream())
-            return [{'id': doc.id, **doc.to_dict()} for doc in docs]
+            return ([{'id': doc.id, **doc.to_dict()} for doc in docs]
+                    + self._compacted_foot_traffic(start_date, end_date))
         except Exception as e:
             print(f"Error getting foot traffic by date range: {e}")
             raise
     
-    def get_foot_traffic_summary(self) -> Dict:
-        """Get summary of foot traffic data"""
-        try:
-            # Get the most recent data
-            docs = self.foot_traffic_ref.order_by('timestamp', direction=firestore.Query.DESCENDING).limit(100).stream()
-            data = [doc.to_dict() for doc in docs]
-            
-            if not data:
-                return {
-                    "totalVisitors": 0,
-                    "averageDuration": 0,
-                    "peakHours": [],
-                    "popularLocations": []
-                }
-            
-            # Calculate summary statistics
-            total_visitors = sum(d.get('people_count', 0) for d in data)
-            avg_duration = sum(d.get('avg_dwell_time', 0) for d in data) / len(data)
-            
-            # Get peak hours
-            hour_counts = {}
-            for d in data:
-                hour = datetime.strptime(d.get('time', '00:00:00'), '%H:%M:%S').hour
-                hour_counts[hour] = hour_counts.get(hour, 0) + d.get('people_count', 0)
-            
-            peak_hours = sorted(hour_counts.items(), key=lambda x: x[1], reverse=True)[:2]
-            peak_hours = [f"{hour:02d}:00" for hour, _ in peak_hours]
-            
-            # Get popular locations
-            location_counts = {}
-            for d in data:
-                loc = d.get('location', 'Unknown')
-                location_counts[loc] = location_counts.get(loc, 0) + d.get('people_count', 0)
-            
-            popular_locations = sorted(location_counts.items(), key=lambda x: x[1], reverse=True)[:3]
-            popular_locations = [loc for loc, _ in popular_locations]
-            
-            return {
-                "totalVisitors": total_visitors,
-                "averageDuration": round(avg_duration, 1),
-                "peakHours": peak_hours,
-                "popularLocations": popular_locations
-            }
-        except Exception as e:
-            print(f"Error getting foot traffic summary: {e}")
-            raise
+    def _oldest_foot_traffic_timestamp(self) -> Optional[datetime]:
+        doc = next(self.foot_traffic_ref.order_by('timestamp').limit(1).stream(), None)
+        return doc.to_dict()['timestamp'] if doc is not None else None
+
+    def _recent_foot_traffic(self, limit: int) -> List[Dict]:
+        docs = self.foot_traffic_ref.order_by('timestamp', direction=firestore.Query.DESCENDING).limit(limit).stream()
+        return [{'id': doc.id, **doc.to_dict()} for doc in docs]
 
     def add_calendar_event(self, event_data: Dict) -> Dict:
         """Add a calendar event to Firestore"""
@@ -275,5 +881,18 @@ class DataStorage:
             print(f"Error creating user: {e}")
             raise
 
+# Kept for code that still refers to the original class name
+DataStorage = FirestoreStorage
+
+def create_storage(backend: Optional[str] = None) -> StorageBackend:
+    """Build the storage backend named by STORAGE_BACKEND (firestore or sqlite)"""
+    backend = (backend or os.environ.get('STORAGE_BACKEND', 'firestore')).lower()
+    if backend == 'sqlite':
+        from sqlite_storage import SQLiteStorage
+        return SQLiteStorage(os.environ.get('SQLITE_PATH'))
+    if backend == 'firestore':
+        return FirestoreStorage()
+    raise ValueError(f"Unknown storage backend: {backend}")
+
 # Create a global instance
-storage = DataStorage() 
\ No newline at end of file
+storage = create_storage()
@@ -0,0 +1,113 @@
+import collections
+import threading
+
+
+class _Visit:
+    __slots__ = ("start", "last_seen")
+
+    def __init__(self, start):
+        self.start = start
+        self.last_seen = start
+
+
+class DwellTracker:
+    """Running dwell-time statistics for tracks inside a region.
+
+    Only tracks currently in the region are kept, once in entry order (so
+    the oldest open visit is first) and once in last-seen order (so stale
+    tracks are found at the front without a scan). Finished visits are
+    folded into a running sum, count and maximum and then forgotten, which
+    keeps memory proportional to the people in view rather than to the
+    length of the run. Average and highest dwell are O(1): open visits
+    contribute ``count * now - sum(starts)``. A track that has not been seen for
+    ``stale_timeout`` seconds (ByteTrack lost it inside the region) is
+    closed at the time it was last seen.
+    """
+
+    def __init__(self, stale_timeout=10.0):
+        self.stale_timeout = stale_timeout
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._active = collections.OrderedDict()
+            self._by_last_seen = collections.OrderedDict()
+            # Starts are summed relative to the first update to keep the float sum precise
+            self._origin = None
+            self._active_start_sum = 0.0
+            self.completed_count = 0
+            self.completed_sum = 0.0
+            self.completed_max = 0.0
+            self.evicted = 0
+
+    def __len__(self):
+        return len(self._active)
+
+    def __contains__(self, track_id):
+        return track_id in self._active
+
+    def update(self, inside, outside, now):
+        """Record one detection step: track IDs inside and outside the region"""
+        with self._lock:
+            active = self._active
+            if self._origin is None:
+                self._origin = now
+            for track_id in inside:
+                visit = active.get(track_id)
+                if visit is None:
+                    active[track_id] = _Visit(now)
+                    self._active_start_sum += now - self._origin
+                    self._by_last_seen[track_id] = None
+                else:
+                    visit.last_seen = now
+                    self._by_last_seen.move_to_end(track_id)
+            for track_id in outside:
+                if track_id in active:
+                    self._close(track_id, now)
+            self._evict_stale(now)
+
+    def _close(self, track_id, end):
+        visit = self._active.pop(track_id)
+        del self._by_last_seen[track_id]
+        self._active_start_sum -= visit.start - self._origin
+        if not self._active:
+            self._active_start_sum = 0.0
+        duration = end - visit.start
+        self.completed_count += 1
+        self.completed_sum += duration
+        if duration > self.completed_max:
+            self.completed_max = duration
+
+    def _evict_stale(self, now):
+        cutoff = now - self.stale_timeout
+        while self._by_last_seen:
+            track_id = next(iter(self._by_last_seen))
+            visit = self._active[track_id]
+            if visit.last_seen >= cutoff:
+                break
+            self._close(track_id, visit.last_seen)
+            self.evicted += 1
+
+    def dwell_times(self, now):
+        """Return (average, highest) dwell over open and finished visits"""
+        with self._lock:
+            active_count = len(self._active)
+            total_count = active_count + self.completed_count
+            if total_count == 0:
+                return 0, 0
+            elapsed = now - self._origin if self._origin is not None else 0
+            total = self.completed_sum + active_count * elapsed - self._active_start_sum
+            highest = self.completed_max
+            if active_count:
+                oldest = next(iter(self._active.values()))
+                highest = max(highest, now - oldest.start)
+            return total / total_count, highest
+
+    def stats(self):
+        with self._lock:
+            return {
+                "active": len(self._active),
+                "completed": self.completed_count,
+                "evicted": self.evicted
+            }
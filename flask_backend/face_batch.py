@@ -0,0 +1,226 @@
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+
+from face_embedding_store import EmbeddingStore
+
+# One recognition system per worker process, built by the pool initializer
+_worker_system = None
+
+
+def _init_worker(family_dir, threads):
+    global _worker_system
+    # Each process is already one of many, so split the cores between them. OpenMP reads its
+    # limit once, so it is set before ONNX Runtime is imported; the sessions get it explicitly.
+    os.environ["OMP_NUM_THREADS"] = str(threads)
+    cv2.setNumThreads(1)
+    from video_face_recognition import VideoFaceRecognition
+    # The parent synced the embedding store; workers only load it, without a refresh thread
+    _worker_system = VideoFaceRecognition(family_dir=family_dir, sync_embeddings=False,
+                                          onnx_threads=threads)
+
+
+def check_output_format(output_format):
+    """Raise ImportError now, rather than after processing, if the timeline cannot be written"""
+    if output_format == "parquet":
+        import pandas as pd
+        # Needs pyarrow or fastparquet
+        pd.io.parquet.get_engine("auto")
+
+
+def plan_chunks(frame_count, fps, chunk_seconds=60, stride=5):
+    """Split [0, frame_count) into chunks whose boundaries fall on detection frames"""
+    chunk_frames = max(stride, int(round(chunk_seconds * fps / stride)) * stride)
+    return [(start, min(frame_count, start + chunk_frames))
+            for start in range(0, frame_count, chunk_frames)]
+
+
+def _process_chunk(video_path, start, end, stride, render_path=None):
+    """Detect and recognise faces on every ``stride``-th frame of [start, end)"""
+    cap = cv2.VideoCapture(video_path)
+    # OpenCV seeks to the preceding keyframe and decodes forward to the exact frame
+    cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+    writer = None
+    if render_path:
+        fps = cap.get(cv2.CAP_PROP_FPS) or 30
+        size = (int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+        writer = cv2.VideoWriter(render_path, cv2.VideoWriter_fourcc(*'mp4v'), fps, size)
+
+    detections = []
+    try:
+        for frame_index in range(start, end):
+            ret, frame = cap.read()
+            if not ret:
+                break
+            # Same cadence as process_video: every stride-th frame, counting from 1
+            if (frame_index + 1) % stride == 0:
+                faces = _worker_system.face_app.get(frame)
+                matches = _worker_system.recognize_faces([face.embedding for face in faces])
+                for face, (name, family, similarity) in zip(faces, matches):
+                    bbox = face.bbox.astype(int)
+                    detections.append({
+                        "frame": frame_index,
+                        "name": name,
+                        "family": family,
+                        "similarity": round(float(similarity), 4),
+                        "bbox": [int(v) for v in bbox]
+                    })
+                    if writer is not None:
+                        label = f"{name if name else 'Unknown'}"
+                        if similarity > 0:
+                            label += f" ({similarity:.2f})"
+                        cv2.rectangle(frame, (bbox[0], bbox[1]), (bbox[2], bbox[3]), (0, 255, 0), 2)
+                        cv2.putText(frame, label, (bbox[0], bbox[1] - 10),
+                                    cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
+            if writer is not None:
+                writer.write(frame)
+    finally:
+        cap.release()
+        if writer is not None:
+            writer.release()
+    return start, detections
+
+
+def build_timeline(detections, fps, max_gap):
+    """Merge per-frame recognitions into (name, frame range) appearances"""
+    timeline = []
+    open_spans = {}
+    for detection in sorted(detections, key=lambda d: d["frame"]):
+        if not detection["name"]:
+            continue
+        key = (detection["name"], detection["family"])
+        span = open_spans.get(key)
+        if span is not None and detection["frame"] - span["end_frame"] <= max_gap:
+            span["end_frame"] = detection["frame"]
+            span["detections"] += 1
+            span["max_similarity"] = max(span["max_similarity"], detection["similarity"])
+            continue
+        span = {
+            "name": detection["name"],
+            "family": detection["family"],
+            "start_frame": detection["frame"],
+            "end_frame": detection["frame"],
+            "detections": 1,
+            "max_similarity": detection["similarity"]
+        }
+        open_spans[key] = span
+        timeline.append(span)
+
+    for span in timeline:
+        span["start_time"] = round(span["start_frame"] / fps, 2)
+        span["end_time"] = round(span["end_frame"] / fps, 2)
+    timeline.sort(key=lambda s: (s["start_frame"], s["name"]))
+    return timeline
+
+
+def _concatenate(paths, output_path, fps, size):
+    writer = cv2.VideoWriter(output_path, cv2.VideoWriter_fourcc(*'mp4v'), fps, size)
+    try:
+        for path in paths:
+            cap = cv2.VideoCapture(path)
+            while True:
+                ret, frame = cap.read()
+                if not ret:
+                    break
+                writer.write(frame)
+            cap.release()
+            os.remove(path)
+    finally:
+        writer.release()
+
+
+def process_video_parallel(video_path, output_dir=".", family_dir="family_photos", workers=None,
+                           chunk_seconds=60, stride=5, render=False, output_format="json",
+                           max_gap_seconds=2.0):
+    """Recognise faces across a whole recording using every CPU core.
+
+    The video is split into frame ranges aligned to the detection stride,
+    each range is processed in its own worker process, and the per-frame
+    results are merged into one identity timeline written as JSON or
+    Parquet. Rendering the annotated video is optional. Returns the path of
+    the timeline file.
+    """
+    check_output_format(output_format)
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise ValueError(f"Could not open video file: {video_path}")
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30
+    frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    size = (int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+    cap.release()
+
+    os.makedirs(output_dir, exist_ok=True)
+    # Sync the embedding store once here so the workers only memory-map it
+    EmbeddingStore(family_dir).refresh()
+    base_name = os.path.splitext(os.path.basename(video_path))[0]
+    chunks = plan_chunks(frame_count, fps, chunk_seconds, stride)
+    workers = workers or os.cpu_count() or 1
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    print(f"Processing {frame_count} frames in {len(chunks)} chunks on {workers} workers")
+
+    started = time.time()
+    render_paths = [os.path.join(output_dir, f"{base_name}_chunk{i:04d}.mp4") if render else None
+                    for i in range(len(chunks))]
+    detections = []
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(family_dir, threads)) as executor:
+        futures = [executor.submit(_process_chunk, video_path, start, end, stride, render_path)
+                   for (start, end), render_path in zip(chunks, render_paths)]
+        for done, future in enumerate(futures, 1):
+            _, chunk_detections = future.result()
+            detections.extend(chunk_detections)
+            print(f"Chunk {done}/{len(chunks)} complete")
+
+    timeline = build_timeline(detections, fps, max_gap=int(max_gap_seconds * fps))
+    result = {
+        "video": video_path,
+        "fps": fps,
+        "frames": frame_count,
+        "processing_seconds": round(time.time() - started, 1),
+        "identities": timeline
+    }
+
+    if output_format == "parquet":
+        import pandas as pd
+        output_path = os.path.join(output_dir, f"{base_name}_faces.parquet")
+        pd.DataFrame(timeline).to_parquet(output_path, index=False)
+    else:
+        output_path = os.path.join(output_dir, f"{base_name}_faces.json")
+        with open(output_path, "w") as f:
+            json.dump(result, f, indent=2)
+
+    if render:
+        _concatenate(render_paths, os.path.join(output_dir, f"{base_name}_faces.mp4"), fps, size)
+
+    print(f"Found {len({s['name'] for s in timeline})} identities in {result['processing_seconds']}s")
+    print(f"Timeline saved to: {output_path}")
+    return output_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline face recognition over archived footage")
+    parser.add_argument("video", help="Path to the video file")
+    parser.add_argument("--output-dir", default=".", help="Where to write the timeline (and video)")
+    parser.add_argument("--family-dir", default="family_photos", help="Enrolled face embeddings")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: all cores)")
+    parser.add_argument("--chunk-seconds", type=float, default=60, help="Length of each work unit")
+    parser.add_argument("--stride", type=int, default=5, help="Run detection on every Nth frame")
+    parser.add_argument("--format", choices=("json", "parquet"), default="json")
+    parser.add_argument("--render", action="store_true", help="Also write an annotated video")
+    args = parser.parse_args()
+    try:
+        check_output_format(args.format)
+    except ImportError as e:
+        parser.error(f"--format {args.format} is unavailable: {e}")
+
+    process_video_parallel(args.video, output_dir=args.output_dir, family_dir=args.family_dir,
+                           workers=args.workers, chunk_seconds=args.chunk_seconds, stride=args.stride,
+                           render=args.render, output_format=args.format)
+
+
+if __name__ == "__main__":
+    main()
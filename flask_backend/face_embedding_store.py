@@ -0,0 +1,184 @@
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+
+import numpy as np
+
+from face_gallery import normalize_rows
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_SUFFIX = '_embedding.npy'
+MANIFEST_NAME = 'manifest.json'
+# Unpublished matrix files and temporary manifests older than this are removed on the next write
+STALE_SECONDS = 60
+
+
+class EmbeddingStore:
+    """Consolidated, memory-mapped copy of the enrolled face embeddings.
+
+    The per-person ``*_embedding.npy`` files under ``family_dir`` are merged
+    into one normalised float32 matrix saved in ``store_dir`` together with
+    a manifest of labels and the mtime/size of each source file. ``load``
+    only memory-maps that matrix, so startup cost does not grow with the
+    number of enrolled people. ``refresh`` stats the source files and reads
+    just the new or modified ones, reusing the existing rows for the rest.
+    Each refresh writes a new generation of the matrix and then replaces
+    the manifest with ``os.replace``, so readers see either the old or the
+    new store, never a partial one.
+
+    Several processes may refresh the same store at once (the app's refresh
+    thread and face_batch), so every matrix file and temporary manifest gets
+    a unique name and is created exclusively; a file another process may
+    have memory-mapped is never rewritten, and only files no longer
+    referenced by the manifest and older than ``STALE_SECONDS`` are removed.
+    """
+
+    def __init__(self, family_dir, store_dir=None):
+        self.family_dir = family_dir
+        self.store_dir = store_dir or os.path.join(family_dir, '.embedding_store')
+        self._lock = threading.Lock()
+        self.matrix = np.zeros((0, 0), dtype=np.float32)
+        self.names = []
+        self.families = []
+        self.files = {}
+        self.generation = 0
+        self.matrix_name = None
+
+    @property
+    def manifest_path(self):
+        return os.path.join(self.store_dir, MANIFEST_NAME)
+
+    @staticmethod
+    def _matrix_name(manifest):
+        # Stores written before matrix names were unique only record the generation
+        return manifest.get('matrix') or f"embeddings-{manifest['generation']}.npy"
+
+    def _read_manifest(self):
+        try:
+            with open(self.manifest_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def load(self):
+        """Memory-map the consolidated store; returns False if there is none yet"""
+        for attempt in range(3):
+            try:
+                with open(self.manifest_path) as f:
+                    manifest = json.load(f)
+                matrix_name = self._matrix_name(manifest)
+                matrix = np.load(os.path.join(self.store_dir, matrix_name), mmap_mode='r')
+                break
+            except FileNotFoundError:
+                if not os.path.exists(self.manifest_path):
+                    return False
+                # Another process published a new generation and removed this one; read again
+                continue
+            except (OSError, ValueError, KeyError) as e:
+                logger.warning(f"Ignoring unreadable embedding store: {e}")
+                return False
+        else:
+            logger.warning("Ignoring embedding store that keeps changing while it is read")
+            return False
+        self.matrix = matrix
+        self.names = manifest['names']
+        self.families = manifest['families']
+        self.files = manifest['files']
+        self.generation = manifest['generation']
+        self.matrix_name = matrix_name
+        return True
+
+    def _scan(self):
+        """Map every embedding file under family_dir to (mtime, size, name, family)"""
+        found = {}
+        if not os.path.isdir(self.family_dir):
+            return found
+        for family in os.listdir(self.family_dir):
+            family_path = os.path.join(self.family_dir, family)
+            if family.startswith('.') or not os.path.isdir(family_path):
+                continue
+            with os.scandir(family_path) as entries:
+                for entry in entries:
+                    if entry.name.endswith(EMBEDDING_SUFFIX) and entry.is_file():
+                        stat = entry.stat()
+                        found[entry.path] = (stat.st_mtime, stat.st_size,
+                                             entry.name[:-len(EMBEDDING_SUFFIX)], family)
+        return found
+
+    def refresh(self):
+        """Bring the store up to date with family_dir; returns True if it changed"""
+        with self._lock:
+            found = self._scan()
+            rows, names, families, files = [], [], [], {}
+            changed = set(found) != set(self.files)
+            for path, (mtime, size, name, family) in sorted(found.items()):
+                previous = self.files.get(path)
+                if previous is not None and previous['mtime'] == mtime and previous['size'] == size:
+                    row = self.matrix[previous['row']]
+                else:
+                    try:
+                        row = normalize_rows(np.load(path).ravel())[0]
+                    except Exception as e:
+                        logger.error(f"Error loading embedding {path}: {e}")
+                        continue
+                    changed = True
+                if rows and row.shape != rows[0].shape:
+                    logger.error(f"Skipping embedding {path}: unexpected shape {row.shape}")
+                    continue
+                files[path] = {'mtime': mtime, 'size': size, 'row': len(rows)}
+                rows.append(row)
+                names.append(name)
+                families.append(family)
+
+            if not changed:
+                return False
+            matrix = np.stack(rows).astype(np.float32) if rows else np.zeros((0, 0), dtype=np.float32)
+            self._write(matrix, names, families, files)
+            return True
+
+    def _write(self, matrix, names, families, files):
+        os.makedirs(self.store_dir, exist_ok=True)
+        published = self._read_manifest()
+        generation = max(self.generation, published.get('generation', 0) if published else 0) + 1
+        writer = f'{os.getpid()}-{uuid.uuid4().hex[:12]}'
+        matrix_name = f'embeddings-{generation}-{writer}.npy'
+        matrix_path = os.path.join(self.store_dir, matrix_name)
+        with open(matrix_path, 'xb') as f:
+            np.save(f, matrix)
+
+        manifest = {'generation': generation, 'matrix': matrix_name,
+                    'names': names, 'families': families, 'files': files}
+        tmp_path = f'{self.manifest_path}.{writer}.tmp'
+        with open(tmp_path, 'x') as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, self.manifest_path)
+
+        self.matrix = np.load(matrix_path, mmap_mode='r')
+        self.names, self.families, self.files = names, families, files
+        self.generation = generation
+        self.matrix_name = matrix_name
+        self._remove_stale()
+
+    def _remove_stale(self):
+        """Delete old generations and temporary manifests that nothing references any more"""
+        published = self._read_manifest()
+        keep = {self.matrix_name}
+        if published is not None:
+            keep.add(self._matrix_name(published))
+        cutoff = time.time() - STALE_SECONDS
+        with os.scandir(self.store_dir) as entries:
+            for entry in entries:
+                stale = ((entry.name.startswith('embeddings-') and entry.name.endswith('.npy'))
+                         or (entry.name.startswith(MANIFEST_NAME + '.') and entry.name.endswith('.tmp')))
+                if not stale or entry.name in keep:
+                    continue
+                # Open memory maps of an old generation stay valid after the unlink on POSIX
+                try:
+                    if entry.stat().st_mtime < cutoff:
+                        os.remove(entry.path)
+                except OSError:
+                    pass
@@ -0,0 +1,107 @@
+import numpy as np
+
+try:
+    import faiss
+except ImportError:
+    faiss = None
+
+
+def normalize_rows(embeddings):
+    """L2-normalise embeddings to float32 rows so cosine similarity is a dot product"""
+    embeddings = np.atleast_2d(np.asarray(embeddings, dtype=np.float32))
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return embeddings / norms
+
+
+class _GalleryState:
+    __slots__ = ("matrix", "names", "families", "index")
+
+    def __init__(self, matrix, names, families, index=None):
+        self.matrix = matrix
+        self.names = names
+        self.families = families
+        self.index = index
+
+
+class FaceGallery:
+    """Enrolled face embeddings searched with one matrix multiply.
+
+    Embeddings are kept as a single pre-normalised float32 matrix with
+    parallel name and family arrays, so matching a frame's faces is
+    ``queries @ matrix.T`` followed by a top-k selection. When faiss is
+    installed and the gallery has at least ``ann_threshold`` entries, an
+    HNSW inner-product index is used instead of the exact search. The
+    matrix, labels and index are swapped in as one object, so searches
+    running during a reload always see a consistent gallery.
+    """
+
+    def __init__(self, similarity_threshold=0.35, ann_threshold=5000):
+        self.similarity_threshold = similarity_threshold
+        self.ann_threshold = ann_threshold
+        self._state = _GalleryState(np.zeros((0, 0), dtype=np.float32),
+                                    np.array([], dtype=object), np.array([], dtype=object))
+
+    def __len__(self):
+        return len(self._state.names)
+
+    def build(self, embeddings, names, families, normalized=False):
+        """Replace the gallery contents"""
+        if len(names) == 0:
+            matrix = np.zeros((0, 0), dtype=np.float32)
+        else:
+            matrix = np.asarray(embeddings, dtype=np.float32) if normalized else normalize_rows(embeddings)
+        index = None
+        if faiss is not None and len(names) >= self.ann_threshold:
+            index = faiss.IndexHNSWFlat(matrix.shape[1], 32, faiss.METRIC_INNER_PRODUCT)
+            index.add(np.ascontiguousarray(matrix))
+        self._state = _GalleryState(matrix, np.asarray(names, dtype=object),
+                                    np.asarray(families, dtype=object), index)
+
+    def search(self, embeddings, k=1):
+        """Return (indices, scores), each (queries, k), best match first"""
+        return self._search(self._state, embeddings, k)
+
+    @staticmethod
+    def _search(state, embeddings, k):
+        queries = normalize_rows(embeddings)
+        k = min(k, len(state.names))
+        if k == 0:
+            empty = np.zeros((len(queries), 0))
+            return empty.astype(int), empty
+        if state.index is not None:
+            scores, indices = state.index.search(queries, k)
+            return indices, scores
+
+        similarities = queries @ state.matrix.T
+        if k == 1:
+            indices = similarities.argmax(axis=1)[:, None]
+        else:
+            # Partial selection, then sort only the k candidates
+            candidates = np.argpartition(-similarities, k - 1, axis=1)[:, :k]
+            order = np.argsort(-np.take_along_axis(similarities, candidates, axis=1), axis=1)
+            indices = np.take_along_axis(candidates, order, axis=1)
+        return indices, np.take_along_axis(similarities, indices, axis=1)
+
+    def top_k(self, embeddings, k=5):
+        """Per query, a list of (name, family, similarity) for the k closest entries"""
+        state = self._state
+        indices, scores = self._search(state, embeddings, k)
+        return [
+            [(state.names[i], state.families[i], float(score))
+             for i, score in zip(row_indices, row_scores) if i >= 0]
+            for row_indices, row_scores in zip(indices, scores)
+        ]
+
+    def match(self, embeddings):
+        """Per query, (name, family, similarity) of the best match above the threshold"""
+        state = self._state
+        indices, scores = self._search(state, embeddings, 1)
+        matches = []
+        for row_indices, row_scores in zip(indices, scores):
+            if len(row_indices) and row_indices[0] >= 0 and row_scores[0] > self.similarity_threshold:
+                i = row_indices[0]
+                matches.append((state.names[i], state.families[i], float(row_scores[0])))
+            else:
+                matches.append((None, None, 0))
+        return matches
@@ -0,0 +1,99 @@
+def person_face_crop(box, frame_shape, upper_fraction=0.4, padding=0.1):
+    """Crop window (x1, y1, x2, y2) covering the head and shoulders of a person box"""
+    x1, y1, x2, y2 = box
+    frame_height, frame_width = frame_shape[:2]
+    pad = int((x2 - x1) * padding)
+    return (max(0, x1 - pad),
+            max(0, y1 - pad),
+            min(frame_width, x2 + pad),
+            min(frame_height, y1 + int((y2 - y1) * upper_fraction)))
+
+
+class TrackIdentity:
+    """Last recognition result for one track"""
+    __slots__ = ("name", "family", "similarity", "face_found", "queried_at", "seen_at")
+
+    def __init__(self, name=None, family=None, similarity=0, face_found=False, queried_at=0):
+        self.name = name
+        self.family = family
+        self.similarity = similarity
+        self.face_found = face_found
+        self.queried_at = queried_at
+        self.seen_at = queried_at
+
+
+class TrackIdentityCache:
+    """Remembers who each ByteTrack ID is, so faces are not re-identified every frame.
+
+    Ages are counted in detection steps. A track is queried when it is new,
+    every ``requery_interval`` steps once recognised with at least
+    ``min_confidence``, and every ``retry_interval`` steps while no face was
+    found or the match was weak. Entries for tracks not seen for
+    ``max_idle`` steps are dropped.
+    """
+
+    def __init__(self, requery_interval=30, retry_interval=5, min_confidence=0.5, max_idle=300):
+        self.requery_interval = requery_interval
+        self.retry_interval = retry_interval
+        self.min_confidence = min_confidence
+        self.max_idle = max_idle
+        self.queries = 0
+        self.hits = 0
+        self.reset()
+
+    def reset(self):
+        self._identities = {}
+        self._last_prune = 0
+
+    def __len__(self):
+        return len(self._identities)
+
+    def get(self, track_id):
+        return self._identities.get(track_id)
+
+    def due(self, track_ids, step):
+        """Return the track IDs that should be sent to face recognition at this step"""
+        due = []
+        for track_id in track_ids:
+            identity = self._identities.get(track_id)
+            if identity is None:
+                due.append(track_id)
+                continue
+            identity.seen_at = step
+            confident = identity.face_found and identity.similarity >= self.min_confidence
+            interval = self.requery_interval if confident else self.retry_interval
+            if step - identity.queried_at >= interval:
+                due.append(track_id)
+            else:
+                self.hits += 1
+        if step - self._last_prune >= self.max_idle:
+            self._prune(step)
+        return due
+
+    def update(self, track_id, step, name=None, family=None, similarity=0, face_found=False):
+        self.queries += 1
+        previous = self._identities.get(track_id)
+        # Keep a confident identity when a later look finds no face (e.g. the person turned away)
+        if not face_found and previous is not None and previous.face_found:
+            previous.queried_at = step
+            previous.seen_at = step
+            return previous
+        identity = TrackIdentity(name, family, similarity, face_found, step)
+        self._identities[track_id] = identity
+        return identity
+
+    def _prune(self, step):
+        self._last_prune = step
+        idle = [track_id for track_id, identity in self._identities.items()
+                if step - identity.seen_at > self.max_idle]
+        for track_id in idle:
+            del self._identities[track_id]
+
+    def stats(self):
+        lookups = self.queries + self.hits
+        return {
+            "tracks": len(self._identities),
+            "queries": self.queries,
+            "cache_hits": self.hits,
+            "hit_ratio": round(self.hits / lookups, 3) if lookups else 0
+        }
@@ -0,0 +1,331 @@
+import atexit
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from multiprocessing import shared_memory
+from multiprocessing.connection import wait
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# A worker that dies sooner than this after starting counts as a crash loop and is restarted with backoff
+WORKER_MIN_UPTIME = 60.0
+MAX_RESTART_DELAY = 60.0
+
+
+def create_face_app(det_size=(640, 480), threads=None):
+    """InsightFace on the CPU; ``threads`` caps the intra-op thread pool of every model session"""
+    from insightface.app import FaceAnalysis
+
+    face_app = FaceAnalysis(providers=['CPUExecutionProvider'])
+    if threads:
+        import onnxruntime
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = threads
+        options.inter_op_num_threads = 1
+        # FaceAnalysis does not pass session options through, so its sessions are reopened with them
+        for model in face_app.models.values():
+            model.session = onnxruntime.InferenceSession(model.model_file, sess_options=options,
+                                                         providers=['CPUExecutionProvider'])
+    face_app.prepare(ctx_id=0, det_size=det_size)
+    return face_app
+
+
+def _worker_main(worker_id, shm_name, slot_shape, det_size, threads, tasks, results):
+    """Worker process: run InsightFace on crops found in shared memory slots"""
+    supervisor = os.getppid()
+    face_app = create_face_app(det_size, threads)
+    shm = shared_memory.SharedMemory(name=shm_name)
+    slots = np.ndarray(slot_shape, dtype=np.uint8, buffer=shm.buf)
+    results.put(("ready", worker_id))
+    try:
+        while True:
+            try:
+                task = tasks.get(timeout=1.0)
+            except queue.Empty:
+                # Exit with the supervisor rather than wait forever on a queue nobody feeds
+                if os.getppid() != supervisor:
+                    break
+                continue
+            if task is None:
+                break
+            job_id, slot, height, width = task
+            try:
+                faces = face_app.get(slots[slot, :height, :width])
+                if faces:
+                    face = max(faces, key=lambda f: (f.bbox[2] - f.bbox[0]) * (f.bbox[3] - f.bbox[1]))
+                    result = (face.bbox.astype(np.float32), face.embedding.astype(np.float32))
+                else:
+                    result = None
+                results.put(("done", job_id, result, None))
+            except Exception as e:
+                results.put(("done", job_id, None, str(e)))
+    finally:
+        del slots
+        shm.close()
+
+
+def _supervise(worker_args, task_queues, results, stopping):
+    """Supervisor process: keep one worker per task queue running, restarting any that die.
+
+    It is forked before the app starts any threads and starts none itself,
+    so forking replacement workers from it is safe at any time.
+    """
+    ctx = multiprocessing.get_context("fork")
+    parent = multiprocessing.parent_process()
+    processes, started, crashes, restart_at = {}, {}, {}, {}
+
+    def launch(worker_id):
+        process = ctx.Process(target=_worker_main, name=f"face-worker-{worker_id}", daemon=True,
+                              args=(worker_id, *worker_args, task_queues[worker_id], results))
+        process.start()
+        processes[worker_id] = process
+        started[worker_id] = time.monotonic()
+
+    for worker_id in range(len(task_queues)):
+        launch(worker_id)
+
+    while processes or restart_at:
+        timeout = max(0.0, min(restart_at.values()) - time.monotonic()) if restart_at else None
+        ready = wait([parent.sentinel] + [p.sentinel for p in processes.values()], timeout)
+        if parent.sentinel in ready:
+            break
+        for worker_id, process in list(processes.items()):
+            if process.sentinel not in ready:
+                continue
+            process.join()
+            del processes[worker_id]
+            if stopping.is_set():
+                continue
+            results.put(("died", worker_id, process.exitcode))
+            # Back off while a worker keeps dying right after it starts, e.g. when its models fail to load
+            uptime = time.monotonic() - started[worker_id]
+            crashes[worker_id] = crashes.get(worker_id, 0) + 1 if uptime < WORKER_MIN_UPTIME else 0
+            restart_at[worker_id] = time.monotonic() + min(MAX_RESTART_DELAY, 2 ** crashes[worker_id])
+        now = time.monotonic()
+        for worker_id, due in list(restart_at.items()):
+            if stopping.is_set():
+                del restart_at[worker_id]
+            elif due <= now:
+                del restart_at[worker_id]
+                launch(worker_id)
+
+    for process in processes.values():
+        process.terminate()
+
+
+class FaceWorkerPool:
+    """InsightFace detection and embedding in separate processes.
+
+    Crops are copied into one of ``max_pending`` preallocated shared-memory
+    slots (downscaled to fit ``slot_size`` if needed) and only the slot
+    index crosses the process boundary, so frames are never pickled.
+    Workers return the largest face's box and embedding; a collector thread
+    frees the slot and hands the result to the submitter's callback. When
+    every slot is busy, ``submit`` returns False instead of blocking, so the
+    streaming thread never waits on face analysis.
+
+    ``start`` forks one supervisor process, which forks the workers and
+    restarts any that die. Forking a process that already runs threads
+    (torch, ONNX Runtime, the app's own) can leave the child holding a lock
+    no thread will release, so ``start`` must run before the app starts
+    threads; the app process never forks again afterwards. Spawned workers
+    would re-run the app module instead, so platforms without fork are not
+    supported. Jobs a dead worker had taken fail with an error and their
+    slots are reused.
+    """
+
+    def __init__(self, workers=2, max_pending=16, slot_size=(320, 320), det_size=(320, 320), threads=1):
+        self.workers = max(1, workers)
+        self.max_pending = max(1, max_pending)
+        self.slot_size = slot_size
+        self.det_size = det_size
+        # ONNX Runtime threads per worker
+        self.threads = threads
+        self._slot_shape = (self.max_pending, slot_size[1], slot_size[0], 3)
+        self._shm = None
+        self._slots = None
+        self._free = []
+        # job_id -> (callback, scale, submitted_at, slot, worker_id)
+        self._jobs = {}
+        self._next_job = 0
+        self._lock = threading.Lock()
+        self._supervisor = None
+        self._collector = None
+        # Workers that reported ready since they were last (re)started
+        self._ready = set()
+        self._supervisor_lost = False
+        self.submitted = 0
+        self.completed = 0
+        self.dropped = 0
+        self.failed = 0
+        self.restarts = 0
+        self.last_lag = 0.0
+        self.total_lag = 0.0
+
+    @property
+    def ready_workers(self):
+        return len(self._ready)
+
+    @property
+    def running(self):
+        """False once the supervisor has exited; callers should then analyse faces themselves"""
+        return self._supervisor is not None and self._supervisor.is_alive()
+
+    def start(self):
+        if self._supervisor is not None:
+            return
+        if "fork" not in multiprocessing.get_all_start_methods():
+            raise RuntimeError("Face worker processes need the fork start method")
+        ctx = multiprocessing.get_context("fork")
+        self._shm = shared_memory.SharedMemory(create=True, size=int(np.prod(self._slot_shape)))
+        self._slots = np.ndarray(self._slot_shape, dtype=np.uint8, buffer=self._shm.buf)
+        self._free = list(range(self.max_pending))
+        # One task queue per worker, so the jobs a dead worker held are known
+        self._tasks = [ctx.Queue() for _ in range(self.workers)]
+        # SimpleQueue writes synchronously, so the supervisor puts without starting a feeder thread
+        self._results = ctx.SimpleQueue()
+        self._stopping = ctx.Event()
+        worker_args = (self._shm.name, self._slot_shape, self.det_size, self.threads)
+        self._supervisor = ctx.Process(target=_supervise, name="face-supervisor",
+                                       args=(worker_args, self._tasks, self._results, self._stopping))
+        self._supervisor.start()
+        # The supervisor is not a daemon (daemons may not fork), so it must be stopped before exit
+        atexit.register(self.stop)
+        self._collector = threading.Thread(target=self._collect, name="face-results", daemon=True)
+        self._collector.start()
+        logger.info(f"Started {self.workers} face recognition workers")
+
+    def stop(self, timeout=5.0):
+        if self._supervisor is None:
+            return
+        self._stopping.set()
+        for tasks in self._tasks:
+            tasks.put(None)
+        self._supervisor.join(timeout)
+        if self._supervisor.is_alive():
+            # Its workers notice it is gone and exit on their own
+            self._supervisor.terminate()
+            self._supervisor.join(timeout)
+        self._supervisor = None
+        self._results.put(None)
+        self._collector.join(timeout)
+        self._fail_jobs(lambda worker_id: True, "face worker pool stopped")
+        self._slots = None
+        self._shm.close()
+        self._shm.unlink()
+        self._shm = None
+
+    def submit(self, crop, callback):
+        """Queue one crop; callback(result, error) later receives (bbox, embedding) or None"""
+        if self._supervisor is None:
+            return False
+        if not self.running:
+            self._on_supervisor_lost()
+            return False
+        with self._lock:
+            if not self._free or not self._ready:
+                self.dropped += 1
+                return False
+            slot = self._free.pop()
+            job_id = self._next_job
+            self._next_job += 1
+            # Least loaded ready worker
+            load = {worker_id: 0 for worker_id in self._ready}
+            for job in self._jobs.values():
+                if job[4] in load:
+                    load[job[4]] += 1
+            worker_id = min(load, key=load.get)
+
+        height, width = crop.shape[:2]
+        scale = min(1.0, self.slot_size[0] / width, self.slot_size[1] / height)
+        if scale < 1.0:
+            width, height = max(1, int(width * scale)), max(1, int(height * scale))
+            cv2.resize(crop, (width, height), dst=self._slots[slot, :height, :width],
+                       interpolation=cv2.INTER_AREA)
+        else:
+            self._slots[slot, :height, :width] = crop
+
+        with self._lock:
+            self._jobs[job_id] = (callback, scale, time.perf_counter(), slot, worker_id)
+            self.submitted += 1
+        self._tasks[worker_id].put((job_id, slot, height, width))
+        return True
+
+    def _collect(self):
+        while True:
+            message = self._results.get()
+            if message is None:
+                break
+            kind = message[0]
+            if kind == "ready":
+                with self._lock:
+                    self._ready.add(message[1])
+            elif kind == "died":
+                _, dead_worker, exitcode = message
+                logger.warning(f"Face worker {dead_worker} exited with code {exitcode}; restarting it")
+                with self._lock:
+                    self._ready.discard(dead_worker)
+                    self.restarts += 1
+                self._fail_jobs(lambda worker_id: worker_id == dead_worker, f"face worker {dead_worker} died")
+            else:
+                _, job_id, result, error = message
+                self._finish(job_id, result, error)
+
+    def _on_supervisor_lost(self):
+        with self._lock:
+            if self._supervisor_lost:
+                return
+            self._supervisor_lost = True
+            self._ready.clear()
+        logger.error(f"Face worker supervisor exited with code {self._supervisor.exitcode}")
+        self._fail_jobs(lambda worker_id: True, "face worker supervisor exited")
+
+    def _fail_jobs(self, match, error):
+        with self._lock:
+            job_ids = [job_id for job_id, job in self._jobs.items() if match(job[4])]
+        for job_id in job_ids:
+            self._finish(job_id, None, error)
+
+    def _finish(self, job_id, result, error):
+        with self._lock:
+            job = self._jobs.pop(job_id, None)
+            if job is None:
+                # Already failed because its worker died; the slot has been reused
+                return
+            callback, scale, submitted_at, slot, _ = job
+            self._free.append(slot)
+            lag = time.perf_counter() - submitted_at
+            self.completed += 1
+            self.last_lag = lag
+            self.total_lag += lag
+            if error:
+                self.failed += 1
+        if result is not None and scale != 1.0:
+            # Boxes come back in slot coordinates
+            result = (result[0] / scale, result[1])
+        try:
+            callback(result, error)
+        except Exception as e:
+            logger.error(f"Face result callback failed: {e}")
+
+    def stats(self):
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "ready_workers": len(self._ready),
+                "restarts": self.restarts,
+                "pending": self.max_pending - len(self._free),
+                "max_pending": self.max_pending,
+                "submitted": self.submitted,
+                "completed": self.completed,
+                "dropped": self.dropped,
+                "failed": self.failed,
+                "last_lag_ms": round(self.last_lag * 1000, 1),
+                "avg_lag_ms": round(1000 * self.total_lag / self.completed, 1) if self.completed else 0
+            }
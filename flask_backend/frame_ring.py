@@ -0,0 +1,103 @@
+import logging
+import threading
+from multiprocessing import shared_memory
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class FrameRing:
+    """Preallocated frame slots that pipeline stages pass around by index.
+
+    The decoder reads straight into a free slot and every later stage holds
+    a reference to that slot instead of its own copy of the frame. A slot
+    returns to the free list once every holder has released it, so no frame
+    memory is allocated once the ring exists. With ``shared=True`` the slots
+    live in a ``multiprocessing.shared_memory`` block that other processes
+    can map with ``attach`` using only the block name and the slot index.
+    """
+
+    def __init__(self, shape, slots=8, shared=False, dtype=np.uint8):
+        self.shape = tuple(shape)
+        self.slots = max(2, slots)
+        self.dtype = np.dtype(dtype)
+        self._shm = None
+        full_shape = (self.slots,) + self.shape
+        if shared:
+            size = int(np.prod(full_shape)) * self.dtype.itemsize
+            self._shm = shared_memory.SharedMemory(create=True, size=size)
+            self.frames = np.ndarray(full_shape, dtype=self.dtype, buffer=self._shm.buf)
+        else:
+            self.frames = np.empty(full_shape, dtype=self.dtype)
+        self._refs = [0] * self.slots
+        self._free = list(range(self.slots - 1, -1, -1))
+        self._lock = threading.Lock()
+        self.exhausted = 0
+
+    @property
+    def name(self):
+        """Shared memory block name, or None for a process-local ring"""
+        return self._shm.name if self._shm is not None else None
+
+    @classmethod
+    def attach(cls, name, shape, slots, dtype=np.uint8):
+        """Map another process's shared ring; returns (SharedMemory, frames array)"""
+        shm = shared_memory.SharedMemory(name=name)
+        frames = np.ndarray((slots,) + tuple(shape), dtype=dtype, buffer=shm.buf)
+        return shm, frames
+
+    def acquire(self, holders=1):
+        """Reserve a free slot for ``holders`` consumers; returns None when all are in use"""
+        with self._lock:
+            if not self._free:
+                self.exhausted += 1
+                return None
+            slot = self._free.pop()
+            self._refs[slot] = holders
+            return slot
+
+    def retain(self, slot):
+        with self._lock:
+            self._refs[slot] += 1
+
+    def release(self, slot):
+        with self._lock:
+            self._refs[slot] -= 1
+            if self._refs[slot] == 0:
+                self._free.append(slot)
+            elif self._refs[slot] < 0:
+                self._refs[slot] = 0
+                logger.warning(f"Frame slot {slot} released more often than acquired")
+
+    def discard(self, slot):
+        """Return a slot to the free list regardless of its holders, e.g. after a failed read"""
+        with self._lock:
+            if self._refs[slot] > 0:
+                self._refs[slot] = 0
+                self._free.append(slot)
+
+    def holders(self, slot):
+        return self._refs[slot]
+
+    def close(self):
+        """Free the shared memory block; slots must not be used afterwards"""
+        if self._shm is None:
+            return
+        self.frames = None
+        try:
+            self._shm.close()
+        except BufferError:
+            # A straggling view still maps the block; it is unmapped once collected
+            logger.warning("Frame ring closed while a slot view was still alive")
+        self._shm.unlink()
+        self._shm = None
+
+    def stats(self):
+        with self._lock:
+            return {
+                "slots": self.slots,
+                "in_use": self.slots - len(self._free),
+                "exhausted": self.exhausted,
+                "shared": self._shm is not None
+            }
@@ -0,0 +1,188 @@
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import torch
+from ultralytics.trackers.byte_tracker import BYTETracker
+from ultralytics.utils import IterableSimpleNamespace, yaml_load
+from ultralytics.utils.checks import check_yaml
+
+logger = logging.getLogger(__name__)
+
+
+def create_tracker(tracker_cfg="bytetrack.yaml", frame_rate=30):
+    """Build a standalone ByteTrack instance for one video source"""
+    cfg = IterableSimpleNamespace(**yaml_load(check_yaml(tracker_cfg)))
+    return BYTETracker(args=cfg, frame_rate=frame_rate)
+
+
+def apply_tracker(tracker, result, frame):
+    """Attach track IDs to a detection result, the same way YOLO.track() does"""
+    det = result.boxes.cpu().numpy()
+    if len(det) == 0:
+        return result
+    tracks = tracker.update(det, frame)
+    if len(tracks) == 0:
+        return result
+    idx = tracks[:, -1].astype(int)
+    result = result[idx]
+    result.update(boxes=torch.as_tensor(tracks[:, :-1]))
+    return result
+
+
+class _InferenceRequest:
+    __slots__ = ("frame", "tracker", "imgsz", "future", "submitted_at")
+
+    def __init__(self, frame, tracker, imgsz):
+        self.frame = frame
+        self.tracker = tracker
+        self.imgsz = imgsz
+        self.future = Future()
+        self.submitted_at = time.perf_counter()
+
+
+class BatchInferenceScheduler:
+    """Gathers frames from every active source into batched YOLO calls.
+
+    A worker takes the first pending frame, then keeps collecting until it
+    has ``max_batch_size`` frames or ``max_wait`` seconds have passed, runs a
+    single predict() over the batch (one per distinct ``imgsz``) and hands
+    each result back through the submitting source's own ByteTrack instance.
+    One worker is started per pooled model instance.
+    """
+
+    def __init__(self, registry, max_batch_size=4, max_wait=0.02,
+                 conf=0.35, iou=0.45, imgsz=640, classes=(0,)):
+        self.registry = registry
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait
+        self.predict_args = {
+            "conf": conf,
+            "iou": iou,
+            "imgsz": imgsz,
+            "classes": list(classes) if classes is not None else None,
+            "verbose": False
+        }
+        self._requests = queue.Queue()
+        self._stop_event = threading.Event()
+        self._threads = []
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.batches = 0
+        self.frames = 0
+        self.total_batch_time = 0.0
+        self.total_queue_time = 0.0
+        self._started_at = None
+
+    def start(self):
+        with self._start_lock:
+            if self._threads:
+                return
+            self._stop_event.clear()
+            self._started_at = time.time()
+            for i in range(self.registry.pool_size):
+                thread = threading.Thread(target=self._run, name=f"inference-batch-{i}", daemon=True)
+                self._threads.append(thread)
+                thread.start()
+
+    def stop(self, timeout=2.0):
+        self._stop_event.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def submit(self, frame, tracker=None, imgsz=None):
+        """Queue a frame for detection; the returned Future resolves to a Results object"""
+        self.start()
+        request = _InferenceRequest(frame, tracker, imgsz or self.predict_args["imgsz"])
+        self._requests.put(request)
+        return request.future
+
+    def _collect_batch(self):
+        try:
+            first = self._requests.get(timeout=0.5)
+        except queue.Empty:
+            return []
+        batch = [first]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._requests.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            batch = self._collect_batch()
+            # Sources that the adaptive controller has scaled down run at their own input size
+            groups = {}
+            for request in batch:
+                groups.setdefault(request.imgsz, []).append(request)
+            for imgsz, group in groups.items():
+                self._process(group, imgsz)
+
+    def _process(self, batch, imgsz):
+        started = time.perf_counter()
+        try:
+            results = self.registry.run("predict", [r.frame for r in batch],
+                                        **{**self.predict_args, "imgsz": imgsz})
+        except Exception as e:
+            logger.error(f"Batched inference failed: {e}")
+            for request in batch:
+                request.future.set_exception(e)
+            return
+
+        elapsed = time.perf_counter() - started
+        with self._stats_lock:
+            self.batches += 1
+            self.frames += len(batch)
+            self.total_batch_time += elapsed
+            self.total_queue_time += sum(started - r.submitted_at for r in batch)
+
+        for request, result in zip(batch, results):
+            try:
+                if request.tracker is not None:
+                    result = apply_tracker(request.tracker, result, request.frame)
+                request.future.set_result(result)
+            except Exception as e:
+                request.future.set_exception(e)
+
+    def stats(self):
+        with self._stats_lock:
+            uptime = time.time() - self._started_at if self._started_at else 0
+            return {
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": round(self.max_wait * 1000, 1),
+                "batches": self.batches,
+                "frames": self.frames,
+                "avg_batch_size": round(self.frames / self.batches, 2) if self.batches else 0,
+                "avg_batch_ms": round(1000 * self.total_batch_time / self.batches, 2) if self.batches else 0,
+                "avg_queue_ms": round(1000 * self.total_queue_time / self.frames, 2) if self.frames else 0,
+                "pending": self._requests.qsize(),
+                "fps": round(self.frames / uptime, 2) if uptime else 0
+            }
+
+
+class SourceDetector:
+    """Per-source front end to the batch scheduler with its own ByteTrack state"""
+
+    def __init__(self, scheduler, tracker_cfg="bytetrack.yaml", frame_rate=30):
+        self.scheduler = scheduler
+        self.tracker_cfg = tracker_cfg
+        # None uses the scheduler's default input size
+        self.imgsz = None
+        self.reset(frame_rate)
+
+    def reset(self, frame_rate=30):
+        """Start a fresh tracker so IDs from a previous capture are not reused"""
+        self.tracker = create_tracker(self.tracker_cfg, frame_rate)
+
+    def detect(self, frame, timeout=None):
+        """Detect and track people in one frame, blocking until its batch completes"""
+        return self.scheduler.submit(frame, self.tracker, self.imgsz).result(timeout)
@@ -0,0 +1,126 @@
+import json
+import os
+
+import numpy as np
+
+
+class CountingLine:
+    """A directed line in normalised (0-1) frame coordinates.
+
+    Looking from ``start`` towards ``end``, a track that crosses from the
+    right-hand side to the left-hand side counts as "in"; the opposite
+    direction counts as "out". Swap the endpoints to flip the direction.
+    """
+    __slots__ = ("name", "start", "end")
+
+    def __init__(self, name, start, end):
+        self.name = name
+        self.start = np.asarray(start, dtype=np.float32)
+        self.end = np.asarray(end, dtype=np.float32)
+        if self.start.shape != (2,) or self.end.shape != (2,):
+            raise ValueError(f"Line {name!r} needs (x, y) start and end points")
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["name"], data["start"], data["end"])
+
+
+def load_lines(config):
+    """Parse counting lines from a list of {"name", "start", "end"} dicts or a JSON file path"""
+    if not config:
+        return []
+    if isinstance(config, str):
+        with open(config) as f:
+            config = json.load(f)
+    return [line if isinstance(line, CountingLine) else CountingLine.from_dict(line) for line in config]
+
+
+def default_lines():
+    """Lines configured through COUNTING_LINES (path to a JSON file), if any"""
+    path = os.environ.get("COUNTING_LINES")
+    return load_lines(path) if path else []
+
+
+def _cross(ax, ay, bx, by):
+    return ax * by - ay * bx
+
+
+class LineCounter:
+    """Cumulative entry/exit counts for directed lines, driven by track IDs.
+
+    The previous centroid of each track lives in a fixed-size ring indexed
+    by ``track_id % capacity``; the stored ID tells whether a slot still
+    belongs to that track, so old tracks are overwritten rather than
+    evicted. Each step tests every moving track against every line as one
+    broadcast segment-intersection over an (tracks, lines) grid.
+    """
+
+    def __init__(self, lines, capacity=4096):
+        self.lines = list(lines)
+        self.capacity = capacity
+        self.in_counts = np.zeros(len(self.lines), dtype=np.int64)
+        self.out_counts = np.zeros(len(self.lines), dtype=np.int64)
+        self.segments = None
+        self.reset()
+
+    def __len__(self):
+        return len(self.lines)
+
+    def reset(self):
+        """Forget track positions (track IDs restart); cumulative counts are kept"""
+        self._track_ids = np.full(self.capacity, -1, dtype=np.int64)
+        self._positions = np.zeros((self.capacity, 2), dtype=np.float32)
+
+    def reset_counts(self):
+        self.in_counts[:] = 0
+        self.out_counts[:] = 0
+
+    def build(self, frame_width, frame_height):
+        """Scale the lines to a frame size"""
+        scale = np.array([frame_width - 1, frame_height - 1], dtype=np.float32)
+        # (lines, 2 endpoints, xy) in pixels
+        self.segments = np.stack([np.stack([line.start, line.end]) * scale for line in self.lines])
+
+    def update(self, track_ids, centroids):
+        """Record the current centroids and count line crossings since the last step"""
+        if len(track_ids) == 0:
+            return
+        slots = track_ids % self.capacity
+        known = self._track_ids[slots] == track_ids
+        previous = self._positions[slots]
+        current = centroids.astype(np.float32)
+        self._track_ids[slots] = track_ids
+        self._positions[slots] = current
+
+        moved = known & np.any(previous != current, axis=1)
+        if not moved.any():
+            return
+        p = previous[moved][:, None, :]
+        q = current[moved][:, None, :]
+        a = self.segments[None, :, 0, :]
+        b = self.segments[None, :, 1, :]
+
+        # True when a centroid is on the right-hand side in image coordinates (y down);
+        # a point exactly on the line counts as the left side
+        ab = b - a
+        side_p = _cross(ab[..., 0], ab[..., 1], p[..., 0] - a[..., 0], p[..., 1] - a[..., 1]) > 0
+        side_q = _cross(ab[..., 0], ab[..., 1], q[..., 0] - a[..., 0], q[..., 1] - a[..., 1]) > 0
+        # The movement must also pass between the line's endpoints
+        pq = q - p
+        d_a = _cross(pq[..., 0], pq[..., 1], a[..., 0] - p[..., 0], a[..., 1] - p[..., 1])
+        d_b = _cross(pq[..., 0], pq[..., 1], b[..., 0] - p[..., 0], b[..., 1] - p[..., 1])
+        within = d_a * d_b <= 0
+
+        crossed = within & (side_p != side_q)
+        self.in_counts += (crossed & side_p).sum(axis=0)
+        self.out_counts += (crossed & side_q).sum(axis=0)
+
+    def totals(self):
+        return int(self.in_counts.sum()), int(self.out_counts.sum())
+
+    def stats(self):
+        """Cumulative in/out counts per line"""
+        return {
+            line.name: {"in": int(count_in), "out": int(count_out)}
+            for line, count_in, count_out in zip(self.lines, self.in_counts, self.out_counts)
+        }
@@ -0,0 +1,213 @@
+import argparse
+import http.client
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+
+def _connect(base):
+    parts = urlsplit(base)
+    connection_class = http.client.HTTPSConnection if parts.scheme == "https" else http.client.HTTPConnection
+    return connection_class(parts.hostname, parts.port, timeout=30)
+
+
+class StreamViewer(threading.Thread):
+    """Reads a stream as fast as a browser would, counting bytes and the messages starting with ``marker``
+
+    The default marker counts MJPEG frames; ``b"event: stats"`` counts Server-Sent Events.
+    """
+
+    def __init__(self, base, path, stop, marker=b"--frame"):
+        super().__init__(daemon=True)
+        self.base = base
+        self.path = path
+        self.stop = stop
+        self.marker = marker
+        self.bytes = 0
+        self.frames = 0
+        self.error = None
+
+    def run(self):
+        try:
+            connection = _connect(self.base)
+            connection.request("GET", self.path)
+            response = connection.getresponse()
+            if response.status != 200:
+                self.error = f"HTTP {response.status}"
+                return
+            while not self.stop.is_set():
+                chunk = response.read1(65536)
+                if not chunk:
+                    break
+                self.bytes += len(chunk)
+                self.frames += chunk.count(self.marker)
+            connection.close()
+        except Exception as e:
+            self.error = str(e)
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def measure(base, path, requests, concurrency):
+    """Latencies in ms of ``requests`` GETs spread over ``concurrency`` keep-alive connections"""
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+    per_client = max(1, requests // concurrency)
+
+    def client():
+        connection = _connect(base)
+        for _ in range(per_client):
+            started = time.perf_counter()
+            try:
+                connection.request("GET", path)
+                response = connection.getresponse()
+                body = response.read()
+                elapsed = (time.perf_counter() - started) * 1000
+                if response.status != 200 or not json.loads(body).get("success"):
+                    raise ValueError(f"HTTP {response.status}")
+            except Exception as e:
+                with lock:
+                    errors.append(str(e))
+                connection.close()
+                connection = _connect(base)
+                continue
+            with lock:
+                latencies.append(elapsed)
+        connection.close()
+
+    threads = [threading.Thread(target=client, daemon=True) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, errors
+
+
+class _SmokeHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Send headers and body in one segment; separate small writes stall on delayed ACKs
+    wbufsize = 65536
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.startswith("/video_feed"):
+            self.send_response(200)
+            self.send_header("Content-Type", "multipart/x-mixed-replace; boundary=frame")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            frame = b"--frame\r\nContent-Type: image/jpeg\r\n\r\n" + b"\xff" * 4096 + b"\r\n"
+            try:
+                while True:
+                    self.wfile.write(frame)
+                    self.wfile.flush()
+                    time.sleep(0.05)
+            except OSError:
+                return
+        if self.path.startswith("/api/stats/stream"):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            try:
+                for version in range(1, 1000):
+                    self.wfile.write(f"id: smoke:{version}\nevent: stats\ndata: {{}}\n\n".encode())
+                    self.wfile.flush()
+                    time.sleep(0.5)
+            except OSError:
+                pass
+            return
+        body = json.dumps({"success": True, "stats": {"people_count": 0}}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def start_smoke_server():
+    """Local stand-in for the app (MJPEG stream, JSON stats and stats events) to check this harness itself"""
+    class Server(ThreadingHTTPServer):
+        # Every viewer connects at once
+        request_queue_size = 256
+        daemon_threads = True
+
+    server = Server(("127.0.0.1", 0), _SmokeHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Check /api/stats latency while many viewers and dashboards hold streams open")
+    parser.add_argument("--url", default="http://127.0.0.1:5001", help="Server base URL")
+    parser.add_argument("--viewers", type=int, default=50, help="Concurrent /video_feed viewers")
+    parser.add_argument("--stream-path", default="/video_feed")
+    parser.add_argument("--dashboards", type=int, default=10,
+                        help="Concurrent Server-Sent Events subscribers of --events-path")
+    parser.add_argument("--events-path", default="/api/stats/stream")
+    parser.add_argument("--stats-path", default="/api/stats")
+    parser.add_argument("--requests", type=int, default=1000, help="Total /api/stats requests")
+    parser.add_argument("--concurrency", type=int, default=4, help="Parallel /api/stats clients")
+    parser.add_argument("--warmup", type=float, default=5.0, help="Seconds to let the viewers connect")
+    parser.add_argument("--max-p99-ms", type=float, default=100.0,
+                        help="Exit non-zero if the p99 latency exceeds this")
+    parser.add_argument("--smoke", action="store_true",
+                        help="Run against a built-in stand-in server instead of --url")
+    args = parser.parse_args()
+    if args.smoke:
+        args.url = start_smoke_server()
+
+    baseline, errors = measure(args.url, args.stats_path, min(200, args.requests), args.concurrency)
+    if not baseline:
+        print(f"No successful {args.stats_path} requests: {errors[:3]}")
+        return 2
+    print(f"Idle: p50 {percentile(baseline, 0.5):.1f} ms, p99 {percentile(baseline, 0.99):.1f} ms")
+
+    stop = threading.Event()
+    viewers = [StreamViewer(args.url, args.stream_path, stop) for _ in range(args.viewers)]
+    dashboards = [StreamViewer(args.url, args.events_path, stop, marker=b"event: stats")
+                  for _ in range(args.dashboards)]
+    for viewer in viewers + dashboards:
+        viewer.start()
+    time.sleep(args.warmup)
+    started = time.time()
+    latencies, errors = measure(args.url, args.stats_path, args.requests, args.concurrency)
+    duration = time.time() - started
+    stop.set()
+
+    streaming = [viewer for viewer in viewers if viewer.frames and viewer.error is None]
+    frames = sum(viewer.frames for viewer in viewers)
+    print(f"{len(streaming)}/{args.viewers} viewers streaming, "
+          f"{frames / max(1, len(viewers)) / (args.warmup + duration):.1f} fps each on average")
+    subscribed = [dashboard for dashboard in dashboards if dashboard.frames and dashboard.error is None]
+    if dashboards:
+        print(f"{len(subscribed)}/{args.dashboards} dashboards receiving stats events")
+    for viewer in viewers + dashboards:
+        if viewer.error:
+            print(f"Viewer error: {viewer.error}")
+            break
+    if not latencies:
+        print(f"No successful {args.stats_path} requests under load: {errors[:3]}")
+        return 2
+
+    p99 = percentile(latencies, 0.99)
+    print(f"Under load: {len(latencies)} requests, {len(errors)} errors, "
+          f"p50 {percentile(latencies, 0.5):.1f} ms, p95 {percentile(latencies, 0.95):.1f} ms, "
+          f"p99 {p99:.1f} ms, max {max(latencies):.1f} ms")
+    passed = (p99 <= args.max_p99_ms and not errors and len(streaming) == args.viewers
+              and len(subscribed) == args.dashboards)
+    print("PASS" if passed else "FAIL")
+    return 0 if passed else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,129 @@
+import logging
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+from ultralytics import YOLO
+
+logger = logging.getLogger(__name__)
+
+
+class ModelRegistry:
+    """Process-wide owner of the YOLO weights.
+
+    The detector is loaded, fused and warmed up once, then lent out to
+    analysis sessions from a small pool. Each instance is used by one caller
+    at a time; load time and per-call latency are recorded for /api/stats.
+    """
+
+    def __init__(self, weights="model.pt", pool_size=1, warmup_imgsz=640):
+        self.weights = weights
+        self.pool_size = max(1, pool_size)
+        self.warmup_imgsz = warmup_imgsz
+        self._pool = queue.Queue()
+        self._load_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.loaded = False
+        self.load_time = 0.0
+        self.warmup_time = 0.0
+        self.calls = 0
+        self.total_call_time = 0.0
+        self.max_call_time = 0.0
+        self.last_call_time = 0.0
+        self.total_wait_time = 0.0
+
+    def load(self):
+        """Load, fuse and warm every pooled instance; safe to call repeatedly"""
+        with self._load_lock:
+            if self.loaded:
+                return
+            started = time.perf_counter()
+            models = []
+            for _ in range(self.pool_size):
+                model = YOLO(self.weights)
+                try:
+                    model.fuse()
+                except Exception as e:
+                    logger.warning(f"Could not fuse YOLO model: {e}")
+                models.append(model)
+            self.load_time = time.perf_counter() - started
+
+            started = time.perf_counter()
+            dummy = np.zeros((self.warmup_imgsz, self.warmup_imgsz, 3), dtype=np.uint8)
+            for model in models:
+                model.predict(dummy, imgsz=self.warmup_imgsz, verbose=False)
+            self.warmup_time = time.perf_counter() - started
+
+            for model in models:
+                self._pool.put(model)
+            self.loaded = True
+            logger.info(f"YOLO model loaded ({self.pool_size} instance(s)) in {self.load_time:.2f}s, "
+                        f"warm-up {self.warmup_time:.2f}s")
+
+    @contextmanager
+    def acquire(self):
+        """Borrow a model instance for exclusive use"""
+        self.load()
+        started = time.perf_counter()
+        model = self._pool.get()
+        waited = time.perf_counter() - started
+        with self._stats_lock:
+            self.total_wait_time += waited
+        try:
+            yield model
+        finally:
+            self._pool.put(model)
+
+    def run(self, method, *args, **kwargs):
+        """Call a model method on a pooled instance and record its latency"""
+        with self.acquire() as model:
+            started = time.perf_counter()
+            result = getattr(model, method)(*args, **kwargs)
+            elapsed = time.perf_counter() - started
+        with self._stats_lock:
+            self.calls += 1
+            self.total_call_time += elapsed
+            self.last_call_time = elapsed
+            self.max_call_time = max(self.max_call_time, elapsed)
+        return result
+
+    def shared(self):
+        """Return a lightweight handle that forwards calls to the pool"""
+        return SharedModel(self)
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                "weights": self.weights,
+                "loaded": self.loaded,
+                "pool_size": self.pool_size,
+                "load_ms": round(self.load_time * 1000, 1),
+                "warmup_ms": round(self.warmup_time * 1000, 1),
+                "calls": self.calls,
+                "avg_call_ms": round(1000 * self.total_call_time / self.calls, 2) if self.calls else 0,
+                "last_call_ms": round(self.last_call_time * 1000, 2),
+                "max_call_ms": round(self.max_call_time * 1000, 2),
+                "avg_wait_ms": round(1000 * self.total_wait_time / self.calls, 2) if self.calls else 0
+            }
+
+
+class SharedModel:
+    """Stand-in for a YOLO instance that borrows one from the registry per call"""
+
+    def __init__(self, registry):
+        self.registry = registry
+
+    def track(self, *args, **kwargs):
+        return self.registry.run("track", *args, **kwargs)
+
+    def predict(self, *args, **kwargs):
+        return self.registry.run("predict", *args, **kwargs)
+
+
+registry = ModelRegistry(
+    weights=os.environ.get("YOLO_WEIGHTS", "model.pt"),
+    pool_size=int(os.environ.get("YOLO_POOL_SIZE", "1"))
+)
@@ -1,18 +1,42 @@
 from flask import Flask, render_template, request, send_file, Response, jsonify
 import os
 from werkzeug.utils import secure_filename
-from ultralytics import YOLO
 import cv2
 import time
 import json
-from datetime import datetime
+from datetime import datetime, timedelta
 import numpy as np
 from flask_cors import CORS
-import threading
 import logging
 import yt_dlp
 from urllib.parse import urlparse, parse_qs
+from face_workers import FaceWorkerPool
+
+# FACE_WORKERS > 0 runs face analysis in worker processes instead of the frame loop. The pool
+# forks here, before the imports below load torch and ONNX Runtime or anything starts threads.
+face_worker_pool = None
+if int(os.environ.get("FACE_WORKERS", "0")) > 0:
+    try:
+        face_worker_pool = FaceWorkerPool(
+            workers=int(os.environ.get("FACE_WORKERS", "0")),
+            max_pending=int(os.environ.get("FACE_MAX_PENDING", "16"))
+        )
+        face_worker_pool.start()
+    except Exception as e:
+        logging.getLogger(__name__).error(f"Face worker pool unavailable, analysing faces in-stream: {e}")
+        face_worker_pool = None
+
 from video_face_recognition import VideoFaceRecognition
+from overlay import OverlayRenderer
+from zones import default_zones, load_zones
+from line_counter import default_lines, load_lines
+from session_manager import SessionManager, SessionLimitError
+from model_registry import registry as model_registry
+from inference_scheduler import BatchInferenceScheduler, SourceDetector
+from adaptive_control import AdaptiveStrideController
+from motion_gate import MotionGate
+from frame_ring import FrameRing
+from stream_socket import StreamConnection
 from data_management import storage
 from reportlab.lib import colors
 from reportlab.lib.pagesizes import letter, A4
@@ -21,24 +45,19 @@ from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, Tabl
 from reportlab.lib.units import inch
 from io import BytesIO
 
-location = None
-frame_count = None
+# WebSocket streaming is optional: pip install flask-sock
+try:
+    from flask_sock import Sock
+except ImportError:
+    Sock = None
+
 face_recognition_active = False
 face_recognition_system = None
-video_path = None
-output_frame = None
-processing_complete = False
-stream_lock = threading.Lock()
-current_stats = {
-    "people_count": 0,
-    "avg_dwell_time": 0,
-    "highest_dwell_time": 0,
-    "location": "Divisoria",
-    "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-}
 video_initialization_error = None
 model = None
-current_video_title = None
+
+# Source used by the single-stream routes (/video_feed, /process_sample, ...)
+DEFAULT_SOURCE_ID = "default"
 
 # Configure logging
 logging.basicConfig(level=logging.INFO,
@@ -57,28 +76,31 @@ CORS(app, resources={
 
 # Initialize face recognition system
 try:
-    face_recognition_system = VideoFaceRecognition()
+    face_recognition_system = VideoFaceRecognition(worker_pool=face_worker_pool)
     logger.info("Face recognition system initialized successfully")
 except Exception as e:
     logger.error(f"Error initializing face recognition system: {e}")
     face_recognition_system = None
+    if face_worker_pool is not None:
+        face_worker_pool.stop()
 
 # Define upload folder and allowed extensions
 UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'uploads')
 ALLOWED_EXTENSIONS = {'mp4', 'avi', 'mov'}
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 
-# Global variables for video streaming
-stream_lock = threading.Lock()  # Add lock for thread safety
-video_initialization_error = None
-model = None
-current_video_title = None
+# Frames from every active source are detected together in batches
+inference_scheduler = BatchInferenceScheduler(
+    model_registry,
+    max_batch_size=int(os.environ.get("INFERENCE_BATCH_SIZE", "4")),
+    max_wait=float(os.environ.get("INFERENCE_BATCH_WAIT_MS", "20")) / 1000
+)
 
 def initialize_yolo():
     global model, video_initialization_error
     try:
-        model = YOLO("model.pt")
-        logger.info("YOLO model loaded successfully")
+        model_registry.load()
+        model = model_registry.shared()
         return True
     except Exception as e:
         error_msg = f"Error loading YOLO model: {str(e)}"
@@ -87,7 +109,7 @@ def initialize_yolo():
         return False
 
 def initialize_video(video_file):
-    global video_path, video_initialization_error
+    global video_initialization_error
     try:
         cap = cv2.VideoCapture(video_file)
         if not cap.isOpened():
@@ -99,7 +121,6 @@ def initialize_video(video_file):
         fps = int(cap.get(cv2.CAP_PROP_FPS))
         
         cap.release()
-        video_path = video_file
         video_initialization_error = None
         logger.info(f"Video initialized: {video_file}, {frame_width}x{frame_height} @ {fps}fps")
         return True
@@ -109,42 +130,39 @@ def initialize_video(video_file):
         video_initialization_error = error_msg
         return False
 
-# Stats exporter class remains unchanged
 class StatsExporter:
     def __init__(self, location="Divisoria", export_interval=3):
         self.location = location
         self.last_export_time = time.time()
         self.export_interval = export_interval
+        self.last_entries = 0
+        self.last_exits = 0
         
     def should_export(self, current_time):
         return (current_time - self.last_export_time) >= self.export_interval
     
-    def export_stats(self, people_count, avg_dwell_time):
-        global current_stats
-        current_datetime = datetime.now()
-        
+    def export_stats(self, people_count, avg_dwell_time, highest_dwell_time=0, entries=None, exits=None):
         # Set avg_dwell_time to 0 if people_count is 0
         if people_count == 0:
             avg_dwell_time = 0
-            
+
+        data = {
+            'people_count': people_count,
+            'avg_dwell_time': round(avg_dwell_time, 2) if avg_dwell_time else 0,
+            'highest_dwell_time': round(highest_dwell_time, 2),
+            'location': self.location
+        }
+        # Line crossings are exported as the change since the previous sample
+        if entries is not None:
+            data['entries'] = entries - self.last_entries
+            data['exits'] = exits - self.last_exits
+
         # Add data to Firestore
         try:
-            new_stats = storage.add_foot_traffic_data({
-                'people_count': people_count,
-                'avg_dwell_time': round(avg_dwell_time, 2) if avg_dwell_time else 0,
-                'highest_dwell_time': current_stats["highest_dwell_time"],
-                'location': self.location
-            })
-            
-            # Update current stats
-            current_stats.update({
-                "people_count": people_count,
-                "avg_dwell_time": round(avg_dwell_time, 2) if avg_dwell_time else 0,
-                "highest_dwell_time": current_stats["highest_dwell_time"],
-                "location": self.location,
-                "timestamp": current_datetime.strftime("%Y-%m-%d %H:%M:%S")
-            })
+            new_stats = storage.add_foot_traffic_data(data)
             
+            if entries is not None:
+                self.last_entries, self.last_exits = entries, exits
             self.last_export_time = time.time()
             return True
         except Exception as e:
@@ -158,29 +176,37 @@ def allowed_file(filename):
 def hello():
     return render_template('index.html')
 
-def is_point_in_region(point, region):
-    """Check if a point (x,y) is inside the counting region"""
-    x, y = point
-    rx1, ry1, rx2, ry2 = region
-    return rx1 < x < rx2 and ry1 < y < ry2
+def empty_stats(location=""):
+    """Stats reported while no source is being analysed"""
+    return {
+        "people_count": 0,
+        "avg_dwell_time": 0,
+        "highest_dwell_time": 0,
+        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "location": location
+    }
 
 def reset_stream():
-    """Reset all stream-related variables"""
-    global video_path, output_frame, processing_complete, current_stats, video_initialization_error, current_video_title
-    with stream_lock:
-        video_path = None
-        output_frame = None
-        processing_complete = False
+    """Stop the default source and clear its initialization error"""
+    global video_initialization_error
+    session_manager.stop(DEFAULT_SOURCE_ID)
+    video_initialization_error = None
+    logger.info("Stream and stats reset successfully")
+
+def start_default_source(source, title=None, location=None):
+    """Replace the default source with a new one"""
+    global video_initialization_error
+    try:
+        session_manager.start(source, title=title, location=location, source_id=DEFAULT_SOURCE_ID,
+                              zones=default_zones(), lines=default_lines())
         video_initialization_error = None
-        current_video_title = None
-        current_stats = {
-            "people_count": 0,
-            "avg_dwell_time": 0,
-            "highest_dwell_time": 0,
-            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            "location": ""
-        }
-        logger.info("Stream and stats reset successfully")
+        return True
+    except SessionLimitError:
+        raise
+    except Exception as e:
+        video_initialization_error = str(e)
+        logger.error(f"Error starting analysis session: {e}")
+        return False
 
 @app.route('/stop_stream', methods=['POST'])
 def stop_stream():
@@ -190,25 +216,32 @@ def stop_stream():
 
 @app.route('/video_feed')
 def video_feed():
-    """Video streaming route"""
+    """Video streaming route for the default source"""
+    return video_feed_for_source(DEFAULT_SOURCE_ID)
+
+@app.route('/video_feed/<source_id>')
+def video_feed_for_source(source_id):
+    """Video streaming route; ?width=, ?quality= and ?fps= tune the stream for this viewer"""
     # Get timestamp from query params to prevent caching
     _ = request.args.get('t', '')
-    
-    if not video_path:
+    width = request.args.get('width', type=int)
+    quality = request.args.get('quality', type=int)
+    fps = request.args.get('fps', type=float)
+
+    session = session_manager.get(source_id)
+    if session is None:
+        if session_manager.last_error(source_id):
+            return Response("Could not open video stream", status=500)
         return Response("No video selected", status=404)
-        
+
     try:
-        # Initialize video capture to check if stream is accessible
-        cap = cv2.VideoCapture(video_path)
-        if not cap.isOpened():
-            logger.error(f"Could not open video: {video_path}")
+        # Viewers share one background session per source
+        if session.error:
+            logger.error(f"Could not open video: {session.source}")
             return Response("Could not open video stream", status=500)
-            
-        # Release the test capture
-        cap.release()
-        
+
         return Response(
-            generate_frames(),
+            session.frames(width=width, quality=quality, fps=fps if fps and fps > 0 else None),
             mimetype='multipart/x-mixed-replace; boundary=frame',
             headers={
                 'Cache-Control': 'no-cache, no-store, must-revalidate',
@@ -221,10 +254,31 @@ def video_feed():
         logger.error(f"Error in video feed: {e}")
         return Response(f"Error in video feed: {str(e)}", status=500)
 
+def stream_socket(ws, source_id):
+    """Frames with sequence numbers plus JSON detection metadata over one WebSocket.
+
+    Query parameters (width, quality, fps, overlay, metadata_only, window)
+    set the initial stream; the client can renegotiate them later, see
+    stream_socket.StreamConnection.
+    """
+    session = session_manager.get(source_id)
+    if session is None or session.error:
+        ws.send(json.dumps({"type": "error", "error": "No video selected"}))
+        return
+    StreamConnection(ws, session, request.args.to_dict()).run()
+
+if Sock is not None:
+    sock = Sock(app)
+    sock.route('/ws/stream/<source_id>')(stream_socket)
+
+    @sock.route('/ws/stream')
+    def default_stream_socket(ws):
+        stream_socket(ws, DEFAULT_SOURCE_ID)
+else:
+    logger.info("flask-sock is not installed; WebSocket streaming (/ws/stream) is disabled")
+
 @app.route('/upload', methods=['GET', 'POST'])
 def upload_file():
-    global video_path, processing_complete
-    
     if request.method == 'POST':
         if 'file' not in request.files:
             return 'No file part'
@@ -236,9 +290,13 @@ def upload_file():
             file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
             file.save(file_path)
             
-            # Set the video path for streaming
-            video_path = file_path
-            processing_complete = False
+            # Start analysing the upload as the default source
+            title = os.path.splitext(filename)[0]
+            try:
+                if not start_default_source(file_path, title=title, location=title):
+                    return f"Could not start video analysis: {video_initialization_error}"
+            except SessionLimitError as e:
+                return str(e)
             
             # Redirect to the streaming page
             return render_template('stream.html')
@@ -248,17 +306,17 @@ def upload_file():
 @app.route('/api/stream-status', methods=['GET'])
 def get_stream_status():
     """API endpoint to get video stream initialization status"""
-    global video_initialization_error
+    session = session_manager.get(DEFAULT_SOURCE_ID)
+    error = video_initialization_error or (session.error if session
+                                           else session_manager.last_error(DEFAULT_SOURCE_ID))
     return jsonify({
-        "isReady": video_path is not None and video_initialization_error is None,
-        "error": video_initialization_error,
-        "videoPath": video_path
+        "isReady": session is not None and error is None,
+        "error": error,
+        "videoPath": session.source if session else None
     })
 
 @app.route('/process_sample', methods=['POST'])
 def process_sample():
-    global video_path, processing_complete, current_stats, video_initialization_error, current_video_title
-    
     sample_video = request.form.get('sample_video')
     if sample_video:
         file_path = os.path.join(app.config['UPLOAD_FOLDER'], sample_video)
@@ -268,7 +326,6 @@ def process_sample():
             
             # Update location based on video
             location = "School Entrance" if "school" in sample_video.lower() else "Palengke Market"
-            current_video_title = location
             
             # Initialize model if not already done
             if model is None and not initialize_yolo():
@@ -284,13 +341,16 @@ def process_sample():
                     "error": video_initialization_error
                 }), 500
             
-            # Set the new video path
-            video_path = file_path
-            
-            # Update current stats
-            current_stats.update({
-                "location": location,
-            })
+            # Start analysing the sample as the default source
+            try:
+                started = start_default_source(file_path, title=location, location=location)
+            except SessionLimitError as e:
+                return jsonify({"success": False, "error": str(e)}), 429
+            if not started:
+                return jsonify({
+                    "success": False,
+                    "error": video_initialization_error
+                }), 500
             
             logger.info(f"Sample video processing: {sample_video}, location set to: {location}")
             
@@ -307,16 +367,149 @@ def process_sample():
 @app.route('/api/stats', methods=['GET'])
 def get_stats():
     """API endpoint to get current statistics"""
-    global current_stats, current_video_title
-    
-    # Ensure location is consistent with current video source
-    if video_path and "youtube" not in str(video_path).lower() and current_video_title:
-        current_stats["location"] = current_video_title
-        
+    source_id = request.args.get('source_id', DEFAULT_SOURCE_ID)
+    session = session_manager.get(source_id)
+
+    response = {
+        "success": True,
+        "stats": session.get_stats() if session else empty_stats()
+    }
+    if session is not None:
+        response["pipeline"] = session.pipeline_stats()
+        response["detection"] = session.detection_stats()
+    response["sessions"] = session_manager.stats()
+    response["model"] = model_registry.stats()
+    response["inference"] = inference_scheduler.stats()
+    response["storage"] = storage.foot_traffic_writer.stats()
+    if face_recognition_system is not None and face_recognition_system.worker_pool is not None:
+        response["face_workers"] = face_recognition_system.worker_pool.stats()
+    return jsonify(response)
+
+# Comment line sent to idle /api/stats/stream clients so proxies keep the connection open
+STATS_STREAM_HEARTBEAT = float(os.environ.get("STATS_STREAM_HEARTBEAT_SECONDS", "15"))
+
+def stats_events(source_id, last_event_id=""):
+    """Yield SSE messages for a source's stats, following it when the source is restarted"""
+    yield "retry: 3000\n\n"
+    epoch, _, version = last_event_id.partition(":")
+    version = int(version) if version.isdigit() else 0
+    feed = None
+    subscribed = False
+    idle_since = time.time()
+    while True:
+        session = session_manager.get(source_id)
+        current = session.stats_feed if session is not None and not session.stats_feed.closed else None
+        if not subscribed or current is not feed:
+            if current is None:
+                yield f"event: stats\ndata: {json.dumps(empty_stats())}\n\n"
+            elif current.epoch != epoch:
+                # Not the source the client last saw: start from its latest snapshot
+                version = 0
+            feed = current
+            epoch = current.epoch if current is not None else ""
+            subscribed = True
+            idle_since = time.time()
+        if feed is None:
+            # Nothing to subscribe to yet; look for a new source every second
+            time.sleep(1.0)
+            if time.time() - idle_since >= STATS_STREAM_HEARTBEAT:
+                yield ": heartbeat\n\n"
+                idle_since = time.time()
+            continue
+        snapshot = feed.wait(version, timeout=STATS_STREAM_HEARTBEAT)
+        if snapshot is not None:
+            version = snapshot.version
+            yield f"id: {feed.epoch}:{version}\nevent: stats\ndata: {snapshot.text}\n\n"
+        elif not feed.closed:
+            yield ": heartbeat\n\n"
+
+@app.route('/api/stats/stream', methods=['GET'])
+def stream_stats():
+    """Server-Sent Events: a versioned stats snapshot whenever the source's stats change
+
+    Each open stream holds a server thread; gunicorn.conf.py counts them as EXPECTED_DASHBOARDS.
+    """
+    source_id = request.args.get('source_id', DEFAULT_SOURCE_ID)
+    return Response(
+        stats_events(source_id, request.headers.get('Last-Event-ID', '')),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no',
+            'Access-Control-Allow-Origin': '*'
+        }
+    )
+
+@app.route('/api/sources', methods=['GET'])
+def list_sources():
+    """List every analysed source with its live stats"""
+    return jsonify({"success": True, "sources": session_manager.list(), **session_manager.stats()})
+
+@app.route('/api/sources', methods=['POST'])
+def start_source():
+    """Start analysing a sample video, uploaded file or YouTube URL"""
+    data = request.get_json() or {}
+    title = data.get('title')
+    location = data.get('location')
+
+    try:
+        if data.get('sample_video'):
+            sample_video = secure_filename(data['sample_video'])
+            source = os.path.join(app.config['UPLOAD_FOLDER'], sample_video)
+            if not os.path.isfile(source):
+                return jsonify({"success": False, "error": f"Sample video not found: {sample_video}"}), 404
+            title = title or os.path.splitext(sample_video)[0]
+        elif data.get('url'):
+            source, video_title = get_youtube_video_url(data['url'])
+            title = title or video_title
+            location = location or f"YouTube Stream: {video_title}"
+        else:
+            return jsonify({"success": False, "error": "Provide sample_video or url"}), 400
+        # Polygons in normalised coordinates: [{"name": ..., "points": [[x, y], ...]}, ...]
+        zones = load_zones(data['zones']) if data.get('zones') else default_zones()
+        # Directed entry/exit lines: [{"name": ..., "start": [x, y], "end": [x, y]}, ...]
+        lines = load_lines(data['lines']) if data.get('lines') else default_lines()
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+
+    if model is None and not initialize_yolo():
+        return jsonify({"success": False, "error": video_initialization_error}), 500
+
+    try:
+        session = session_manager.start(
+            source,
+            title=title,
+            location=location or title,
+            region_margin=float(data.get('region_margin', 0.2)),
+            zones=zones,
+            lines=lines
+        )
+    except SessionLimitError as e:
+        return jsonify({"success": False, "error": str(e)}), 429
+    except Exception as e:
+        logger.error(f"Error starting source: {e}")
+        return jsonify({"success": False, "error": str(e)}), 500
+
     return jsonify({
         "success": True,
-        "stats": current_stats
-    })
+        "source": session.describe(),
+        "feedUrl": f"/video_feed/{session.source_id}"
+    }), 201
+
+@app.route('/api/sources/<source_id>', methods=['GET'])
+def get_source(source_id):
+    """Get one source with its live stats"""
+    session = session_manager.get(source_id)
+    if session is None:
+        return jsonify({"success": False, "error": "Source not found"}), 404
+    return jsonify({"success": True, "source": session.describe(), "pipeline": session.pipeline_stats()})
+
+@app.route('/api/sources/<source_id>', methods=['DELETE'])
+def stop_source(source_id):
+    """Stop analysing a source"""
+    if not session_manager.stop(source_id):
+        return jsonify({"success": False, "error": "Source not found"}), 404
+    return jsonify({"success": True, "message": f"Source {source_id} stopped"})
 
 @app.route('/download_stats', methods=['GET'])
 def download_stats():
@@ -327,298 +520,55 @@ def download_stats():
     else:
         return "No statistics file found"
 
-def calculate_average_dwell_time(dwell_times, current_time):
-    """Calculate average dwell time from all tracked people"""
-    if not dwell_times:
-        return 0, 0
-        
-    total_dwell_time = 0
-    total_sessions = 0
-    highest_dwell_time = 0
-    
-    # Track if we have any completed sessions
-    has_completed_sessions = False
-    
-    for track_data in dwell_times.values():
-        # Only consider sessions for people currently in the region
-        if track_data["current_session"]["active"]:
-            current_session_duration = current_time - track_data["current_session"]["start"]
-            total_dwell_time += current_session_duration
-            total_sessions += 1
-            highest_dwell_time = max(highest_dwell_time, current_session_duration)
-        
-        # Add completed sessions
-        for session in track_data["sessions"]:
-            total_dwell_time += session["duration"]
-            total_sessions += 1
-            highest_dwell_time = max(highest_dwell_time, session["duration"])
-            has_completed_sessions = True
-    
-    # Calculate average, ensuring we don't divide by zero
-    if total_sessions > 0:
-        avg_dwell_time = total_dwell_time / total_sessions
-    else:
-        # If we had people before but none now, keep the highest dwell time but set avg to 0
-        avg_dwell_time = 0
-        
-    # If we have no current sessions but have historical data, preserve the highest value
-    if total_sessions == 0 and not has_completed_sessions:
-        # No data at all, both current and historical
-        highest_dwell_time = 0
-    
-    return avg_dwell_time, highest_dwell_time
+# Static outlines are rasterised once per source geometry and blended in place
+overlay_renderer = OverlayRenderer()
 
-def draw_stats_overlay(frame, people_count, avg_dwell_time, highest_dwell_time, current_fps):
-    """Draw statistics overlay on the frame"""
-    current_datetime = datetime.now()
-    
-    # Draw the counting region with semi-transparent fill
-    height, width = frame.shape[:2]
-    region_margin = 0.2
-    region_x1 = int(width * region_margin)
-    region_x2 = int(width * (1 - region_margin))
-    region_y1 = int(height * region_margin)
-    region_y2 = int(height * (1 - region_margin))
-    
-    # Create overlay for the counting region
-    overlay = frame.copy()
-    cv2.rectangle(overlay, (region_x1, region_y1), (region_x2, region_y2), (0, 255, 0), 2)  # Green border
-    cv2.addWeighted(overlay, 0.3, frame, 0.7, 0, frame)
-    
-    # Draw stats with semi-transparent background
-    stats_overlay = frame.copy()
-    stats_height = 230  # Increased height to accommodate new stat
-    cv2.rectangle(stats_overlay, (5, 5), (300, stats_height), (0, 0, 0), -1)
-    cv2.addWeighted(stats_overlay, 0.3, frame, 0.7, 0, frame)
-    
-    # Draw text
-    text_color = (255, 255, 255)
-    font = cv2.FONT_HERSHEY_SIMPLEX
-    cv2.putText(frame, f"FPS: {current_fps:.1f}", (10, 25), font, 0.7, text_color, 2)
-
-def generate_frames():
-    """Generate video frames with person detection"""
-    global video_path, output_frame, processing_complete, current_stats, frame_count, face_recognition_active
-    
-    if not video_path:
-        return
-    
-    try:
-        # Initialize frame counter
-        frame_count = 0
-        
-        # Load YOLO model
-        model = YOLO("model.pt")
-        logger.info(f"YOLO model loaded successfully")
-    except Exception as e:
-        logger.error(f"Error loading YOLO model: {e}")
-        return
-    
-    last_frame = None
-    reconnect_attempts = 0
-    consecutive_failures = 0
-    max_reconnect_attempts = 5
-    max_consecutive_failures = 3
-    
-    while True:
-        try:
-            cap = cv2.VideoCapture(video_path)
-            if not cap.isOpened():
-                logger.error(f"Error opening video file: {video_path}")
-                return
-            
-            reconnect_attempts = 0
-            consecutive_failures = 0
-            
-            # Optimize frame processing
-            frame_width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-            frame_height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-            fps = int(cap.get(cv2.CAP_PROP_FPS))
-            logger.info(f"Video opened: {video_path}, {frame_width}x{frame_height} @ {fps}fps")
-            
-            # Calculate optimal frame skip based on input fps
-            target_fps = 20  # Target processing FPS
-            frame_skip = max(1, int(fps / target_fps))
-            
-            # Calculate optimal resize resolution while maintaining aspect ratio
-            max_dimension = 640  # Maximum dimension for processing
-            scale = min(max_dimension / frame_width, max_dimension / frame_height)
-            process_width = int(frame_width * scale)
-            process_height = int(frame_height * scale)
-            
-            stats_exporter = StatsExporter(location)
-            region_margin = 0.2
-            region_x1 = int(frame_width * region_margin)
-            region_x2 = int(frame_width * (1 - region_margin))
-            region_y1 = int(frame_height * region_margin)
-            region_y2 = int(frame_height * (1 - region_margin))
-            counting_region = (region_x1, region_y1, region_x2, region_y2)
-            
-            dwell_times = {}
-            people_in_region = set()
-            start_time = time.time()
-            
-            while True:
-                success, frame = cap.read()
-                if not success:
-                    consecutive_failures += 1
-                    logger.warning(f"Frame read failed. Consecutive failures: {consecutive_failures}")
-                    
-                    if consecutive_failures >= max_consecutive_failures:
-                        if "youtube" in str(video_path).lower():
-                            logger.info("YouTube stream failed, attempting to reconnect...")
-                            cap.release()
-                            time.sleep(2)
-                            break
-                        else:
-                            break
-                    continue
-                
-                consecutive_failures = 0
-                frame_count += 1
-                
-                try:
-                    if frame_count % frame_skip == 0:
-                        last_frame = frame.copy()
-                        
-                        # Process frame with YOLO
-                        results = model.track(
-                            source=frame,
-                            tracker="bytetrack.yaml",
-                            stream=True,
-                            iou=0.45,
-                            conf=0.35,
-                            imgsz=640,
-                            verbose=False
-                        )
-                        
-                        last_detection = next(results)
-                        display_frame = frame.copy()
-                        
-                        if last_detection is not None:
-                            detections = last_detection.boxes
-                            people_detections = [box for box in detections if int(box.cls[0]) == 0 and box.conf[0] > 0.35]
-                            
-                            people_in_region.clear()
-                            current_time = time.time()
-                            
-                            # Process face recognition if active
-                            if face_recognition_active and face_recognition_system:
-                                try:
-                                    faces = face_recognition_system.face_app.get(display_frame)
-                                    for face in faces:
-                                        bbox = face.bbox.astype(int)
-                                        embedding = face.embedding
-                                        
-                                        # Try to recognize the face
-                                        name, family, similarity = face_recognition_system.recognize_face(embedding)
-                                        
-                                        # Draw face bounding box
-                                        cv2.rectangle(display_frame, 
-                                                    (bbox[0], bbox[1]), 
-                                                    (bbox[2], bbox[3]), 
-                                                    (255, 0, 0), 2)  # Blue for faces
-                                        
-                                        # Add text for name and confidence
-                                        label = f"{name if name else 'Unknown'}"
-                                        if similarity > 0:
-                                            label += f" ({similarity:.2f})"
-                                        cv2.putText(display_frame, label, 
-                                                  (bbox[0], bbox[1] - 10),
-                                                  cv2.FONT_HERSHEY_SIMPLEX, 0.5,
-                                                  (255, 0, 0), 2)
-                                except Exception as e:
-                                    logger.error(f"Error in face recognition: {e}")
-                            
-                            for box in people_detections:
-                                x1, y1, x2, y2 = map(int, box.xyxy[0].cpu().numpy())
-                                track_id = int(box.id[0]) if box.id is not None else None
-                                
-                                if track_id is None:
-                                    continue
-                                
-                                center_x = (x1 + x2) // 2
-                                center_y = (y1 + y2) // 2
-                                
-                                if is_point_in_region((center_x, center_y), counting_region):
-                                    people_in_region.add(track_id)
-                                    
-                                    if track_id not in dwell_times:
-                                        dwell_times[track_id] = {
-                                            "total_time": 0,
-                                            "sessions": [],
-                                            "current_session": {"start": current_time, "active": True}
-                                        }
-                                    elif not dwell_times[track_id]["current_session"]["active"]:
-                                        dwell_times[track_id]["current_session"] = {"start": current_time, "active": True}
-                                    
-                                    # Draw green box for people in region
-                                    cv2.rectangle(display_frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
-                                else:
-                                    if track_id in dwell_times and dwell_times[track_id]["current_session"]["active"]:
-                                        session = dwell_times[track_id]["current_session"]
-                                        duration = current_time - session["start"]
-                                        dwell_times[track_id]["sessions"].append({
-                                            "start": session["start"],
-                                            "end": current_time,
-                                            "duration": duration
-                                        })
-                                        dwell_times[track_id]["current_session"]["active"] = False
-                                    
-                                    # Draw red box for people outside region
-                                    cv2.rectangle(display_frame, (x1, y1), (x2, y2), (0, 0, 255), 2)
-                            
-                            # Calculate and update stats
-                            avg_dwell_time, highest_dwell_time = calculate_average_dwell_time(dwell_times, current_time)
-                            
-                            # Update current_stats with real detection data
-                            people_count = len(people_in_region)
-                            current_stats.update({
-                                "people_count": people_count,
-                                "avg_dwell_time": 0 if people_count == 0 else round(avg_dwell_time, 2),
-                                "highest_dwell_time": round(highest_dwell_time, 2),
-                                "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                            })
-                            
-                            # Draw stats overlay
-                            draw_stats_overlay(display_frame, len(people_in_region), avg_dwell_time, highest_dwell_time, fps/frame_skip)
-                            
-                            # Export stats if needed
-                            if stats_exporter.should_export(current_time):
-                                stats_exporter.export_stats(len(people_in_region), avg_dwell_time)
-                        
-                        last_frame = display_frame
-                    else:
-                        display_frame = last_frame if last_frame is not None else frame
-                    
-                    ret, buffer = cv2.imencode('.jpg', display_frame)
-                    if not ret:
-                        continue
-                    
-                    frame_bytes = buffer.tobytes()
-                    yield (b'--frame\r\n'
-                           b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
-                    
-                except Exception as e:
-                    logger.error(f"Error processing frame: {e}")
-                    if last_frame is not None:
-                        ret, buffer = cv2.imencode('.jpg', last_frame)
-                        if ret:
-                            frame_bytes = buffer.tobytes()
-                            yield (b'--frame\r\n'
-                                   b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
-            
-            cap.release()
-            
-        except Exception as e:
-            logger.error(f"Error in video processing: {e}")
-            time.sleep(1)
+def create_motion_gate():
+    """Build the per-source motion gate from the environment; MOTION_GATE=off disables it"""
+    mode = os.environ.get("MOTION_GATE", "diff")
+    if mode == "off":
+        return None
+    return MotionGate(
+        mode=mode,
+        pixel_threshold=int(os.environ.get("MOTION_PIXEL_THRESHOLD", "25")),
+        min_changed_fraction=float(os.environ.get("MOTION_MIN_CHANGED_FRACTION", "0.002")),
+        max_skip_time=float(os.environ.get("MOTION_MAX_SKIP_SECONDS", "2.0"))
+    )
 
-def start_flask_server():
-    """Start the Flask server"""
+session_manager = SessionManager(
+    detector_factory=lambda: SourceDetector(inference_scheduler),
+    render=overlay_renderer.render,
+    exporter_factory=StatsExporter,
+    face_recognition=lambda: face_recognition_system if face_recognition_active else None,
+    max_sessions=int(os.environ.get("MAX_ACTIVE_SOURCES", "4")),
+    # Detection stride (and optionally imgsz) adapts to hold the latency target
+    controller_factory=lambda: AdaptiveStrideController(
+        target_latency=float(os.environ.get("TARGET_LATENCY_MS", "500")) / 1000,
+        cpu_budget=float(os.environ.get("INFERENCE_CPU_BUDGET", "0.8")),
+        imgsz_steps=[int(size) for size in os.environ.get("ADAPTIVE_IMGSZ_STEPS", "640").split(",")]
+    ),
+    motion_gate_factory=create_motion_gate,
+    # Decoded frames live in a preallocated ring; FRAME_RING_SHARED=1 puts it in shared memory
+    ring_factory=lambda shape: FrameRing(
+        shape,
+        slots=int(os.environ.get("FRAME_RING_SLOTS", "8")),
+        shared=os.environ.get("FRAME_RING_SHARED", "0") == "1"
+    ),
+    # Changes inside this window are coalesced into one /api/stats/stream push
+    stats_interval=float(os.environ.get("STATS_STREAM_INTERVAL_MS", "500")) / 1000
+)
+
+def prepare_server():
+    """One-time startup work shared by the dev server and gunicorn (see gunicorn.conf.py)"""
     if not os.path.exists(UPLOAD_FOLDER):
         os.makedirs(UPLOAD_FOLDER)
-    app.run(host='0.0.0.0', port=5001, debug=False)
+    # Pay the model load and warm-up cost before the first viewer arrives
+    initialize_yolo()
+
+def start_flask_server():
+    """Start the Flask development server; use gunicorn -c gunicorn.conf.py in production"""
+    prepare_server()
+    app.run(host='0.0.0.0', port=int(os.environ.get("PORT", "5001")), debug=False, threaded=True)
 
 def get_youtube_video_url(youtube_url):
     """Extract the video URL and title from a YouTube URL"""
@@ -709,8 +659,6 @@ def extract_video_id(url):
 @app.route('/process_youtube', methods=['POST'])
 def process_youtube():
     """Handle YouTube video processing requests"""
-    global video_path, processing_complete, current_stats, current_video_title
-    
     try:
         data = request.get_json()
         if not data or 'url' not in data:
@@ -739,9 +687,6 @@ def process_youtube():
             # Reset stream before starting new one
             reset_stream()
             
-            # Set the YouTube title
-            current_video_title = video_title
-            
             # Verify stream is accessible
             cap = cv2.VideoCapture(video_url)
             if not cap.isOpened():
@@ -758,13 +703,10 @@ def process_youtube():
                     "error": "Failed to initialize YOLO model"
                 }), 500
             
-            # Set the video path to the stream URL
-            video_path = video_url
-            
-            # Update current stats
-            current_stats.update({
-                "location": f"YouTube Stream: {video_title}",
-            })
+            # Start analysing the stream as the default source
+            if not start_default_source(video_url, title=video_title,
+                                        location=f"YouTube Stream: {video_title}"):
+                raise Exception(video_initialization_error)
             
             logger.info(f"YouTube stream processing: URL={youtube_url}, title={video_title}")
             
@@ -814,6 +756,18 @@ def toggle_face_recognition():
             "error": str(e)
         }), 500
 
+@app.route('/api/face-embeddings/reload', methods=['POST'])
+def reload_face_embeddings():
+    """Pick up newly enrolled or changed face embeddings without waiting for the periodic refresh"""
+    if face_recognition_system is None:
+        return jsonify({"success": False, "error": "Face recognition system is not available"}), 503
+    updated = face_recognition_system.reload_face_embeddings()
+    return jsonify({
+        "success": True,
+        "updated": updated,
+        "embeddings": len(face_recognition_system.gallery)
+    })
+
 # Add new API routes for data management
 @app.route('/api/dashboard', methods=['GET'])
 def get_dashboard():
@@ -825,6 +779,26 @@ def get_dashboard():
         logger.error(f"Failed to fetch dashboard data: {e}")
         return jsonify({"message": "Failed to fetch dashboard data"}), 500
 
+@app.route('/api/foot-traffic/history', methods=['GET'])
+def get_foot_traffic_history():
+    """Aggregated foot traffic for charts: ?start=&end= (ISO 8601), optional location and resolution"""
+    try:
+        end = datetime.fromisoformat(request.args['end']) if request.args.get('end') else datetime.now()
+        start = datetime.fromisoformat(request.args['start']) if request.args.get('start') else end - timedelta(days=1)
+    except ValueError as e:
+        return jsonify({"message": f"Invalid date: {e}"}), 400
+    # Buckets are keyed by local time
+    start, end = [value.astimezone().replace(tzinfo=None) if value.tzinfo else value for value in (start, end)]
+    try:
+        history = storage.get_foot_traffic_rollups(start, end, location=request.args.get('location'),
+                                                   resolution=request.args.get('resolution'))
+        return jsonify(history)
+    except ValueError as e:
+        return jsonify({"message": str(e)}), 400
+    except Exception as e:
+        logger.error(f"Failed to fetch foot traffic history: {e}")
+        return jsonify({"message": "Failed to fetch foot traffic history"}), 500
+
 @app.route('/api/statistics', methods=['GET'])
 def get_statistics():
     """Get statistics data"""
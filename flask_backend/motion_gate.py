@@ -0,0 +1,90 @@
+import threading
+import time
+
+import cv2
+import numpy as np
+
+
+class MotionGate:
+    """Cheap check for whether a frame is worth sending to the detector.
+
+    The frame (cropped to the counting region when one is given) is shrunk
+    to ``downscale_width`` pixels wide, converted to blurred grayscale and
+    compared either against the frame of the last detection (``"diff"``) or
+    against a MOG2 background model (``"mog2"``). Detection runs when the
+    changed-pixel fraction reaches ``min_changed_fraction`` or when no
+    detection has run for ``max_skip_time`` seconds, so tracks never go
+    completely stale.
+    """
+
+    MODES = ("diff", "mog2")
+
+    def __init__(self, mode="diff", pixel_threshold=25, min_changed_fraction=0.002,
+                 max_skip_time=2.0, downscale_width=160):
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown motion gate mode: {mode}")
+        self.mode = mode
+        self.pixel_threshold = pixel_threshold
+        self.min_changed_fraction = min_changed_fraction
+        self.max_skip_time = max_skip_time
+        self.downscale_width = downscale_width
+        self._lock = threading.Lock()
+        self.checked = 0
+        self.skipped = 0
+        self.reset()
+
+    def reset(self):
+        """Drop the reference frame, e.g. when the capture is reopened"""
+        self._reference = None
+        self._last_detection = 0.0
+        self.last_changed_fraction = 0.0
+        self._subtractor = None
+        if self.mode == "mog2":
+            self._subtractor = cv2.createBackgroundSubtractorMOG2(
+                history=500, varThreshold=self.pixel_threshold, detectShadows=False)
+
+    def _prepare(self, frame, region):
+        if region is not None:
+            x1, y1, x2, y2 = region
+            frame = frame[y1:y2, x1:x2]
+        height, width = frame.shape[:2]
+        if width > self.downscale_width:
+            small_height = max(1, int(height * self.downscale_width / width))
+            frame = cv2.resize(frame, (self.downscale_width, small_height), interpolation=cv2.INTER_AREA)
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        return cv2.GaussianBlur(gray, (5, 5), 0)
+
+    def should_detect(self, frame, region=None, now=None):
+        """Return True if the detector should run on this frame"""
+        now = now if now is not None else time.time()
+        gray = self._prepare(frame, region)
+
+        if self._subtractor is not None:
+            mask = self._subtractor.apply(gray)
+            changed = cv2.countNonZero(mask) / mask.size
+        elif self._reference is None or self._reference.shape != gray.shape:
+            changed = 1.0
+        else:
+            diff = cv2.absdiff(gray, self._reference)
+            changed = np.count_nonzero(diff > self.pixel_threshold) / diff.size
+
+        with self._lock:
+            self.checked += 1
+            self.last_changed_fraction = changed
+            if changed >= self.min_changed_fraction or now - self._last_detection >= self.max_skip_time:
+                # Compare later frames against the one the detector actually saw
+                self._reference = gray
+                self._last_detection = now
+                return True
+            self.skipped += 1
+            return False
+
+    def stats(self):
+        with self._lock:
+            return {
+                "mode": self.mode,
+                "checked": self.checked,
+                "skipped": self.skipped,
+                "skip_ratio": round(self.skipped / self.checked, 3) if self.checked else 0,
+                "last_changed_fraction": round(self.last_changed_fraction, 4)
+            }
@@ -0,0 +1,97 @@
+import collections
+import threading
+
+import cv2
+import numpy as np
+
+from traffic_analysis import IN_REGION_COLOR, ZONE_COLOR, LINE_COLOR
+
+FONT = cv2.FONT_HERSHEY_SIMPLEX
+TEXT_COLOR = (255, 255, 255)
+
+
+class OverlayRenderer:
+    """Draws FrameAnnotations onto a frame in place, touching only the pixels it changes.
+
+    The static outlines (counting region, zone polygons and line arrows)
+    are rasterised once per frame size and geometry into pixel coordinates
+    and cached, so each frame only writes those pixels. The counting region
+    border and the stats box are blended with ``alpha`` inside their own
+    ROIs; the rest of the frame is never copied. Boxes, labels and counts
+    change every frame and are drawn directly.
+    """
+
+    def __init__(self, alpha=0.3, stats_box=(5, 5, 300, 230), max_cached=8):
+        self.alpha = alpha
+        self.stats_box = stats_box
+        self.max_cached = max_cached
+        self._layers = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def render(self, frame, annotations, current_fps):
+        """Render callback for FramePipeline"""
+        for x1, y1, x2, y2, color in annotations.boxes:
+            cv2.rectangle(frame, (x1, y1), (x2, y2), color, 2)
+        for text, origin, color in annotations.labels:
+            cv2.putText(frame, text, origin, FONT, 0.5, color, 2)
+
+        border, painted = self._static_layer(frame.shape[:2], annotations)
+        for (ys, xs), color in painted:
+            frame[ys, xs] = color
+        for name, polygon in annotations.zone_polygons:
+            count = annotations.zones.get(name, {}).get("people_count", 0)
+            x, y = polygon[0]
+            cv2.putText(frame, f"{name}: {count}", (int(x) + 5, int(y) + 20), FONT, 0.6, ZONE_COLOR, 2)
+        for name, start, end in annotations.line_segments:
+            counts = annotations.lines.get(name, {})
+            cv2.putText(frame, f"{name} in: {counts.get('in', 0)} out: {counts.get('out', 0)}",
+                        (start[0] + 5, start[1] - 10), FONT, 0.6, LINE_COLOR, 2)
+
+        if border is not None:
+            ys, xs = border
+            frame[ys, xs] = frame[ys, xs] * (1 - self.alpha) + np.multiply(IN_REGION_COLOR, self.alpha)
+        self._draw_stats(frame, current_fps)
+
+    def _draw_stats(self, frame, current_fps):
+        x1, y1, x2, y2 = self.stats_box
+        box = frame[y1:y2 + 1, x1:x2 + 1]
+        # Blending towards black is a plain scale of the ROI
+        np.multiply(box, 1 - self.alpha, out=box, casting='unsafe')
+        cv2.putText(frame, f"FPS: {current_fps:.1f}", (10, 25), FONT, 0.7, TEXT_COLOR, 2)
+
+    def _static_layer(self, shape, annotations):
+        key = (shape, annotations.region,
+               tuple((name, polygon.tobytes()) for name, polygon in annotations.zone_polygons),
+               tuple(annotations.line_segments))
+        with self._lock:
+            layer = self._layers.get(key)
+            if layer is not None:
+                self._layers.move_to_end(key)
+                return layer
+        layer = self._rasterise(shape, annotations)
+        with self._lock:
+            self._layers[key] = layer
+            while len(self._layers) > self.max_cached:
+                self._layers.popitem(last=False)
+        return layer
+
+    @staticmethod
+    def _rasterise(shape, annotations):
+        """Pixel coordinates of the region border and of the zone and line outlines"""
+        mask = np.zeros(shape, dtype=np.uint8)
+        border = None
+        if annotations.region is not None:
+            x1, y1, x2, y2 = annotations.region
+            cv2.rectangle(mask, (x1, y1), (x2, y2), 255, 2)
+            border = np.nonzero(mask)
+        painted = []
+        if annotations.zone_polygons:
+            mask[:] = 0
+            cv2.polylines(mask, [polygon for _, polygon in annotations.zone_polygons], True, 255, 2)
+            painted.append((np.nonzero(mask), ZONE_COLOR))
+        if annotations.line_segments:
+            mask[:] = 0
+            for _, start, end in annotations.line_segments:
+                cv2.arrowedLine(mask, start, end, 255, 2, tipLength=0.02)
+            painted.append((np.nonzero(mask), LINE_COLOR))
+        return border, painted
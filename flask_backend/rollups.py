@@ -0,0 +1,208 @@
+import os
+import threading
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
+
+# Finest to coarsest
+RESOLUTIONS = ('minute', 'hour', 'day')
+RESOLUTION_SECONDS = {'minute': 60, 'hour': 3600, 'day': 86400}
+
+# Days each resolution is kept; None keeps it forever. Raw samples are compacted after RAW_RETENTION_DAYS.
+ROLLUP_RETENTION_DAYS = {
+    'minute': float(os.environ.get('ROLLUP_MINUTE_RETENTION_DAYS', '14')),
+    'hour': float(os.environ.get('ROLLUP_HOUR_RETENTION_DAYS', '400')),
+    'day': None
+}
+RAW_RETENTION_DAYS = float(os.environ.get('FOOT_TRAFFIC_RAW_RETENTION_DAYS', '7'))
+COMPACTION_INTERVAL = float(os.environ.get('ROLLUP_COMPACTION_SECONDS', '3600'))
+
+BUCKET_FORMAT = '%Y-%m-%dT%H:%M'
+
+
+def bucket_start(timestamp: datetime, resolution: str) -> datetime:
+    """Start of the local-time bucket containing timestamp"""
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone().replace(tzinfo=None)
+    start = timestamp.replace(second=0, microsecond=0)
+    if resolution in ('hour', 'day'):
+        start = start.replace(minute=0)
+    if resolution == 'day':
+        start = start.replace(hour=0)
+    return start
+
+
+def rollup_id(resolution: str, location: str, start: datetime) -> str:
+    # Firestore document IDs may not contain '/'
+    return f"{resolution}:{location.replace('/', '_')}:{start.strftime(BUCKET_FORMAT)}"
+
+
+def choose_resolution(start: datetime, end: datetime, min_buckets: int = 24,
+                      now: Optional[datetime] = None) -> str:
+    """Coarsest resolution that still gives min_buckets points and is retained back to start"""
+    now = now or datetime.now()
+    span = (end - start).total_seconds()
+    candidates = [r for r in RESOLUTIONS
+                  if ROLLUP_RETENTION_DAYS[r] is None
+                  or start >= now - timedelta(days=ROLLUP_RETENTION_DAYS[r])]
+    for resolution in reversed(candidates):
+        if span / RESOLUTION_SECONDS[resolution] >= min_buckets:
+            return resolution
+    return candidates[0] if candidates else RESOLUTIONS[-1]
+
+
+class RollupBucket:
+    """Sum, count, min and max of people count and dwell time for one location and time bucket.
+
+    ``last_seq`` is the highest sample sequence number folded in; samples
+    are written in sequence order, so any sample at or below it is already
+    counted.
+    """
+    __slots__ = ('resolution', 'location', 'start', 'count', 'people_sum', 'people_min', 'people_max',
+                 'dwell_sum', 'dwell_min', 'dwell_max', 'highest_dwell_max', 'entries', 'exits', 'last_seq')
+
+    def __init__(self, resolution: str, location: str, start: datetime):
+        self.resolution = resolution
+        self.location = location
+        self.start = start
+        self.count = 0
+        self.people_sum = 0
+        self.people_min = None
+        self.people_max = None
+        self.dwell_sum = 0.0
+        self.dwell_min = None
+        self.dwell_max = None
+        self.highest_dwell_max = 0.0
+        self.entries = 0
+        self.exits = 0
+        self.last_seq = 0
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'RollupBucket':
+        bucket = cls(data['resolution'], data['location'],
+                     datetime.strptime(data['bucket_start'], BUCKET_FORMAT))
+        for name in cls.__slots__[3:]:
+            if data.get(name) is not None:
+                setattr(bucket, name, data[name])
+        return bucket
+
+    def copy(self) -> 'RollupBucket':
+        bucket = RollupBucket(self.resolution, self.location, self.start)
+        for name in self.__slots__[3:]:
+            setattr(bucket, name, getattr(self, name))
+        return bucket
+
+    def add(self, record: Dict):
+        people = record.get('people_count', 0)
+        dwell = record.get('avg_dwell_time', 0)
+        self.count += 1
+        self.people_sum += people
+        self.people_min = people if self.people_min is None else min(self.people_min, people)
+        self.people_max = people if self.people_max is None else max(self.people_max, people)
+        self.dwell_sum += dwell
+        self.dwell_min = dwell if self.dwell_min is None else min(self.dwell_min, dwell)
+        self.dwell_max = dwell if self.dwell_max is None else max(self.dwell_max, dwell)
+        self.highest_dwell_max = max(self.highest_dwell_max, record.get('highest_dwell_time', 0))
+        self.entries += record.get('entries') or 0
+        self.exits += record.get('exits') or 0
+        self.last_seq = max(self.last_seq, record.get('seq') or 0)
+
+    def to_dict(self) -> Dict:
+        return {
+            'resolution': self.resolution,
+            'location': self.location,
+            'bucket_start': self.start.strftime(BUCKET_FORMAT),
+            'count': self.count,
+            'people_sum': self.people_sum,
+            'people_min': self.people_min,
+            'people_max': self.people_max,
+            'people_mean': round(self.people_sum / self.count, 2) if self.count else 0,
+            'dwell_sum': round(self.dwell_sum, 2),
+            'dwell_min': self.dwell_min,
+            'dwell_max': self.dwell_max,
+            'dwell_mean': round(self.dwell_sum / self.count, 2) if self.count else 0,
+            'highest_dwell_max': self.highest_dwell_max,
+            'entries': self.entries,
+            'exits': self.exits,
+            'last_seq': self.last_seq
+        }
+
+
+class RollupAggregator:
+    """Folds foot traffic samples into minute, hour and day buckets per location as they are written.
+
+    The buckets a write touches are kept in memory, so consecutive batches
+    update them without reading the store; a bucket not in memory (after a
+    restart, or a journal replay of old samples) is loaded once through
+    ``load``. ``plan`` returns the updated buckets without changing any
+    state and ``commit`` applies them once the store write that carries
+    them has succeeded.
+
+    Samples carry a sequence number that increases in write order, and a
+    bucket skips samples at or below its stored ``last_seq``. Replaying a
+    batch that was already (even partly) committed therefore never counts
+    a sample twice, whether or not its buckets are still in memory.
+    Samples without a sequence number (seq 0) are always folded in.
+    """
+
+    def __init__(self, load: Callable[[List[str]], Dict[str, Dict]], open_buckets: int = 2):
+        self._load = load
+        self.open_buckets = open_buckets
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def plan(self, records: List) -> Dict[str, tuple]:
+        """Map rollup ID -> (updated bucket, samples folded in) for a batch of (doc_id, data)"""
+        keyed = []
+        for _, data in records:
+            timestamp = data.get('timestamp')
+            if not isinstance(timestamp, datetime):
+                continue
+            location = data.get('location') or 'Unknown'
+            for resolution in RESOLUTIONS:
+                start = bucket_start(timestamp, resolution)
+                keyed.append((rollup_id(resolution, location, start), resolution, location, start, data))
+
+        with self._lock:
+            missing = sorted({key for key, *_ in keyed if key not in self._buckets})
+        stored = self._load(missing) if missing else {}
+
+        planned = {}
+        with self._lock:
+            for key, resolution, location, start, data in keyed:
+                if key not in planned:
+                    current = self._buckets.get(key)
+                    if current is not None:
+                        bucket = current.copy()
+                    elif key in stored:
+                        bucket = RollupBucket.from_dict(stored[key])
+                    else:
+                        bucket = RollupBucket(resolution, location, start)
+                    planned[key] = (bucket, 0)
+                bucket, folded = planned[key]
+                seq = data.get('seq') or 0
+                if seq and seq <= bucket.last_seq:
+                    continue
+                bucket.add(data)
+                planned[key] = (bucket, folded + 1)
+        return {key: value for key, value in planned.items() if value[1]}
+
+    def commit(self, planned: Dict[str, tuple]):
+        with self._lock:
+            for key, (bucket, _) in planned.items():
+                self._buckets[key] = bucket
+            self._evict()
+
+    def _evict(self):
+        """Keep only the newest few buckets of each resolution and location in memory"""
+        newest = {}
+        for bucket in self._buckets.values():
+            group = (bucket.resolution, bucket.location)
+            if group not in newest or bucket.start > newest[group]:
+                newest[group] = bucket.start
+        for key, bucket in list(self._buckets.items()):
+            window = timedelta(seconds=RESOLUTION_SECONDS[bucket.resolution] * self.open_buckets)
+            if bucket.start <= newest[(bucket.resolution, bucket.location)] - window:
+                del self._buckets[key]
+
+    def __len__(self):
+        return len(self._buckets)
@@ -0,0 +1,137 @@
+import logging
+import threading
+import uuid
+
+from analysis_session import AnalysisSession
+
+logger = logging.getLogger(__name__)
+
+
+class SessionLimitError(Exception):
+    """Raised when starting another source would exceed the concurrency cap"""
+
+
+class SessionManager:
+    """Owns every concurrently analysed video source.
+
+    Each source gets its own AnalysisSession (capture, tracker state,
+    counting region, stats and exporter). The number of running sessions is
+    capped so the server cannot be overcommitted. A slot is reserved under
+    the lock before the session starts; a session whose start or capture
+    fails is removed again, and its error stays available via ``last_error``.
+    """
+
+    def __init__(self, detector_factory, render, exporter_factory=None,
+                 face_recognition=None, max_sessions=4, controller_factory=None,
+                 motion_gate_factory=None, ring_factory=None, stats_interval=0.5):
+        self.detector_factory = detector_factory
+        self.render = render
+        self.exporter_factory = exporter_factory
+        self.face_recognition = face_recognition
+        self.max_sessions = max_sessions
+        self.controller_factory = controller_factory
+        self.motion_gate_factory = motion_gate_factory
+        self.ring_factory = ring_factory
+        self.stats_interval = stats_interval
+        self._sessions = {}
+        # Sessions added but not yet started; they hold a slot like running ones
+        self._starting = set()
+        # source_id -> error of the last session removed because its capture failed
+        self._errors = {}
+        self._lock = threading.Lock()
+
+    def start(self, source, title=None, location=None, region_margin=0.2, source_id=None,
+              zones=None, lines=None):
+        """Start analysing a source; an existing session with the same ID is replaced"""
+        source_id = source_id or uuid.uuid4().hex[:8]
+        replaced = None
+        with self._lock:
+            replaced = self._sessions.pop(source_id, None)
+            if self._running_count() >= self.max_sessions:
+                if replaced is not None:
+                    self._sessions[source_id] = replaced
+                raise SessionLimitError(
+                    f"Maximum of {self.max_sessions} concurrent sources reached")
+            session = AnalysisSession(
+                source,
+                detector_factory=self.detector_factory,
+                render=self.render,
+                exporter=self.exporter_factory(location) if self.exporter_factory else None,
+                face_recognition=self.face_recognition,
+                source_id=source_id,
+                title=title,
+                location=location,
+                region_margin=region_margin,
+                controller_factory=self.controller_factory,
+                motion_gate_factory=self.motion_gate_factory,
+                zones=zones,
+                lines=lines,
+                ring_factory=self.ring_factory,
+                stats_interval=self.stats_interval,
+                on_failed=self._on_failed
+            )
+            self._sessions[source_id] = session
+            self._starting.add(session)
+            self._errors.pop(source_id, None)
+
+        if replaced is not None:
+            replaced.stop()
+        try:
+            session.start()
+        except Exception:
+            with self._lock:
+                self._starting.discard(session)
+                if self._sessions.get(source_id) is session:
+                    del self._sessions[source_id]
+            session.stop()
+            raise
+        with self._lock:
+            self._starting.discard(session)
+        return session
+
+    def _on_failed(self, session):
+        """Called from the session's decoder thread when its capture cannot be opened"""
+        with self._lock:
+            if self._sessions.get(session.source_id) is not session:
+                return
+            del self._sessions[session.source_id]
+            self._errors[session.source_id] = session.error
+        session.stop()
+
+    def last_error(self, source_id):
+        """Error of the last session for source_id that was removed because its capture failed"""
+        with self._lock:
+            return self._errors.get(source_id)
+
+    def get(self, source_id):
+        with self._lock:
+            return self._sessions.get(source_id)
+
+    def stop(self, source_id):
+        """Stop one source; returns False if it was not running"""
+        with self._lock:
+            session = self._sessions.pop(source_id, None)
+        if session is None:
+            return False
+        session.stop()
+        return True
+
+    def stop_all(self):
+        with self._lock:
+            sessions = list(self._sessions.values())
+            self._sessions.clear()
+        for session in sessions:
+            session.stop()
+
+    def list(self):
+        with self._lock:
+            sessions = list(self._sessions.values())
+        return [session.describe() for session in sessions]
+
+    def _running_count(self):
+        return sum(1 for session in self._sessions.values()
+                   if session in self._starting or session.is_running())
+
+    def stats(self):
+        with self._lock:
+            return {"active": self._running_count(), "max_sessions": self.max_sessions}
@@ -0,0 +1,374 @@
+import json
+import os
+import sqlite3
+import threading
+import uuid
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional
+
+from data_management import StorageBackend
+
+DEFAULT_SQLITE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'foot_traffic.db')
+
+# Relational shape follows shared/schema.ts (locations, foot_traffic, peak_hours)
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS locations (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL UNIQUE,
+    zone TEXT NOT NULL DEFAULT '',
+    lat REAL NOT NULL DEFAULT 0,
+    lon REAL NOT NULL DEFAULT 0,
+    population INTEGER,
+    color TEXT DEFAULT '#0039a6',
+    created_at TEXT DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS foot_traffic (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    doc_id TEXT NOT NULL UNIQUE,
+    location_id INTEGER NOT NULL REFERENCES locations(id),
+    people_count INTEGER NOT NULL,
+    avg_dwell_time REAL NOT NULL,
+    highest_dwell_time REAL NOT NULL,
+    timestamp TEXT NOT NULL,
+    date TEXT NOT NULL,
+    day TEXT NOT NULL,
+    time TEXT NOT NULL,
+    day_of_week INTEGER NOT NULL,
+    hour INTEGER NOT NULL,
+    entries INTEGER,
+    exits INTEGER,
+    seq INTEGER
+);
+
+CREATE INDEX IF NOT EXISTS idx_foot_traffic_location_timestamp
+    ON foot_traffic (location_id, timestamp);
+CREATE INDEX IF NOT EXISTS idx_foot_traffic_timestamp
+    ON foot_traffic (timestamp);
+
+-- Minute, hour and day aggregates of foot_traffic, updated as samples are written
+CREATE TABLE IF NOT EXISTS foot_traffic_rollups (
+    id TEXT PRIMARY KEY,
+    resolution TEXT NOT NULL,
+    location_id INTEGER NOT NULL REFERENCES locations(id),
+    bucket_start TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    people_sum INTEGER NOT NULL,
+    people_min INTEGER,
+    people_max INTEGER,
+    people_mean REAL NOT NULL,
+    dwell_sum REAL NOT NULL,
+    dwell_min REAL,
+    dwell_max REAL,
+    dwell_mean REAL NOT NULL,
+    highest_dwell_max REAL NOT NULL,
+    entries INTEGER NOT NULL DEFAULT 0,
+    exits INTEGER NOT NULL DEFAULT 0,
+    last_seq INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE INDEX IF NOT EXISTS idx_foot_traffic_rollups_bucket
+    ON foot_traffic_rollups (resolution, bucket_start, location_id);
+
+CREATE TABLE IF NOT EXISTS peak_hours (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    date TEXT DEFAULT CURRENT_TIMESTAMP,
+    start_time TEXT NOT NULL,
+    max_time TEXT NOT NULL,
+    end_time TEXT NOT NULL,
+    start_status TEXT NOT NULL,
+    max_status TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS calendar_events (
+    id TEXT PRIMARY KEY,
+    title TEXT NOT NULL,
+    start TEXT NOT NULL,
+    "end" TEXT,
+    color TEXT NOT NULL,
+    type TEXT NOT NULL,
+    description TEXT,
+    status TEXT NOT NULL DEFAULT 'pending',
+    created_at TEXT DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS users (
+    id TEXT PRIMARY KEY,
+    email TEXT NOT NULL UNIQUE,
+    password TEXT NOT NULL,
+    data TEXT,
+    created_at TEXT DEFAULT CURRENT_TIMESTAMP
+);
+"""
+
+INSERT_FOOT_TRAFFIC = """
+INSERT OR REPLACE INTO foot_traffic
+    (doc_id, location_id, people_count, avg_dwell_time, highest_dwell_time,
+     timestamp, date, day, time, day_of_week, hour, entries, exits, seq)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+SELECT_FOOT_TRAFFIC = """
+SELECT f.doc_id, l.name, f.people_count, f.avg_dwell_time, f.highest_dwell_time,
+       f.timestamp, f.date, f.day, f.time, f.entries, f.exits
+FROM foot_traffic f JOIN locations l ON l.id = f.location_id
+"""
+
+ROLLUP_COLUMNS = ('count', 'people_sum', 'people_min', 'people_max', 'people_mean', 'dwell_sum', 'dwell_min',
+                  'dwell_max', 'dwell_mean', 'highest_dwell_max', 'entries', 'exits', 'last_seq')
+
+INSERT_ROLLUP = f"""
+INSERT OR REPLACE INTO foot_traffic_rollups
+    (id, resolution, location_id, bucket_start, {', '.join(ROLLUP_COLUMNS)})
+VALUES (?, ?, ?, ?, {', '.join('?' * len(ROLLUP_COLUMNS))})
+"""
+
+SELECT_ROLLUPS = f"""
+SELECT r.id, r.resolution, l.name, r.bucket_start, {', '.join('r.' + column for column in ROLLUP_COLUMNS)}
+FROM foot_traffic_rollups r JOIN locations l ON l.id = r.location_id
+"""
+
+
+class SQLiteStorage(StorageBackend):
+    """Embedded storage for on-site deployments without Firestore.
+
+    Uses WAL mode so the write-behind thread and request handlers do not
+    block each other, one connection per thread, and executemany() bulk
+    inserts for foot traffic batches.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or DEFAULT_SQLITE_PATH
+        self._local = threading.local()
+        self._location_ids = {}
+        self._location_lock = threading.Lock()
+        conn = self._connection()
+        conn.executescript(SCHEMA)
+        self._migrate(conn)
+        conn.commit()
+        self._start_summary()
+        self._start_writer()
+
+    @staticmethod
+    def _migrate(conn: sqlite3.Connection):
+        """Add columns introduced after a database was created"""
+        columns = {row[1] for row in conn.execute('PRAGMA table_info(foot_traffic)')}
+        if 'seq' not in columns:
+            conn.execute('ALTER TABLE foot_traffic ADD COLUMN seq INTEGER')
+        # Samples without seq were stored before rollups existed and still need a backfill
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_foot_traffic_unrolled ON foot_traffic (timestamp) '
+                     'WHERE seq IS NULL')
+        columns = {row[1] for row in conn.execute('PRAGMA table_info(foot_traffic_rollups)')}
+        if 'last_seq' not in columns:
+            conn.execute('ALTER TABLE foot_traffic_rollups ADD COLUMN last_seq INTEGER NOT NULL DEFAULT 0')
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('PRAGMA foreign_keys=ON')
+            self._local.conn = conn
+        return conn
+
+    def _location_id(self, conn: sqlite3.Connection, name: str) -> int:
+        with self._location_lock:
+            location_id = self._location_ids.get(name)
+            if location_id is None:
+                conn.execute('INSERT OR IGNORE INTO locations (name) VALUES (?)', (name,))
+                location_id = conn.execute('SELECT id FROM locations WHERE name = ?', (name,)).fetchone()[0]
+                self._location_ids[name] = location_id
+            return location_id
+
+    def _write_foot_traffic_batch(self, records: List, rollups: List = ()) -> None:
+        conn = self._connection()
+        with conn:
+            rows = []
+            for doc_id, data in records:
+                timestamp = data['timestamp']
+                rows.append((
+                    doc_id,
+                    self._location_id(conn, data.get('location') or 'Unknown'),
+                    data.get('people_count', 0),
+                    data.get('avg_dwell_time', 0),
+                    data.get('highest_dwell_time', 0),
+                    timestamp.isoformat(),
+                    data['date'],
+                    data['day'],
+                    data['time'],
+                    timestamp.weekday(),
+                    timestamp.hour,
+                    data.get('entries'),
+                    data.get('exits'),
+                    data.get('seq')
+                ))
+            conn.executemany(INSERT_FOOT_TRAFFIC, rows)
+            conn.executemany(INSERT_ROLLUP, [
+                (rollup_id, data['resolution'], self._location_id(conn, data['location']), data['bucket_start'],
+                 *(data[column] for column in ROLLUP_COLUMNS))
+                for rollup_id, data in rollups])
+
+    @staticmethod
+    def _rollup_row(row) -> Dict:
+        return {'resolution': row[1], 'location': row[2], 'bucket_start': row[3],
+                **dict(zip(ROLLUP_COLUMNS, row[4:]))}
+
+    def _load_rollups(self, rollup_ids: List[str]) -> Dict[str, Dict]:
+        rows = self._connection().execute(
+            SELECT_ROLLUPS + f" WHERE r.id IN ({', '.join('?' * len(rollup_ids))})", tuple(rollup_ids)).fetchall()
+        return {row[0]: self._rollup_row(row) for row in rows}
+
+    def _query_rollups(self, resolution: str, start: str, end: str, location: Optional[str]) -> List[Dict]:
+        where = ' WHERE r.resolution = ? AND r.bucket_start >= ? AND r.bucket_start < ?'
+        params = (resolution, start, end)
+        if location is not None:
+            where += ' AND l.name = ?'
+            params += (location,)
+        rows = self._connection().execute(SELECT_ROLLUPS + where + ' ORDER BY r.bucket_start, l.name',
+                                          params).fetchall()
+        return [self._rollup_row(row) for row in rows]
+
+    def _max_rollup_seq(self) -> Optional[int]:
+        return self._connection().execute('SELECT MAX(last_seq) FROM foot_traffic_rollups').fetchone()[0]
+
+    def _unrolled_foot_traffic(self, limit: int) -> Iterator[List[Dict]]:
+        # Each chunk is marked (seq 0) by the caller before the next one is read
+        while True:
+            records = self._query_foot_traffic(' WHERE f.seq IS NULL', (), limit)
+            if not records:
+                return
+            yield records
+
+    def _delete_foot_traffic_before(self, cutoff: datetime) -> int:
+        conn = self._connection()
+        with conn:
+            return conn.execute('DELETE FROM foot_traffic WHERE timestamp < ? AND seq IS NOT NULL',
+                                (cutoff.isoformat(),)).rowcount
+
+    def _delete_rollups_before(self, resolution: str, start: str) -> int:
+        conn = self._connection()
+        with conn:
+            return conn.execute('DELETE FROM foot_traffic_rollups WHERE resolution = ? AND bucket_start < ?',
+                                (resolution, start)).rowcount
+
+    @staticmethod
+    def _foot_traffic_row(row) -> Dict:
+        record = {
+            'id': row[0],
+            'location': row[1],
+            'people_count': row[2],
+            'avg_dwell_time': row[3],
+            'highest_dwell_time': row[4],
+            'timestamp': datetime.fromisoformat(row[5]),
+            'date': row[6],
+            'day': row[7],
+            'time': row[8]
+        }
+        if row[9] is not None:
+            record['entries'] = row[9]
+            record['exits'] = row[10]
+        return record
+
+    def _query_foot_traffic(self, where: str = '', params: tuple = (), limit: Optional[int] = None) -> List[Dict]:
+        sql = SELECT_FOOT_TRAFFIC + where + ' ORDER BY f.timestamp DESC'
+        if limit is not None:
+            sql += f' LIMIT {int(limit)}'
+        rows = self._connection().execute(sql, params).fetchall()
+        return [self._foot_traffic_row(row) for row in rows]
+
+    def _oldest_foot_traffic_timestamp(self) -> Optional[datetime]:
+        oldest = self._connection().execute('SELECT MIN(timestamp) FROM foot_traffic').fetchone()[0]
+        return datetime.fromisoformat(oldest) if oldest is not None else None
+
+    def _recent_foot_traffic(self, limit: int) -> List[Dict]:
+        return self._query_foot_traffic(limit=limit)
+
+    def get_foot_traffic_by_location(self, location: str) -> List[Dict]:
+        """Get foot traffic data for a specific location"""
+        return (self._query_foot_traffic(' WHERE l.name = ?', (location,))
+                + self._compacted_foot_traffic(location=location))
+
+    def get_all_foot_traffic(self) -> List[Dict]:
+        """Get all foot traffic data"""
+        return self._query_foot_traffic() + self._compacted_foot_traffic()
+
+    def get_foot_traffic_by_date_range(self, start_date: datetime, end_date: datetime) -> List[Dict]:
+        """Get foot traffic data for a specific date range"""
+        return (self._query_foot_traffic(' WHERE f.timestamp >= ? AND f.timestamp <= ?',
+                                         (start_date.isoformat(), end_date.isoformat()))
+                + self._compacted_foot_traffic(start_date, end_date))
+
+    def add_calendar_event(self, event_data: Dict) -> Dict:
+        """Add a calendar event"""
+        if not event_data.get('title') or not event_data.get('start'):
+            raise ValueError("Missing required fields: title and start")
+
+        event = {
+            'id': uuid.uuid4().hex,
+            'title': event_data['title'],
+            'start': event_data['start'],
+            'end': event_data.get('end'),
+            'color': event_data.get('color', '#3B82F6'),
+            'type': event_data.get('type', 'task'),
+            'description': event_data.get('description', ''),
+            'status': event_data.get('status', 'pending'),
+            'createdAt': datetime.now().isoformat()
+        }
+        conn = self._connection()
+        with conn:
+            conn.execute(
+                'INSERT INTO calendar_events (id, title, start, "end", color, type, description, status, created_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (event['id'], event['title'], event['start'], event['end'], event['color'],
+                 event['type'], event['description'], event['status'], event['createdAt']))
+        return event
+
+    def get_calendar_events(self) -> List[Dict]:
+        """Get all calendar events"""
+        rows = self._connection().execute(
+            'SELECT id, title, start, "end", color, type, description, status, created_at '
+            'FROM calendar_events ORDER BY start ASC').fetchall()
+        return [{
+            'id': row[0],
+            'title': row[1],
+            'start': row[2],
+            'end': row[3],
+            'color': row[4],
+            'type': row[5],
+            'description': row[6] or '',
+            'status': row[7],
+            'createdAt': row[8]
+        } for row in rows]
+
+    def delete_calendar_event(self, event_id: str) -> None:
+        """Delete a calendar event"""
+        conn = self._connection()
+        with conn:
+            deleted = conn.execute('DELETE FROM calendar_events WHERE id = ?', (event_id,)).rowcount
+        if not deleted:
+            raise ValueError(f"Event with ID {event_id} not found")
+
+    def authenticate_user(self, email: str, password: str) -> Optional[Dict]:
+        """Authenticate a user"""
+        row = self._connection().execute(
+            'SELECT id, data FROM users WHERE email = ? AND password = ?', (email, password)).fetchone()
+        if row is None:
+            return None
+        user = json.loads(row[1]) if row[1] else {}
+        user['id'] = row[0]
+        return user
+
+    def create_user(self, user_data: Dict) -> Dict:
+        """Create a new user"""
+        conn = self._connection()
+        if conn.execute('SELECT 1 FROM users WHERE email = ?', (user_data['email'],)).fetchone():
+            raise Exception("User with this email already exists")
+
+        user_data['id'] = uuid.uuid4().hex
+        user_data['createdAt'] = datetime.now().isoformat()
+        with conn:
+            conn.execute('INSERT INTO users (id, email, password, data) VALUES (?, ?, ?, ?)',
+                         (user_data['id'], user_data['email'], user_data.get('password', ''),
+                          json.dumps(user_data)))
+        return user_data
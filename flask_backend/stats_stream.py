@@ -0,0 +1,102 @@
+import collections
+import json
+import threading
+import time
+import uuid
+from types import MappingProxyType
+
+StatsSnapshot = collections.namedtuple("StatsSnapshot", "version timestamp data text")
+
+
+class StatsFeed:
+    """Versioned, read-only stats snapshots for push subscribers (Server-Sent Events).
+
+    ``publish`` is called after every analysed frame. A new snapshot is cut
+    only when a value other than the ``ignore`` keys changed, and at most
+    once per ``interval`` seconds; changes arriving in between are coalesced
+    into the next snapshot. Each snapshot is serialised once and all
+    subscribers wait on one condition, so an update costs a single
+    broadcast however many dashboards are connected. ``epoch`` identifies
+    this feed, so clients can tell a resumed stream from a new source.
+    """
+
+    def __init__(self, interval=0.5, ignore=("timestamp",)):
+        self.interval = interval
+        self.ignore = frozenset(ignore)
+        self.epoch = uuid.uuid4().hex[:8]
+        self._cond = threading.Condition()
+        self._snapshot = None
+        self._pending = None
+        self._emitted_at = 0.0
+        self._closed = False
+        self.published = 0
+        self.coalesced = 0
+
+    @property
+    def closed(self):
+        return self._closed
+
+    @property
+    def latest(self):
+        return self._snapshot
+
+    def _same(self, stats):
+        if self._snapshot is None:
+            return False
+        previous = self._snapshot.data
+        keys = (set(stats) | set(previous)) - self.ignore
+        return all(stats.get(key) == previous.get(key) for key in keys)
+
+    def publish(self, stats):
+        with self._cond:
+            if self._closed:
+                return
+            first_pending = self._pending is None
+            if not first_pending:
+                self.coalesced += 1
+            elif self._same(stats):
+                return
+            self._pending = dict(stats)
+            if time.time() - self._emitted_at >= self.interval:
+                self._emit()
+            elif first_pending:
+                # Let waiters shorten their sleep to the end of the coalescing window
+                self._cond.notify_all()
+
+    def _emit(self):
+        data = self._pending
+        version = self._snapshot.version + 1 if self._snapshot is not None else 1
+        text = json.dumps(data, separators=(',', ':'), default=str)
+        now = time.time()
+        self._snapshot = StatsSnapshot(version, now, MappingProxyType(data), text)
+        self._pending = None
+        self._emitted_at = now
+        self.published += 1
+        self._cond.notify_all()
+
+    def wait(self, last_version, timeout):
+        """Return the newest snapshot with version > last_version, or None on timeout/close"""
+        deadline = time.time() + timeout
+        with self._cond:
+            while True:
+                now = time.time()
+                if self._pending is not None and now - self._emitted_at >= self.interval:
+                    self._emit()
+                if self._snapshot is not None and self._snapshot.version > last_version:
+                    return self._snapshot
+                remaining = deadline - now
+                if self._closed or remaining <= 0:
+                    return None
+                if self._pending is not None:
+                    # Wake up to flush a coalesced change even if no further publish arrives
+                    remaining = min(remaining, self._emitted_at + self.interval - now)
+                self._cond.wait(max(remaining, 0.001))
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def stats(self):
+        return {"version": self._snapshot.version if self._snapshot else 0,
+                "published": self.published, "coalesced": self.coalesced}
@@ -0,0 +1,259 @@
+import json
+import logging
+import struct
+import threading
+import time
+
+from traffic_analysis import FACE_COLOR, IN_REGION_COLOR
+from video_pipeline import stream_variant
+
+logger = logging.getLogger(__name__)
+
+FRAME_MESSAGE = 1
+FRAME_HEADER = struct.Struct('>BI')
+
+
+def _compact(message):
+    return json.dumps(message, separators=(',', ':'))
+
+
+def metadata_message(annotations, seq):
+    """Per-detection metadata: person boxes as [x1, y1, x2, y2, track_id, in_region], face boxes,
+    labels and counts"""
+    track_ids = annotations.track_ids
+    boxes, faces = [], []
+    # Person boxes come first, in track_ids order; face boxes are appended after them
+    for index, (x1, y1, x2, y2, color) in enumerate(annotations.boxes):
+        if color == FACE_COLOR:
+            faces.append([x1, y1, x2, y2])
+        else:
+            track_id = track_ids[index] if index < len(track_ids) else None
+            boxes.append([x1, y1, x2, y2, track_id, int(color == IN_REGION_COLOR)])
+    return {
+        "type": "meta",
+        "seq": seq,
+        "t": round(annotations.timestamp, 3),
+        "people_count": annotations.people_count,
+        "avg_dwell_time": round(annotations.avg_dwell_time, 2),
+        "highest_dwell_time": round(annotations.highest_dwell_time, 2),
+        "boxes": boxes,
+        "faces": faces,
+        "labels": [[text, x, y] for text, (x, y), _ in annotations.labels],
+        "zones": {name: zone["people_count"] for name, zone in annotations.zones.items()},
+        "lines": annotations.lines
+    }
+
+
+def geometry_message(annotations, version):
+    """Static shapes to draw client-side: the counting region, zone polygons and counting lines"""
+    return {
+        "type": "geometry",
+        "version": version,
+        "region": list(annotations.region) if annotations.region is not None else None,
+        "zones": [[name, polygon.tolist()] for name, polygon in annotations.zone_polygons],
+        "lines": [[name, list(start), list(end)] for name, start, end in annotations.line_segments]
+    }
+
+
+class MetadataFeed:
+    """Latest detection metadata of one source, serialised once for every subscriber.
+
+    ``publish`` only stores the annotations; the JSON text is built the
+    first time a subscriber asks for that sequence number. Geometry is sent
+    as its own message and versioned, so it only goes out when it changes.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._annotations = None
+        self._seq = 0
+        self._text = None
+        self._text_seq = 0
+        self._geometry_key = None
+        self._geometry_text = None
+        self.geometry_version = 0
+        self.subscribers = 0
+        self._closed = False
+
+    def publish(self, annotations):
+        with self._cond:
+            if not self.subscribers:
+                return
+            self._annotations = annotations
+            self._seq += 1
+            key = (annotations.region, tuple(annotations.line_segments),
+                   tuple((name, polygon.tobytes()) for name, polygon in annotations.zone_polygons))
+            if key != self._geometry_key:
+                self._geometry_key = key
+                self.geometry_version += 1
+                self._geometry_text = _compact(geometry_message(annotations, self.geometry_version))
+            self._cond.notify_all()
+
+    def wait(self, last_seq, timeout=0):
+        """Return (seq, JSON text) newer than last_seq, or (last_seq, None)"""
+        with self._cond:
+            if self._seq <= last_seq and timeout and not self._closed:
+                self._cond.wait(timeout)
+            if self._seq <= last_seq or self._annotations is None:
+                return last_seq, None
+            if self._text_seq != self._seq:
+                self._text = _compact(metadata_message(self._annotations, self._seq))
+                self._text_seq = self._seq
+            return self._seq, self._text
+
+    def geometry(self):
+        """(version, JSON text) of the current geometry"""
+        with self._cond:
+            return self.geometry_version, self._geometry_text
+
+    def add_subscriber(self):
+        with self._cond:
+            self.subscribers += 1
+
+    def remove_subscriber(self):
+        with self._cond:
+            self.subscribers -= 1
+            if not self.subscribers:
+                self._annotations = None
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+
+class StreamConnection:
+    """Pushes one source's frames and detection metadata over a WebSocket.
+
+    Frames are binary messages: a type byte (1), the frame sequence number
+    as a big-endian uint32, then the JPEG. Metadata and geometry are compact
+    JSON text messages; while no frame is due the connection sleeps on the
+    metadata feed rather than polling. At any time the client may send JSON
+    with any of ``width``, ``quality``, ``fps``, ``overlay`` and
+    ``metadata_only`` to renegotiate the stream, ``window`` to enable flow control, and
+    ``{"ack": seq}`` once it has shown a frame. With a window of N at most N
+    frames are unacknowledged; frames published meanwhile are dropped for
+    this connection only, as are frames that arrive while the socket is
+    still busy sending, so a slow link never builds a backlog.
+    """
+
+    OPTIONS = {"width": int, "quality": int, "fps": float, "overlay": bool,
+               "metadata_only": bool, "window": int}
+
+    def __init__(self, ws, session, options=None, poll_interval=0.05):
+        self.ws = ws
+        self.session = session
+        self.poll_interval = poll_interval
+        self.width = None
+        self.quality = None
+        self.fps = None
+        self.overlay = True
+        self.metadata_only = False
+        self.window = 0
+        self.configure(options or {})
+        self.frames_sent = 0
+        self.frames_skipped = 0
+        self.metadata_sent = 0
+        self._unacked = []
+
+    def configure(self, options):
+        for name, cast in self.OPTIONS.items():
+            value = options.get(name)
+            if value is None:
+                continue
+            if cast is bool and isinstance(value, str):
+                value = value.lower() in ("1", "true", "yes")
+            try:
+                setattr(self, name, cast(value))
+            except (TypeError, ValueError):
+                logger.warning(f"Ignoring invalid stream option {name}={value!r}")
+        if self.fps is not None and self.fps <= 0:
+            self.fps = None
+
+    @property
+    def variant(self):
+        if self.metadata_only:
+            return None
+        return stream_variant(self.width, self.quality, self.overlay)
+
+    def options(self):
+        return {name: getattr(self, name) for name in self.OPTIONS}
+
+    def _receive(self):
+        while True:
+            text = self.ws.receive(timeout=0)
+            if text is None:
+                return
+            try:
+                message = json.loads(text)
+            except (TypeError, ValueError):
+                logger.warning("Ignoring malformed stream control message")
+                continue
+            if not isinstance(message, dict):
+                continue
+            if "ack" in message:
+                try:
+                    acked = int(message["ack"])
+                except (TypeError, ValueError):
+                    continue
+                self._unacked = [seq for seq in self._unacked if seq > acked]
+            if any(name in message for name in self.OPTIONS):
+                self.configure(message)
+                self.ws.send(_compact({"type": "config", **self.options()}))
+
+    def run(self):
+        """Serve the connection until the client disconnects or the source stops"""
+        broadcaster = self.session.pipeline.broadcaster
+        feed = self.session.metadata
+        feed.add_subscriber()
+        variant = None
+        frame_seq = meta_seq = geometry_version = 0
+        next_frame = 0
+        try:
+            self.ws.send(_compact({"type": "hello", "source_id": self.session.source_id,
+                                   **self.options()}))
+            while not broadcaster.closed:
+                self._receive()
+                if self.variant != variant:
+                    if variant is not None:
+                        broadcaster.remove_viewer(variant)
+                    variant = self.variant
+                    if variant is not None:
+                        broadcaster.add_viewer(variant)
+
+                version, geometry = feed.geometry()
+                if version != geometry_version and geometry is not None:
+                    self.ws.send(geometry)
+                    geometry_version = version
+                meta_seq, metadata = feed.wait(meta_seq)
+                if metadata is not None:
+                    self.ws.send(metadata)
+                    self.metadata_sent += 1
+
+                if variant is None or (self.window and len(self._unacked) >= self.window):
+                    # No frame can go out until the client renegotiates or acks; sleep until new metadata
+                    feed.wait(meta_seq, self.poll_interval)
+                    continue
+                remaining = next_frame - time.time()
+                if remaining > 0:
+                    feed.wait(meta_seq, min(self.poll_interval, remaining))
+                    continue
+                seq, frame = broadcaster.wait_for_frame(frame_seq, timeout=self.poll_interval,
+                                                        variant=variant)
+                if frame is None:
+                    frame_seq = seq
+                    continue
+                if frame_seq and seq > frame_seq + 1:
+                    self.frames_skipped += seq - frame_seq - 1
+                frame_seq = seq
+                self.ws.send(FRAME_HEADER.pack(FRAME_MESSAGE, seq & 0xFFFFFFFF) + frame)
+                self.frames_sent += 1
+                if self.window:
+                    self._unacked.append(seq)
+                next_frame = time.time() + 1.0 / self.fps if self.fps else 0
+        finally:
+            if variant is not None:
+                broadcaster.remove_viewer(variant)
+            feed.remove_subscriber()
+            logger.info(f"Stream socket closed: {self.frames_sent} frames sent, "
+                        f"{self.frames_skipped} skipped, {self.metadata_sent} metadata messages")
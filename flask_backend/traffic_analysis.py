@@ -0,0 +1,297 @@
+import collections
+import time
+import logging
+
+import numpy as np
+
+from dwell_tracker import DwellTracker
+from face_tracking import TrackIdentityCache, person_face_crop
+from line_counter import LineCounter
+from zones import ZoneMap
+
+logger = logging.getLogger(__name__)
+
+# Box colours (BGR)
+IN_REGION_COLOR = (0, 255, 0)
+OUT_REGION_COLOR = (0, 0, 255)
+FACE_COLOR = (255, 0, 0)
+ZONE_COLOR = (255, 255, 0)
+LINE_COLOR = (0, 255, 255)
+
+
+def is_point_in_region(point, region):
+    """Check if a point (x,y) is inside the counting region"""
+    x, y = point
+    rx1, ry1, rx2, ry2 = region
+    return rx1 < x < rx2 and ry1 < y < ry2
+
+
+def points_in_region(points, region):
+    """Vectorised is_point_in_region for an (n, 2) array of points"""
+    rx1, ry1, rx2, ry2 = region
+    x, y = points[:, 0], points[:, 1]
+    return (rx1 < x) & (x < rx2) & (ry1 < y) & (y < ry2)
+
+
+def tracked_people(boxes, conf_threshold=0.35):
+    """Integer xyxy boxes and track IDs of tracked people, without a per-box loop"""
+    if boxes is None or boxes.id is None or len(boxes) == 0:
+        return np.zeros((0, 4), dtype=int), np.zeros(0, dtype=int)
+    keep = (boxes.cls.cpu().numpy() == 0) & (boxes.conf.cpu().numpy() > conf_threshold)
+    xyxy = boxes.xyxy.cpu().numpy()[keep].astype(int)
+    track_ids = boxes.id.cpu().numpy()[keep].astype(int)
+    return xyxy, track_ids
+
+
+def get_counting_region(frame_width, frame_height, region_margin=0.2):
+    """Return the central counting rectangle for a frame size"""
+    region_x1 = int(frame_width * region_margin)
+    region_x2 = int(frame_width * (1 - region_margin))
+    region_y1 = int(frame_height * region_margin)
+    region_y2 = int(frame_height * (1 - region_margin))
+    return (region_x1, region_y1, region_x2, region_y2)
+
+
+class FrameAnnotations:
+    """Result of analysing one frame: what to draw and the resulting stats"""
+    __slots__ = ("boxes", "labels", "people_count", "avg_dwell_time",
+                 "highest_dwell_time", "timestamp", "zones", "zone_polygons",
+                 "lines", "line_segments", "region", "track_ids", "detected")
+
+    def __init__(self, boxes=None, labels=None, people_count=0,
+                 avg_dwell_time=0, highest_dwell_time=0, timestamp=None,
+                 zones=None, zone_polygons=None, lines=None, line_segments=None, region=None,
+                 track_ids=None, detected=True):
+        # boxes: list of (x1, y1, x2, y2, color); labels: list of (text, (x, y), color)
+        self.boxes = boxes if boxes is not None else []
+        # ByteTrack ID of each box, in the same order
+        self.track_ids = track_ids if track_ids is not None else []
+        self.labels = labels if labels is not None else []
+        # zones: name -> per-zone stats; zone_polygons: list of (name, pixel points)
+        self.zones = zones if zones is not None else {}
+        self.zone_polygons = zone_polygons if zone_polygons is not None else []
+        # lines: name -> cumulative {"in", "out"}; line_segments: list of (name, start, end) in pixels
+        self.lines = lines if lines is not None else {}
+        self.line_segments = line_segments if line_segments is not None else []
+        # Counting rectangle (x1, y1, x2, y2) in pixels
+        self.region = region
+        self.people_count = people_count
+        self.avg_dwell_time = avg_dwell_time
+        self.highest_dwell_time = highest_dwell_time
+        self.timestamp = timestamp if timestamp is not None else time.time()
+        # False when the motion gate skipped the detector and the previous boxes were reused
+        self.detected = detected
+
+
+class TrafficAnalyzer:
+    """Detection, tracking and dwell-time state for one video source"""
+
+    def __init__(self, detector, region_margin=0.2, face_recognition=None, motion_gate=None,
+                 stale_track_timeout=10.0, zones=None, lines=None, annotate=True):
+        # Anything with detect(frame) -> tracked Results, e.g. inference_scheduler.SourceDetector
+        self.detector = detector
+        self.region_margin = region_margin
+        # Callable returning the face recognition system, or None while disabled
+        self.face_recognition = face_recognition
+        # Optional motion_gate.MotionGate; static frames reuse the last tracks
+        self.motion_gate = motion_gate
+        self.dwell = DwellTracker(stale_track_timeout)
+        # Optional user-defined polygon zones, each with its own counts and dwell
+        self.zone_map = ZoneMap(zones, stale_track_timeout) if zones else None
+        # Optional directed lines with cumulative entry/exit counts
+        self.line_counter = LineCounter(lines) if lines else None
+        # Headless runs (batch_analyzer) only need the stats, not what to draw
+        self.annotate = annotate
+        # Who each track is, so faces are only re-identified every few detections
+        self.identities = TrackIdentityCache()
+        self.reset()
+
+    def reset(self):
+        """Forget all tracks, e.g. when the capture is reopened"""
+        self.counting_region = None
+        self.dwell.reset()
+        if self.zone_map is not None:
+            self.zone_map.reset()
+        if self.line_counter is not None:
+            self.line_counter.reset()
+        self.identities.reset()
+        self.detection_step = 0
+        # Results from the face worker pool; late results from before a reset are ignored
+        self._face_results = collections.deque()
+        self._faces_pending = set()
+        self._face_generation = getattr(self, '_face_generation', 0) + 1
+        self.people_in_region = set()
+        self.last_annotations = None
+        if self.motion_gate is not None:
+            self.motion_gate.reset()
+
+    def analyze(self, frame, now=None):
+        """Run detection on a frame and update the per-track dwell state
+
+        ``now`` defaults to the wall clock; offline analysis passes the video timestamp.
+        """
+        if self.counting_region is None:
+            frame_height, frame_width = frame.shape[:2]
+            self.counting_region = get_counting_region(frame_width, frame_height, self.region_margin)
+            if self.zone_map is not None:
+                self.zone_map.build(frame_width, frame_height)
+            if self.line_counter is not None:
+                self.line_counter.build(frame_width, frame_height)
+
+        if (self.motion_gate is not None and self.last_annotations is not None
+                and not self.motion_gate.should_detect(frame, self.counting_region, now)):
+            return self._reuse_last_detection(now)
+
+        # Detection runs batched with other sources; tracking stays per source
+        last_detection = self.detector.detect(frame)
+
+        annotations = FrameAnnotations(region=self.counting_region)
+        self.last_annotations = annotations
+        if last_detection is None:
+            return annotations
+
+        current_time = now if now is not None else time.time()
+        self.detection_step += 1
+
+        # The whole boxes tensor is filtered and tested at once, so cost per person stays in NumPy
+        xyxy, track_ids = tracked_people(last_detection.boxes)
+        centroids = (xyxy[:, :2] + xyxy[:, 2:]) // 2
+        in_region = points_in_region(centroids, self.counting_region)
+
+        self.people_in_region = set(track_ids[in_region].tolist())
+        self.dwell.update(self.people_in_region, track_ids[~in_region].tolist(), current_time)
+        if self.annotate:
+            # Green box for people in region, red box for people outside it
+            annotations.boxes.extend(
+                (x1, y1, x2, y2, IN_REGION_COLOR if inside else OUT_REGION_COLOR)
+                for (x1, y1, x2, y2), inside in zip(xyxy.tolist(), in_region.tolist()))
+            annotations.track_ids = track_ids.tolist()
+
+        # Process face recognition if active
+        face_system = self.face_recognition() if self.face_recognition else None
+        if face_system:
+            try:
+                self._recognize_faces(face_system, frame, xyxy, track_ids, annotations)
+            except Exception as e:
+                logger.error(f"Error in face recognition: {e}")
+
+        if self.zone_map is not None:
+            self.zone_map.update(track_ids, centroids, current_time)
+            annotations.zones = self.zone_map.stats(current_time)
+            if self.annotate:
+                annotations.zone_polygons = list(zip((zone.name for zone in self.zone_map.zones),
+                                                     self.zone_map.polygons))
+
+        if self.line_counter is not None:
+            self.line_counter.update(track_ids, centroids)
+            annotations.lines = self.line_counter.stats()
+            if self.annotate:
+                annotations.line_segments = self._line_segments()
+
+        avg_dwell_time, highest_dwell_time = self.dwell.dwell_times(current_time)
+        annotations.people_count = len(self.people_in_region)
+        annotations.avg_dwell_time = avg_dwell_time
+        annotations.highest_dwell_time = highest_dwell_time
+        annotations.timestamp = current_time
+        return annotations
+
+    def _reuse_last_detection(self, now=None):
+        """Keep the previous boxes for a static frame; only dwell durations advance"""
+        current_time = now if now is not None else time.time()
+        previous = self.last_annotations
+        avg_dwell_time, highest_dwell_time = self.dwell.dwell_times(current_time)
+        return FrameAnnotations(
+            boxes=previous.boxes,
+            track_ids=previous.track_ids,
+            labels=previous.labels,
+            people_count=previous.people_count,
+            avg_dwell_time=avg_dwell_time,
+            highest_dwell_time=highest_dwell_time,
+            timestamp=current_time,
+            zones=self.zone_map.stats(current_time) if self.zone_map is not None else {},
+            zone_polygons=previous.zone_polygons,
+            lines=previous.lines,
+            line_segments=previous.line_segments,
+            region=previous.region,
+            detected=False
+        )
+
+    def _line_segments(self):
+        return [(line.name, tuple(map(int, segment[0])), tuple(map(int, segment[1])))
+                for line, segment in zip(self.line_counter.lines, self.line_counter.segments)]
+
+    def _recognize_faces(self, face_system, frame, xyxy, track_ids, annotations):
+        """Identify new or stale tracks from their head crops and label every known track"""
+        boxes = dict(zip(track_ids.tolist(), xyxy.tolist()))
+        pool = getattr(face_system, 'worker_pool', None)
+        # Fall back to in-line analysis if the pool's supervisor process has died
+        if pool is not None and pool.running:
+            self._recognize_faces_async(face_system, frame, boxes, annotations)
+        else:
+            self._recognize_faces_sync(face_system, frame, boxes, annotations)
+
+        for track_id, (x1, y1, x2, y2) in boxes.items():
+            identity = self.identities.get(track_id)
+            if identity is None or not identity.face_found:
+                continue
+            label = f"{identity.name if identity.name else 'Unknown'}"
+            if identity.similarity > 0:
+                label += f" ({identity.similarity:.2f})"
+            annotations.labels.append((label, (x1, y1 - 10), FACE_COLOR))
+
+    def _recognize_faces_sync(self, face_system, frame, boxes, annotations):
+        step = self.detection_step
+        embeddings, queried = [], []
+        for track_id in self.identities.due(boxes, step):
+            cx1, cy1, cx2, cy2 = person_face_crop(boxes[track_id], frame.shape)
+            if cx2 <= cx1 or cy2 <= cy1:
+                continue
+            faces = face_system.face_app.get(frame[cy1:cy2, cx1:cx2])
+            if not faces:
+                self.identities.update(track_id, step)
+                continue
+            face = max(faces, key=lambda f: (f.bbox[2] - f.bbox[0]) * (f.bbox[3] - f.bbox[1]))
+            fx1, fy1, fx2, fy2 = face.bbox.astype(int)
+            annotations.boxes.append((cx1 + fx1, cy1 + fy1, cx1 + fx2, cy1 + fy2, FACE_COLOR))
+            embeddings.append(face.embedding)
+            queried.append(track_id)
+
+        for track_id, (name, family, similarity) in zip(queried, face_system.recognize_faces(embeddings)):
+            self.identities.update(track_id, step, name, family, similarity, face_found=True)
+
+    def _recognize_faces_async(self, face_system, frame, boxes, annotations):
+        """Hand head crops to the worker pool; identities and face boxes are applied when results arrive"""
+        step = self.detection_step
+        embeddings, found, missed = [], [], []
+        while self._face_results:
+            generation, track_id, (cx1, cy1), result = self._face_results.popleft()
+            if generation != self._face_generation:
+                continue
+            self._faces_pending.discard(track_id)
+            if result is None:
+                missed.append(track_id)
+            else:
+                # The box is relative to the head crop it was found in
+                fx1, fy1, fx2, fy2 = result[0].astype(int)
+                annotations.boxes.append((cx1 + fx1, cy1 + fy1, cx1 + fx2, cy1 + fy2, FACE_COLOR))
+                embeddings.append(result[1])
+                found.append(track_id)
+        for track_id in missed:
+            self.identities.update(track_id, step)
+        for track_id, (name, family, similarity) in zip(found, face_system.recognize_faces(embeddings)):
+            self.identities.update(track_id, step, name, family, similarity, face_found=True)
+
+        pool = face_system.worker_pool
+        generation = self._face_generation
+        for track_id in self.identities.due(boxes, step):
+            if track_id in self._faces_pending:
+                continue
+            cx1, cy1, cx2, cy2 = person_face_crop(boxes[track_id], frame.shape)
+            if cx2 <= cx1 or cy2 <= cy1:
+                continue
+            callback = (lambda result, error, track_id=track_id, origin=(cx1, cy1):
+                        self._face_results.append((generation, track_id, origin, result)))
+            if not pool.submit(frame[cy1:cy2, cx1:cx2], callback):
+                # Pool is saturated; remaining tracks stay due and are tried next step
+                break
+            self._faces_pending.add(track_id)
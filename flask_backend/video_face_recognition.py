@@ -1,57 +1,85 @@
 import cv2
 import numpy as np
 import os
-from insightface.app import FaceAnalysis
+import threading
+import time
 from datetime import datetime
+from face_gallery import FaceGallery
+from face_embedding_store import EmbeddingStore
+from face_workers import create_face_app
 
 class VideoFaceRecognition:
-    def __init__(self, family_dir="family_photos", safe_log_file="safe_members.txt"):
-        # Initialize InsightFace
-        self.face_app = FaceAnalysis(providers=['CPUExecutionProvider'])
-        self.face_app.prepare(ctx_id=0, det_size=(640, 480))
+    def __init__(self, family_dir="family_photos", safe_log_file="safe_members.txt",
+                 sync_embeddings=True, onnx_threads=None, worker_pool=None):
+        # Initialize InsightFace; onnx_threads caps its per-session thread pool (None: all cores)
+        self.face_app = create_face_app(det_size=(640, 480), threads=onnx_threads)
         
         # Paths and settings
         self.family_dir = family_dir
         self.safe_log_file = safe_log_file
-        self.face_embeddings_cache = {}
         self.similarity_threshold = 0.35
+        # Pre-normalised matrix of every cached embedding, searched in one multiply
+        self.gallery = FaceGallery(self.similarity_threshold,
+                                   ann_threshold=int(os.environ.get('FACE_ANN_THRESHOLD', '5000')))
         
         # Create necessary directories
         os.makedirs(self.family_dir, exist_ok=True)
         if not os.path.exists(self.safe_log_file):
             open(self.safe_log_file, 'a').close()
             
-        # Load face embeddings
-        self.load_face_embeddings()
+        # Serve the consolidated store right away and keep it in sync with family_dir in the
+        # background, re-scanning every refresh_interval seconds (0: only at startup) and on
+        # reload_face_embeddings. sync_embeddings=False (batch workers, whose parent already
+        # synced it) only loads it.
+        self.refresh_interval = float(os.environ.get('FACE_EMBEDDING_REFRESH_SECONDS', '60'))
+        self.embedding_store = EmbeddingStore(self.family_dir)
+        loaded = self.embedding_store.load()
+        if loaded:
+            self._rebuild_gallery()
+        else:
+            self.load_face_embeddings()
+        if sync_embeddings and (loaded or self.refresh_interval > 0):
+            threading.Thread(target=self._refresh_loop, args=(loaded,), name="face-embedding-refresh",
+                             daemon=True).start()
         
         # Track recognized faces
         self.recognized_faces = set()
 
+        # Optional started face_workers.FaceWorkerPool; while it runs, streams analyse crops
+        # asynchronously. The app starts it before any threads, see FaceWorkerPool.
+        self.worker_pool = worker_pool
+
     def load_face_embeddings(self):
         """Load all saved face embeddings"""
-        self.face_embeddings_cache.clear()
-        
-        if not os.path.exists(self.family_dir):
-            return
-            
-        for family_folder in os.listdir(self.family_dir):
-            family_path = os.path.join(self.family_dir, family_folder)
-            if not os.path.isdir(family_path):
-                continue
-                
-            embedding_files = [f for f in os.listdir(family_path) if f.endswith('_embedding.npy')]
-            for embedding_file in embedding_files:
-                try:
-                    embedding_path = os.path.join(family_path, embedding_file)
-                    embedding = np.load(embedding_path)
-                    name = os.path.splitext(embedding_file)[0][:-10]
-                    self.face_embeddings_cache[embedding_path] = {
-                        'embedding': embedding,
-                        'name': name,
-                        'family': family_folder
-                    }
-                except Exception as e:
-                    print(f"Error loading embedding {embedding_file}: {str(e)}")
+        self.embedding_store.refresh()
+        self._rebuild_gallery()
+
+    def _rebuild_gallery(self):
+        store = self.embedding_store
+        self.gallery.build(store.matrix, store.names, store.families, normalized=True)
+
+    def refresh_face_embeddings(self):
+        """Pick up new or changed embedding files; recognition keeps using the old gallery meanwhile"""
+        try:
+            if self.embedding_store.refresh():
+                self._rebuild_gallery()
+                print(f"Face gallery updated: {len(self.gallery)} embeddings")
+                return True
+        except Exception as e:
+            print(f"Error refreshing face embeddings: {e}")
+        return False
+
+    def reload_face_embeddings(self):
+        """Re-scan family_dir now, e.g. right after enrolling someone; returns True if it changed"""
+        return self.refresh_face_embeddings()
+
+    def _refresh_loop(self, refresh_now):
+        # An unchanged store costs one stat per embedding file
+        if refresh_now:
+            self.refresh_face_embeddings()
+        while self.refresh_interval > 0:
+            time.sleep(self.refresh_interval)
+            self.refresh_face_embeddings()
 
     def cosine_similarity(self, emb1, emb2):
         """Calculate cosine similarity between two embeddings"""
@@ -59,28 +87,28 @@ class VideoFaceRecognition:
 
     def recognize_face(self, embedding):
         """Find best match for a face embedding"""
-        best_match = None
-        highest_similarity = 0
-        matched_family = None
-        
-        for embedding_path, cache_data in self.face_embeddings_cache.items():
-            try:
-                similarity = self.cosine_similarity(embedding, cache_data['embedding'])
-                if similarity > self.similarity_threshold and similarity > highest_similarity:
-                    highest_similarity = similarity
-                    best_match = cache_data['name']
-                    matched_family = cache_data['family']
-            except Exception as e:
-                print(f"Error comparing with {embedding_path}: {str(e)}")
-                
-        return best_match, matched_family, highest_similarity
+        return self.recognize_faces([embedding])[0]
+
+    def recognize_faces(self, embeddings):
+        """Find the best match for every face of a frame in one gallery search"""
+        if len(embeddings) == 0:
+            return []
+        self.gallery.similarity_threshold = self.similarity_threshold
+        return self.gallery.match(np.stack(embeddings))
+
+    def top_matches(self, embedding, k=5):
+        """Return the k closest enrolled faces as (name, family, similarity)"""
+        return self.gallery.top_k(embedding, k)[0]
 
     def get_recognized_faces(self):
         """Return a list of recognized faces"""
         return list(self.recognized_faces)
 
-    def process_video(self, video_path, show_display=False):
-        """Process video for face detection and recognition"""
+    def process_video(self, video_path, show_display=False, output_path='face_recognition_output.mp4'):
+        """Process video for face detection and recognition; output_path=None skips writing a video
+
+        For long recordings, face_batch.process_video_parallel spreads the work over all cores.
+        """
         cap = cv2.VideoCapture(video_path)
         if not cap.isOpened():
             print("Error: Could not open video file")
@@ -92,9 +120,10 @@ class VideoFaceRecognition:
         fps = int(cap.get(cv2.CAP_PROP_FPS))
 
         # Create video writer
-        output_path = 'face_recognition_output.mp4'
-        fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-        out = cv2.VideoWriter(output_path, fourcc, fps, (frame_width, frame_height))
+        out = None
+        if output_path:
+            fourcc = cv2.VideoWriter_fourcc(*'mp4v')
+            out = cv2.VideoWriter(output_path, fourcc, fps, (frame_width, frame_height))
 
         frame_count = 0
         self.recognized_faces = set()  # Reset recognized faces
@@ -109,18 +138,16 @@ class VideoFaceRecognition:
                 
                 # Process every 5th frame to improve performance
                 if frame_count % 5 != 0:
-                    out.write(frame)
+                    if out is not None:
+                        out.write(frame)
                     continue
 
                 # Detect faces in frame
                 faces = self.face_app.get(frame)
+                matches = self.recognize_faces([face.embedding for face in faces])
                 
-                for face in faces:
+                for face, (name, family, similarity) in zip(faces, matches):
                     bbox = face.bbox.astype(int)
-                    embedding = face.embedding
-                    
-                    # Try to recognize the face
-                    name, family, similarity = self.recognize_face(embedding)
                     
                     # Draw bounding box
                     cv2.rectangle(frame, 
@@ -153,7 +180,8 @@ class VideoFaceRecognition:
                     print(f"Processed {frame_count} frames")
 
                 # Write the frame
-                out.write(frame)
+                if out is not None:
+                    out.write(frame)
 
                 # Display the frame if requested
                 if show_display:
@@ -170,7 +198,8 @@ class VideoFaceRecognition:
         finally:
             # Cleanup
             cap.release()
-            out.release()
+            if out is not None:
+                out.release()
             if show_display:
                 cv2.destroyAllWindows()
 
@@ -182,7 +211,8 @@ class VideoFaceRecognition:
                 print("Recognized individuals:")
                 for name in self.recognized_faces:
                     print(f"- {name}")
-            print(f"\nOutput saved to: {output_path}")
+            if output_path:
+                print(f"\nOutput saved to: {output_path}")
             return self.recognized_faces
 
 def main():
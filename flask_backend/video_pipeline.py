@@ -0,0 +1,558 @@
+import collections
+import logging
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from adaptive_control import AdaptiveStrideController
+from frame_ring import FrameRing
+
+logger = logging.getLogger(__name__)
+
+
+class DropOldestQueue:
+    """Bounded FIFO that discards its oldest item instead of blocking the producer"""
+
+    def __init__(self, maxsize=2, on_drop=None):
+        self.maxsize = maxsize
+        # Called with every item that is discarded without being consumed
+        self.on_drop = on_drop
+        self._items = collections.deque()
+        self._cond = threading.Condition()
+        self.dropped = 0
+
+    def put(self, item):
+        with self._cond:
+            if len(self._items) >= self.maxsize:
+                dropped = self._items.popleft()
+                self.dropped += 1
+                if self.on_drop:
+                    self.on_drop(dropped)
+            self._items.append(item)
+            self._cond.notify()
+
+    def get(self, timeout=None):
+        """Pop the oldest item, or return None if nothing arrives within timeout"""
+        with self._cond:
+            if not self._items:
+                self._cond.wait(timeout)
+            if not self._items:
+                return None
+            return self._items.popleft()
+
+    def qsize(self):
+        return len(self._items)
+
+    def clear(self):
+        with self._cond:
+            if self.on_drop:
+                for item in self._items:
+                    self.on_drop(item)
+            self._items.clear()
+
+
+def stream_variant(width=None, quality=None, overlay=True):
+    """Key for one output encoding; None means native width or the pipeline's JPEG quality.
+
+    ``overlay=False`` is for clients that draw the detection metadata themselves.
+    """
+    if width is not None:
+        width = max(16, int(width))
+    if quality is not None:
+        quality = min(100, max(10, int(quality)))
+    return (width, quality, bool(overlay))
+
+
+DEFAULT_VARIANT = stream_variant()
+
+
+class FrameBroadcaster:
+    """Latest-frame buffer that any number of viewers can read without blocking the producer.
+
+    Each published frame gets a sequence number. A viewer remembers the last
+    sequence it sent and asks for anything newer, so a slow client simply
+    skips the frames it missed instead of queueing them. Viewers register
+    the stream_variant they want, and each publish carries one encoding per
+    variant that currently has a viewer.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._frames = {}
+        self._seq = 0
+        self._closed = False
+        self._variants = collections.Counter()
+
+    def publish(self, frames):
+        """Publish {variant: jpeg bytes} as the newest frame"""
+        with self._cond:
+            self._frames = frames
+            self._seq += 1
+            self._cond.notify_all()
+
+    def wait_for_frame(self, last_seq, timeout=1.0, variant=DEFAULT_VARIANT):
+        """Return (seq, frame) newer than last_seq, or (last_seq, None) on timeout/close"""
+        with self._cond:
+            if self._seq <= last_seq and not self._closed:
+                self._cond.wait(timeout)
+            if self._seq <= last_seq:
+                return last_seq, None
+            # A viewer that just joined gets its variant from the next publish
+            return self._seq, self._frames.get(variant)
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    @property
+    def closed(self):
+        return self._closed
+
+    @property
+    def viewers(self):
+        return sum(self._variants.values())
+
+    def add_viewer(self, variant=DEFAULT_VARIANT):
+        with self._cond:
+            self._variants[variant] += 1
+
+    def remove_viewer(self, variant=DEFAULT_VARIANT):
+        with self._cond:
+            self._variants[variant] -= 1
+            if self._variants[variant] <= 0:
+                del self._variants[variant]
+
+    def variants(self):
+        """Variants that currently have at least one viewer"""
+        with self._cond:
+            return sorted(self._variants, key=lambda v: (v[0] or 0, v[1] or 0, v[2]))
+
+    def stats(self):
+        with self._cond:
+            return {"published": self._seq, "viewers": sum(self._variants.values()),
+                    "variants": len(self._variants)}
+
+
+class StageMetrics:
+    """Throughput and latency counters for one pipeline stage"""
+
+    def __init__(self, window=2.0):
+        self.window = window
+        self.processed = 0
+        self.total_time = 0.0
+        self.fps = 0.0
+        self._window_start = time.time()
+        self._window_count = 0
+        self._lock = threading.Lock()
+
+    def record(self, elapsed):
+        with self._lock:
+            self.processed += 1
+            self.total_time += elapsed
+            self._window_count += 1
+            now = time.time()
+            span = now - self._window_start
+            if span >= self.window:
+                self.fps = self._window_count / span
+                self._window_start = now
+                self._window_count = 0
+
+    def snapshot(self, queue=None):
+        with self._lock:
+            stats = {
+                "fps": round(self.fps, 2),
+                "processed": self.processed,
+                "avg_ms": round(1000 * self.total_time / self.processed, 2) if self.processed else 0
+            }
+        if queue is not None:
+            stats["queue_depth"] = queue.qsize()
+            stats["dropped"] = queue.dropped
+        return stats
+
+
+class FramePacket:
+    """A decoded frame travelling through the pipeline, held as a FrameRing slot"""
+    __slots__ = ("index", "ring", "slot", "captured_at", "analyzed")
+
+    def __init__(self, index, ring, slot, captured_at, analyzed=False):
+        self.index = index
+        self.ring = ring
+        self.slot = slot
+        self.captured_at = captured_at
+        # True when the same frame was also handed to the inference stage
+        self.analyzed = analyzed
+
+    @property
+    def frame(self):
+        return self.ring.frames[self.slot]
+
+    def release(self):
+        """Drop this stage's reference to the slot"""
+        self.ring.release(self.slot)
+
+
+class FramePipeline:
+    """Decoder, inference and encoder threads joined by drop-oldest queues.
+
+    The decoder reads the source at its native frame rate and feeds every
+    frame to the encoder, plus one frame per detection stride to the
+    inference worker. The stride is set by an AdaptiveStrideController from
+    measured inference/encode time and latency. The encoder draws the most recent annotations onto whatever frame
+    is current, so the viewer never waits for a detection to finish.
+
+    Frames are decoded into a FrameRing built by ``ring_factory`` and only
+    slot references travel between the stages. The encoder draws in place
+    on its slot, except when the inference stage still holds the same
+    frame; only then is it copied, into a reused scratch buffer.
+
+    The encoder does nothing while nobody is watching, encodes once per
+    distinct resolution/quality that viewers asked for, and skips frames
+    whose pixels (sampled every ``change_sample_step`` pixels), annotations
+    and FPS readout match the previous one; the last JPEGs are re-published
+    every ``republish_interval`` seconds so idle connections stay alive.
+    """
+
+    def __init__(self, source, analyze, render, on_open=None, target_fps=20,
+                 queue_size=2, jpeg_quality=95, max_consecutive_failures=3,
+                 controller=None, ring_factory=None, change_sample_step=8,
+                 republish_interval=1.0, on_error=None):
+        self.source = source
+        self.analyze = analyze
+        self.render = render
+        self.on_open = on_open
+        # Called with the error message when the source cannot be opened
+        self.on_error = on_error
+        self.target_fps = target_fps
+        self.jpeg_quality = jpeg_quality
+        self.max_consecutive_failures = max_consecutive_failures
+        self.controller = controller or AdaptiveStrideController()
+        self.ring_factory = ring_factory or FrameRing
+        self.ring = None
+        self._scratch = None
+        self.scratch_copies = 0
+        self.ring_skipped = 0
+        self.change_sample_step = change_sample_step
+        self.republish_interval = republish_interval
+        self.frames_reused = 0
+        self.frames_unwatched = 0
+        self._last_sample = None
+        self._last_key = None
+        self._last_frames = None
+        self._last_published = 0.0
+        self._resize_buffers = {}
+
+        self.inference_queue = DropOldestQueue(queue_size, on_drop=FramePacket.release)
+        self.encode_queue = DropOldestQueue(queue_size, on_drop=FramePacket.release)
+        self.broadcaster = FrameBroadcaster()
+
+        self.decode_metrics = StageMetrics()
+        self.inference_metrics = StageMetrics()
+        self.encode_metrics = StageMetrics()
+
+        self.source_fps = 0
+        self.frames_decoded = 0
+        self.error = None
+
+        self._annotations = None
+        # Bumped on every change of _annotations; part of the encoder's change key
+        self._annotations_version = 0
+        self._annotations_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._threads = []
+
+    def start(self):
+        for name, target in (("decoder", self._decode_loop),
+                             ("inference", self._inference_loop),
+                             ("encoder", self._encode_loop)):
+            thread = threading.Thread(target=target, name=f"pipeline-{name}", daemon=True)
+            self._threads.append(thread)
+            thread.start()
+
+    def stop(self, timeout=2.0):
+        self._stop_event.set()
+        self.broadcaster.close()
+        for thread in self._threads:
+            if thread is not threading.current_thread():
+                thread.join(timeout)
+        self._threads = []
+        self.inference_queue.clear()
+        self.encode_queue.clear()
+        if self.ring is not None:
+            self.ring.close()
+
+    def is_running(self):
+        return not self._stop_event.is_set()
+
+    @property
+    def frame_skip(self):
+        return self.controller.stride
+
+    @property
+    def latest_annotations(self):
+        with self._annotations_lock:
+            return self._annotations
+
+    def _set_annotations(self, annotations):
+        with self._annotations_lock:
+            self._annotations = annotations
+            self._annotations_version += 1
+
+    def _versioned_annotations(self):
+        with self._annotations_lock:
+            return self._annotations_version, self._annotations
+
+    def stats(self):
+        """Per-stage throughput and queue depth"""
+        return {
+            "source_fps": self.source_fps,
+            "frame_skip": self.frame_skip,
+            "decoder": self.decode_metrics.snapshot(),
+            "inference": self.inference_metrics.snapshot(self.inference_queue),
+            "encoder": dict(self.encode_metrics.snapshot(self.encode_queue),
+                            reused=self.frames_reused, unwatched=self.frames_unwatched),
+            "output": self.broadcaster.stats(),
+            "frames": self._frame_stats(),
+            "adaptive": self.controller.stats()
+        }
+
+    def _frame_stats(self):
+        stats = self.ring.stats() if self.ring is not None else {}
+        stats.update({"scratch_copies": self.scratch_copies, "skipped": self.ring_skipped})
+        return stats
+
+    def _ensure_ring(self, shape):
+        """Reuse the ring across reconnects unless the frame size changed"""
+        if self.ring is not None and self.ring.shape == tuple(shape):
+            return self.ring
+        previous = self.ring
+        self.ring = self.ring_factory(shape)
+        if previous is not None:
+            # Queued packets release into the old ring before its memory goes away
+            self.inference_queue.clear()
+            self.encode_queue.clear()
+            previous.close()
+        return self.ring
+
+    def _open_capture(self):
+        cap = cv2.VideoCapture(self.source)
+        if not cap.isOpened():
+            return None
+
+        frame_width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        frame_height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        self.source_fps = int(cap.get(cv2.CAP_PROP_FPS)) or 30
+        if frame_width > 0 and frame_height > 0:
+            self._ensure_ring((frame_height, frame_width, 3))
+        # Start from the fixed target rate; the controller adapts from there
+        self.controller.reset(self.source_fps, max(1, int(self.source_fps / self.target_fps)))
+        logger.info(f"Video opened: {self.source}, {frame_width}x{frame_height} @ {self.source_fps}fps")
+
+        self._set_annotations(None)
+        if self.on_open:
+            self.on_open(frame_width, frame_height, self.source_fps)
+        return cap
+
+    def _decode_loop(self):
+        while not self._stop_event.is_set():
+            cap = self._open_capture()
+            if cap is None:
+                self.error = f"Error opening video file: {self.source}"
+                logger.error(self.error)
+                self._stop_event.set()
+                self.broadcaster.close()
+                if self.on_error:
+                    self.on_error(self.error)
+                break
+
+            consecutive_failures = 0
+            since_detection = 0
+            frame_interval = 1.0 / self.source_fps
+            next_deadline = time.time()
+            try:
+                while not self._stop_event.is_set():
+                    started = time.time()
+                    analyzed = since_detection + 1 >= self.controller.stride
+                    success, ring, slot = self._read_frame(cap, 2 if analyzed else 1)
+                    if not success:
+                        consecutive_failures += 1
+                        logger.warning(f"Frame read failed. Consecutive failures: {consecutive_failures}")
+                        if consecutive_failures >= self.max_consecutive_failures:
+                            if "youtube" in str(self.source).lower():
+                                logger.info("YouTube stream failed, attempting to reconnect...")
+                                time.sleep(2)
+                            break
+                        continue
+
+                    consecutive_failures = 0
+                    if slot is not None:
+                        self.frames_decoded += 1
+                        since_detection = 0 if analyzed else since_detection + 1
+                        packet = FramePacket(self.frames_decoded, ring, slot, started, analyzed)
+                        if analyzed:
+                            self.inference_queue.put(packet)
+                        self.encode_queue.put(packet)
+                        self.decode_metrics.record(time.time() - started)
+
+                    # Hold the source frame rate so files play back in real time
+                    next_deadline += frame_interval
+                    delay = next_deadline - time.time()
+                    if delay > 0:
+                        self._stop_event.wait(delay)
+                    else:
+                        next_deadline = time.time()
+            finally:
+                cap.release()
+
+    def _read_frame(self, cap, holders):
+        """Decode the next frame into a ring slot; returns (success, ring, slot), slot None if skipped"""
+        ring = self.ring
+        slot = ring.acquire(holders) if ring is not None else None
+        if ring is not None and slot is None:
+            # Every slot is still held downstream: consume the frame without decoding it
+            success = cap.grab()
+            if success:
+                self.ring_skipped += 1
+            return success, ring, None
+
+        target = ring.frames[slot] if slot is not None else None
+        success, frame = cap.read(target) if target is not None else cap.read()
+        if not success:
+            if slot is not None:
+                ring.discard(slot)
+            return False, ring, None
+        if frame is target:
+            return True, ring, slot
+
+        # The capture allocated its own frame: the source did not report its size, or changed it
+        if slot is not None:
+            ring.discard(slot)
+        ring = self._ensure_ring(frame.shape)
+        slot = ring.acquire(holders)
+        if slot is None:
+            self.ring_skipped += 1
+            return True, ring, None
+        np.copyto(ring.frames[slot], frame)
+        return True, ring, slot
+
+    def _inference_loop(self):
+        while not self._stop_event.is_set():
+            packet = self.inference_queue.get(timeout=0.5)
+            if packet is None:
+                continue
+            started = time.time()
+            try:
+                annotations = self.analyze(packet.frame)
+            except Exception as e:
+                logger.error(f"Error processing frame: {e}")
+                continue
+            finally:
+                packet.release()
+            self._set_annotations(annotations)
+            if not annotations.detected:
+                # The motion gate skipped the detector; its ~1 ms would pull the controller's latency
+                # estimate, and with it stride and input size, down to their minimums
+                continue
+            finished = time.time()
+            self.inference_metrics.record(finished - started)
+            self.controller.observe_detection(finished - started, finished - packet.captured_at)
+
+    def _encode_loop(self):
+        while not self._stop_event.is_set():
+            packet = self.encode_queue.get(timeout=0.5)
+            if packet is None:
+                continue
+            started = time.time()
+            try:
+                variants = self.broadcaster.variants()
+                if not variants:
+                    self.frames_unwatched += 1
+                    continue
+                frame = packet.frame
+                annotations_version, annotations = self._versioned_annotations()
+                fps = round(self.inference_metrics.fps, 1)
+                if self._unchanged(frame, (annotations_version, fps, tuple(variants))):
+                    self.frames_reused += 1
+                    if started - self._last_published >= self.republish_interval:
+                        self.broadcaster.publish(self._last_frames)
+                        self._last_published = started
+                    continue
+                # Plain variants are encoded before the overlay is drawn in place
+                frames = self._encode_variants(frame, [v for v in variants if not v[2]])
+                overlaid = [v for v in variants if v[2]]
+                if overlaid:
+                    if annotations is not None:
+                        if packet.analyzed and packet.ring.holders(packet.slot) > 1:
+                            # The inference thread is still reading this slot
+                            frame = self._scratch_copy(frame)
+                        self.render(frame, annotations, fps)
+                    frames.update(self._encode_variants(frame, overlaid))
+                if not frames:
+                    continue
+            except Exception as e:
+                logger.error(f"Error encoding frame: {e}")
+                continue
+            finally:
+                packet.release()
+            self.broadcaster.publish(frames)
+            self._last_frames = frames
+            self._last_published = started
+            elapsed = time.time() - started
+            self.encode_metrics.record(elapsed)
+            self.controller.observe_encode(elapsed)
+
+    def _unchanged(self, frame, key):
+        """True if the frame samples and the overlay inputs match the last encoded frame"""
+        if not self.change_sample_step:
+            return False
+        step = self.change_sample_step
+        sample = frame[::step, ::step]
+        same = (self._last_frames is not None and key == self._last_key
+                and self._last_sample is not None and self._last_sample.shape == sample.shape
+                and np.array_equal(sample, self._last_sample))
+        if not same:
+            if self._last_sample is None or self._last_sample.shape != sample.shape:
+                self._last_sample = np.empty_like(sample)
+            np.copyto(self._last_sample, sample)
+            self._last_key = key
+        return same
+
+    def _encode_variants(self, frame, variants):
+        """One JPEG per distinct (size, quality); variants resolving to the same output share it"""
+        height, width = frame.shape[:2]
+        encoded = {}
+        frames = {}
+        for variant in variants:
+            target_width, quality, _ = variant
+            quality = quality or self.jpeg_quality
+            size = None
+            if target_width is not None and target_width < width:
+                size = (target_width, max(1, round(height * target_width / width)))
+            params = (size, quality)
+            if params not in encoded:
+                image = frame if size is None else self._resized(frame, size)
+                ret, buffer = cv2.imencode('.jpg', image, [int(cv2.IMWRITE_JPEG_QUALITY), quality])
+                if not ret:
+                    continue
+                encoded[params] = buffer.tobytes()
+            frames[variant] = encoded[params]
+        return frames
+
+    def _resized(self, frame, size):
+        buffer = self._resize_buffers.get(size)
+        if buffer is None:
+            if len(self._resize_buffers) >= 8:
+                # Viewers pick their own widths; keep only recently requested sizes
+                self._resize_buffers.clear()
+            buffer = self._resize_buffers[size] = np.empty((size[1], size[0], 3), dtype=frame.dtype)
+        cv2.resize(frame, size, dst=buffer, interpolation=cv2.INTER_AREA)
+        return buffer
+
+    def _scratch_copy(self, frame):
+        if self._scratch is None or self._scratch.shape != frame.shape:
+            self._scratch = np.empty_like(frame)
+        np.copyto(self._scratch, frame)
+        self.scratch_copies += 1
+        return self._scratch
@@ -0,0 +1,117 @@
+import json
+import os
+
+import cv2
+import numpy as np
+
+from dwell_tracker import DwellTracker
+
+# One bit per zone in the lookup mask
+MAX_ZONES = 32
+
+
+class Zone:
+    """A named polygon in normalised (0-1) frame coordinates"""
+    __slots__ = ("name", "points")
+
+    def __init__(self, name, points):
+        points = np.asarray(points, dtype=np.float32)
+        if points.ndim != 2 or points.shape[1] != 2 or len(points) < 3:
+            raise ValueError(f"Zone {name!r} needs at least three (x, y) points")
+        self.name = name
+        self.points = points
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["name"], data["points"])
+
+
+def load_zones(config):
+    """Parse zones from a list of {"name", "points"} dicts or a JSON file path"""
+    if not config:
+        return []
+    if isinstance(config, str):
+        with open(config) as f:
+            config = json.load(f)
+    zones = [zone if isinstance(zone, Zone) else Zone.from_dict(zone) for zone in config]
+    if len(zones) > MAX_ZONES:
+        raise ValueError(f"At most {MAX_ZONES} zones are supported")
+    return zones
+
+
+def default_zones():
+    """Zones configured through COUNTING_ZONES (path to a JSON file), if any"""
+    path = os.environ.get("COUNTING_ZONES")
+    return load_zones(path) if path else []
+
+
+class ZoneMap:
+    """Per-zone occupancy and dwell for a set of polygon zones.
+
+    The polygons are rasterised once per frame size into an integer mask
+    with one bit per zone, so membership for every detection is a single
+    fancy index into the mask and a bit test, however many people or zones
+    there are. Zones may overlap. Each zone keeps its own DwellTracker.
+    """
+
+    def __init__(self, zones, stale_track_timeout=10.0):
+        self.zones = list(zones)
+        self.trackers = [DwellTracker(stale_track_timeout) for _ in self.zones]
+        self.counts = [0] * len(self.zones)
+        self.mask = None
+        self.polygons = []
+        # Smallest mask dtype with a bit for every zone
+        self._dtype = np.uint8 if len(self.zones) <= 8 else np.uint16 if len(self.zones) <= 16 else np.uint32
+        self._bits = np.left_shift(self._dtype(1), np.arange(len(self.zones), dtype=self._dtype))
+
+    def __len__(self):
+        return len(self.zones)
+
+    def reset(self):
+        self.mask = None
+        self.polygons = []
+        self.counts = [0] * len(self.zones)
+        for tracker in self.trackers:
+            tracker.reset()
+
+    def build(self, frame_width, frame_height):
+        """Rasterise the zones for a frame size"""
+        self.mask = np.zeros((frame_height, frame_width), dtype=self._dtype)
+        self.polygons = []
+        layer = np.zeros((frame_height, frame_width), dtype=np.uint8)
+        scale = np.array([frame_width - 1, frame_height - 1], dtype=np.float32)
+        for i, zone in enumerate(self.zones):
+            polygon = np.round(zone.points * scale).astype(np.int32)
+            self.polygons.append(polygon)
+            layer.fill(0)
+            cv2.fillPoly(layer, [polygon], 1)
+            self.mask[layer.astype(bool)] |= self._bits[i]
+
+    def membership(self, centroids):
+        """Boolean (n, zones) array: which zones each (x, y) centroid falls in"""
+        if len(centroids) == 0:
+            return np.zeros((0, len(self.zones)), dtype=bool)
+        height, width = self.mask.shape
+        xs = np.clip(centroids[:, 0], 0, width - 1)
+        ys = np.clip(centroids[:, 1], 0, height - 1)
+        return (self.mask[ys, xs][:, None] & self._bits) != 0
+
+    def update(self, track_ids, centroids, now):
+        """Update per-zone counts and dwell for one detection step"""
+        inside = self.membership(centroids)
+        for i, tracker in enumerate(self.trackers):
+            in_zone = inside[:, i]
+            self.counts[i] = int(in_zone.sum())
+            tracker.update(track_ids[in_zone].tolist(), track_ids[~in_zone].tolist(), now)
+
+    def stats(self, now):
+        """Per-zone people count and dwell times"""
+        result = {}
+        for zone, tracker, count in zip(self.zones, self.trackers, self.counts):
+            avg_dwell_time, highest_dwell_time = tracker.dwell_times(now)
+            result[zone.name] = {
+                "people_count": count,
+                "avg_dwell_time": 0 if count == 0 else round(avg_dwell_time, 2),
+                "highest_dwell_time": round(highest_dwell_time, 2)
+            }
+        return result